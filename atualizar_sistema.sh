@@ -79,6 +79,10 @@ pip install -r requirements.txt
 log "🗄️ Aplicando migrações..."
 python manage.py migrate
 
+# Recalcula custos e a composição das receitas e fichas (idempotente)
+log "🧮 Recalculando custos..."
+python manage.py recalcular_custos
+
 # 5. Coletar arquivos estáticos
 log "📁 Coletando arquivos estáticos..."
 python manage.py collectstatic --noinput
@@ -50,13 +50,23 @@ export default function InsumoDetalhe() {
         setErro("Erro ao carregar insumo");
         setLoading(false);
       });
-    // Buscar histórico real de preço
-    fetch(`/api/insumos/${insumoId}/historico_preco/`, { headers })
+  }, [insumoId]);
+
+  // Buscar histórico real de preço só do período, agrupado no servidor nos períodos longos
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    const headers = token ? { Authorization: 'Bearer ' + token } : {};
+    const params = new URLSearchParams();
+    const dias = periodos.find(p => p.key === periodo)?.dias;
+    if (dias) params.set('inicio', dayjs().subtract(dias - 1, 'day').format('YYYY-MM-DD'));
+    const agrupar = { '1M': 'dia', '1Y': 'semana', '5Y': 'mes', 'Max': 'mes' }[periodo];
+    if (agrupar) params.set('agrupar', agrupar);
+    fetch(`/api/insumos/${insumoId}/historico_preco/?${params}`, { headers })
       .then(res => res.json())
       .then(data => {
-        setHistorico(data);
+        setHistorico(Array.isArray(data) ? data : []);
       });
-  }, [insumoId]);
+  }, [insumoId, periodo]);
 
   const handleExcluir = async () => {
     if (!confirm('Tem certeza que deseja excluir este insumo?')) return;
@@ -83,14 +93,10 @@ export default function InsumoDetalhe() {
     }
   };
 
-  // Filtrar histórico conforme o período
+  // O servidor já devolve só o período pedido (parâmetro inicio), com cada
+  // agrupamento datado no início do seu intervalo
   const hoje = dayjs();
-  let historicoFiltrado = historico.filter(h => {
-    if (periodo === 'Max') return true;
-    const dias = periodos.find(p => p.key === periodo)?.dias;
-    if (!dias) return true;
-    return dayjs(h.data).isAfter(hoje.subtract(dias-1, 'day').endOf('day'));
-  });
+  let historicoFiltrado = historico;
 
   // Se não houver pontos no período, mostrar o preço atual com a data de hoje
   if (historicoFiltrado.length === 0 && insumo) {
@@ -5,6 +5,9 @@ import { useNavigate } from "react-router-dom";
 export default function RegistrosAtividade() {
   const [registros, setRegistros] = useState([]);
   const [loading, setLoading] = useState(true);
+  // A API devolve os registros em páginas; next é a URL da página seguinte
+  const [proximaPagina, setProximaPagina] = useState(null);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [filtros, setFiltros] = useState({
     tipo: "",
     acao: "",
@@ -37,7 +40,8 @@ export default function RegistrosAtividade() {
       
       const response = await fetch(url, { headers });
       const data = await response.json();
-      setRegistros(data);
+      setRegistros(data.results || []);
+      setProximaPagina(data.next || null);
     } catch (error) {
       console.error('Erro ao carregar registros:', error);
     } finally {
@@ -45,6 +49,23 @@ export default function RegistrosAtividade() {
     }
   };
 
+  const carregarMais = async () => {
+    if (!proximaPagina) return;
+    setCarregandoMais(true);
+    try {
+      const token = localStorage.getItem('token');
+      const headers = { Authorization: 'Bearer ' + token };
+      const response = await fetch(proximaPagina, { headers });
+      const data = await response.json();
+      setRegistros(anteriores => [...anteriores, ...(data.results || [])]);
+      setProximaPagina(data.next || null);
+    } catch (error) {
+      console.error('Erro ao carregar registros:', error);
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
   const getIconeTipo = (tipo) => {
     switch (tipo) {
       case 'restaurante': return <Building size={16} />;
@@ -228,6 +249,17 @@ export default function RegistrosAtividade() {
                   </div>
                 ))
               )}
+              {proximaPagina && (
+                <div className="text-center">
+                  <button
+                    onClick={carregarMais}
+                    disabled={carregandoMais}
+                    className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 transition disabled:opacity-50"
+                  >
+                    {carregandoMais ? 'Carregando...' : 'Carregar mais'}
+                  </button>
+                </div>
+              )}
             </div>
           )}
         </div>
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -50,10 +51,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'restaurantes.middleware.CompressaoMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'restaurantes.middleware.RegistroAtividadeMiddleware',
+    'restaurantes.middleware.CacheCatalogoMiddleware',
+    'restaurantes.middleware.RecalculoCustosMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,9 +91,39 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Cada requisição é uma transação: registros de atividade e recálculos
+        # de custo agendados com on_commit são gravados uma única vez no final
+        'ATOMIC_REQUESTS': True,
     }
 }
 
+# Cache das respostas de receitas e fichas (restaurantes.cache_catalogo).
+# Memória local por padrão; com REDIS_URL definido (ex.: redis://127.0.0.1:6379/1)
+# o cache é compartilhado entre os processos do servidor (requer o pacote redis).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'fichapro',
+            'OPTIONS': {'MAX_ENTRIES': 2000},
+        }
+    }
+
+# Segundos que uma resposta de receitas/fichas fica no cache (alterações a invalidam antes)
+CACHE_CATALOGO_TIMEOUT = 600
+
+# Retenção do registro de atividades (comando arquivar_registros_atividade): meses
+# mantidos no banco e pasta dos arquivos JSONL comprimidos com os meses anteriores
+RETENCAO_REGISTROS_MESES = 12
+ARQUIVO_REGISTROS_DIR = BASE_DIR / 'arquivo' / 'registros_atividade'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -173,8 +208,20 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'restaurantes.paginacao.CursorPaginacao',
+    # JSON com orjson (cai no renderizador padrão do DRF se o pacote não estiver instalado)
+    'DEFAULT_RENDERER_CLASSES': (
+        'restaurantes.renderizadores.JSONRapidoRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Respostas a partir deste tamanho (bytes) saem comprimidas; brotli exige o pacote Brotli
+COMPRESSAO_TAMANHO_MINIMO = 1024
+
+# Níveis máximos de receitas dentro de receitas (receita → sub-receita → ...)
+PROFUNDIDADE_MAXIMA_SUBRECEITAS = 8
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
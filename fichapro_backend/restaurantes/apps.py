@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RestaurantesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'restaurantes'
+
+    def ready(self):
+        from . import permissoes  # noqa: F401  registra a invalidação do cache de perfis
@@ -0,0 +1,69 @@
+"""Gravação do registro de atividades em lote.
+
+Os eventos são capturados já com o usuário da requisição atual e acumulados em
+memória; só entram no buffer depois que a transação que os gerou é confirmada
+(eventos de transações desfeitas são descartados) e são gravados com um único
+bulk_create ao final da requisição ou do bloco coletar_atividades(), que também
+soma as ações de cada usuário em ResumoUsuario.
+"""
+
+import logging
+from contextvars import ContextVar
+
+from django.db import DatabaseError, transaction
+
+from .coleta import ColetorPosCommit
+
+logger = logging.getLogger(__name__)
+
+_requisicao_atual = ContextVar('requisicao_atual', default=None)
+
+
+def usuario_atual():
+    """Usuário autenticado da requisição em andamento, se houver"""
+    request = _requisicao_atual.get()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    return None
+
+
+def _gravar(eventos):
+    from .models import RegistroAtividade, Restaurante
+    from .resumos import contabilizar_atividades
+    try:
+        restaurante_ids = {evento.restaurante_id for evento in eventos if evento.restaurante_id}
+        if restaurante_ids:
+            # Eventos de um restaurante excluído (e dos itens dele) ficam sem restaurante
+            existentes = set(Restaurante.objects.filter(id__in=restaurante_ids).values_list('id', flat=True))
+            for evento in eventos:
+                if evento.restaurante_id not in existentes:
+                    evento.restaurante_id = None
+        with transaction.atomic():
+            RegistroAtividade.objects.bulk_create(eventos, batch_size=500)
+            contabilizar_atividades(eventos)
+    except DatabaseError:
+        # O registro de atividades não deve derrubar a requisição já confirmada
+        logger.exception("Erro ao gravar %d registros de atividade", len(eventos))
+
+
+_coletor = ColetorPosCommit(_gravar)
+
+# Agenda a gravação de um RegistroAtividade para depois do commit
+enfileirar = _coletor.adicionar
+
+# Acumula os eventos registrados no bloco e grava todos de uma vez ao final
+coletar_atividades = _coletor.coletar
+
+
+class RequisicaoAtual:
+    """Define a requisição em andamento para os eventos registrados durante ela"""
+
+    def __init__(self, request):
+        self.request = request
+
+    def __enter__(self):
+        self._token = _requisicao_atual.set(self.request)
+
+    def __exit__(self, *exc_info):
+        _requisicao_atual.reset(self._token)
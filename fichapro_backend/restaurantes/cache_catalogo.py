@@ -0,0 +1,225 @@
+"""Cache das respostas de leitura e GETs condicionais da API.
+
+As respostas serializadas de receitas e fichas técnicas (detalhe e listagem)
+ficam no cache do Django
+(CACHES['default']: memória local por padrão, Redis quando configurado).
+A chave inclui a versão do catálogo de cada restaurante envolvido (VersaoCatalogo)
+e a classe de perfil do usuário em cada um, porque só administradores e
+masters veem custos. Uma alteração incrementa a versão dos restaurantes
+afetados, percorrendo o grafo de dependências (um insumo altera todas as
+receitas e fichas que o usam, inclusive por sub-receitas), e as respostas
+antigas deixam de ser alcançadas sem que nada precise ser apagado; isso vale
+também para caches locais de vários processos.
+
+A mesma chave serve de ETag e a data da última alteração de Last-Modified, de
+modo que clientes com a resposta atual recebem 304 sem corpo. Os demais
+viewsets usam as mesmas versões só para o 304 (RespostaCondicionalMixin).
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+
+from .coleta import ColetorPosCommit
+from .models import FichaTecnica, Receita, Restaurante, VersaoCatalogo
+from .permissoes import is_admin, perfis_do_usuario, restaurantes_acessiveis
+
+
+def _cache():
+    return caches[getattr(settings, 'CACHE_CATALOGO', 'default')]
+
+
+def versoes(restaurante_ids):
+    """{restaurante_id: (versao, alterado_em)}; restaurantes sem alterações registradas ficam com versão 0"""
+    encontradas = {
+        restaurante_id: (versao, alterado_em)
+        for restaurante_id, versao, alterado_em in VersaoCatalogo.objects.filter(
+            restaurante_id__in=restaurante_ids
+        ).values_list('restaurante_id', 'versao', 'alterado_em')
+    }
+    return {restaurante_id: encontradas.get(restaurante_id, (0, None)) for restaurante_id in restaurante_ids}
+
+
+def invalidar_catalogo(restaurante_ids):
+    """Incrementa a versão do catálogo dos restaurantes; respostas em cache deixam de valer"""
+    restaurante_ids = set(restaurante_ids)
+    if not restaurante_ids:
+        return
+    agora = timezone.now()
+    VersaoCatalogo.objects.filter(restaurante_id__in=restaurante_ids).update(versao=F('versao') + 1, alterado_em=agora)
+    novos = restaurante_ids - set(
+        VersaoCatalogo.objects.filter(restaurante_id__in=restaurante_ids).values_list('restaurante_id', flat=True)
+    )
+    if novos:
+        # Restaurantes excluídos na mesma transação não recebem versão
+        existentes = Restaurante.objects.filter(id__in=novos).values_list('id', flat=True)
+        VersaoCatalogo.objects.bulk_create(
+            [VersaoCatalogo(restaurante_id=restaurante_id, versao=1, alterado_em=agora) for restaurante_id in existentes],
+            ignore_conflicts=True,
+        )
+
+
+def _processar(pedidos):
+    from .dependencias import dependentes
+    restaurantes, insumos, receitas, fichas = set(), set(), set(), set()
+    for restaurante_ids, insumo_ids, receita_ids, ficha_ids in pedidos:
+        restaurantes.update(restaurante_ids)
+        insumos.update(insumo_ids)
+        receitas.update(receita_ids)
+        fichas.update(ficha_ids)
+    if insumos or receitas:
+        afetadas, fichas_afetadas = dependentes(insumo_ids=insumos, receita_ids=receitas)
+        receitas.update(afetadas)
+        fichas.update(fichas_afetadas)
+    if receitas:
+        restaurantes.update(Receita.objects.filter(id__in=receitas).values_list('restaurante_id', flat=True).distinct())
+    if fichas:
+        restaurantes.update(FichaTecnica.objects.filter(id__in=fichas).values_list('restaurante_id', flat=True).distinct())
+    invalidar_catalogo(restaurantes)
+
+
+_coletor = ColetorPosCommit(_processar)
+
+# Une as invalidações agendadas no bloco em uma única passagem ao final
+coletar_invalidacoes = _coletor.coletar
+
+
+def agendar_invalidacao(restaurante_ids=(), insumo_ids=(), receita_ids=(), ficha_ids=()):
+    """Agenda para depois do commit a invalidação dos restaurantes e de tudo o que depende dos nós informados"""
+    _coletor.adicionar((tuple(restaurante_ids), tuple(insumo_ids), tuple(receita_ids), tuple(ficha_ids)))
+
+
+def _etag_do_conteudo(dados):
+    conteudo = json.dumps(dados, sort_keys=True, default=str)
+    return quote_etag(hashlib.sha1(conteudo.encode()).hexdigest())
+
+
+class RespostaCondicionalMixin:
+    """ETag e Last-Modified em list/retrieve, com 304 antes de qualquer consulta ao queryset ou serialização.
+
+    Por padrão o estado da resposta é a versão do catálogo de cada restaurante
+    cujos dados ela contém:
+    - campo_restaurante: caminho do objeto até o restaurante, usado no detalhe;
+    - parametro_restaurante: parâmetro com que get_queryset filtra um
+      restaurante (None quando não há);
+    - escopo_por_acesso: get_queryset limita a listagem aos restaurantes
+      acessíveis ao usuário; quando False, a listagem depende de todos.
+    Viewsets cujo conteúdo não depende do catálogo sobrescrevem
+    estado_da_resposta; se ele devolver None, o ETag é calculado sobre o
+    conteúdo, o que economiza a transferência mas não o trabalho.
+    """
+    campo_restaurante = 'restaurante_id'
+    parametro_restaurante = 'restaurante'
+    escopo_por_acesso = True
+    # Guarda também a resposta montada no cache (ver CacheCatalogoMixin)
+    guardar_resposta = False
+    cache_timeout = None
+
+    def _restaurantes_do_escopo(self, request, pk=None):
+        """Restaurantes cujos dados compõem a resposta, ou None quando não é possível saber sem montá-la"""
+        if pk is not None:
+            try:
+                restaurante_id = self.get_queryset().prefetch_related(None).filter(pk=pk).values_list(
+                    self.campo_restaurante, flat=True
+                ).first()
+            except (TypeError, ValueError):
+                return None
+            return None if restaurante_id is None else [restaurante_id]
+        user = request.user
+        acessiveis = None if is_admin(user) or not self.escopo_por_acesso else set(restaurantes_acessiveis(user))
+        filtro = request.query_params.get(self.parametro_restaurante) if self.parametro_restaurante else None
+        if filtro:
+            try:
+                filtro = int(filtro)
+            except ValueError:
+                return None
+            return [filtro] if acessiveis is None or filtro in acessiveis else []
+        if acessiveis is None:
+            return list(Restaurante.objects.order_by('id').values_list('id', flat=True))
+        return sorted(acessiveis)
+
+    def estado_da_resposta(self, request, pk):
+        """(estado que identifica o conteúdo, data da última alteração), ou None se desconhecido"""
+        restaurante_ids = self._restaurantes_do_escopo(request, pk)
+        if restaurante_ids is None:
+            return None
+        user = request.user
+        perfis = perfis_do_usuario(user)
+        admin = is_admin(user)
+        estado = []
+        ultima = None
+        for restaurante_id, (versao, alterado_em) in sorted(versoes(restaurante_ids).items()):
+            custos = admin or perfis.get(restaurante_id) == 'master'
+            estado.append((restaurante_id, versao, alterado_em.timestamp() if alterado_em else 0, custos))
+            if alterado_em and (ultima is None or alterado_em > ultima):
+                ultima = alterado_em
+        return estado, ultima
+
+    def _assinatura(self, request, pk, estado):
+        parametros = sorted(request.query_params.lists())
+        # Endereço do servidor entra na chave por causa das URLs absolutas de imagens
+        origem = (request.scheme, request.get_host())
+        assinatura = repr((self.basename, self.action, pk, origem, parametros, estado))
+        return hashlib.sha1(assinatura.encode()).hexdigest()
+
+    def _nao_modificado(self, request, etag, ultima):
+        correspondencias = request.headers.get('If-None-Match')
+        if correspondencias is not None:
+            return correspondencias.strip() == '*' or etag in [
+                valor.strip().removeprefix('W/') for valor in correspondencias.split(',')
+            ]
+        desde = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return ultima is not None and desde is not None and int(ultima.timestamp()) <= desde
+
+    def _responder(self, request, pk, montar):
+        if request.query_params.get('recalcular') in ('1', 'true'):
+            return montar()
+        # Respostas dependem do usuário: só o próprio cliente guarda, sempre revalidando
+        cabecalhos = {'Cache-Control': 'private, no-cache', 'Vary': 'Authorization'}
+        conhecido = self.estado_da_resposta(request, pk)
+        if conhecido is None:
+            resposta = montar()
+            if resposta.status_code == 200:
+                cabecalhos['ETag'] = _etag_do_conteudo(resposta.data)
+                if self._nao_modificado(request, cabecalhos['ETag'], None):
+                    return Response(status=304, headers=cabecalhos)
+                for nome, valor in cabecalhos.items():
+                    resposta[nome] = valor
+            return resposta
+        estado, ultima = conhecido
+        resumo = self._assinatura(request, pk, estado)
+        cabecalhos['ETag'] = quote_etag(resumo)
+        if ultima is not None:
+            cabecalhos['Last-Modified'] = http_date(ultima.timestamp())
+        if self._nao_modificado(request, cabecalhos['ETag'], ultima):
+            return Response(status=304, headers=cabecalhos)
+        chave = f'catalogo:{resumo}'
+        dados = _cache().get(chave) if self.guardar_resposta else None
+        if dados is None:
+            resposta = montar()
+            if resposta.status_code != 200:
+                return resposta
+            dados = resposta.data
+            if self.guardar_resposta:
+                _cache().set(chave, dados, self.cache_timeout or getattr(settings, 'CACHE_CATALOGO_TIMEOUT', 600))
+        return Response(dados, headers=cabecalhos)
+
+    def list(self, request, *args, **kwargs):
+        return self._responder(request, None, lambda: super(RespostaCondicionalMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        return self._responder(
+            request, pk, lambda: super(RespostaCondicionalMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+
+class CacheCatalogoMixin(RespostaCondicionalMixin):
+    """Além do 304, serve list/retrieve do cache; com ?recalcular=1 a resposta é sempre montada de novo"""
+    guardar_resposta = True
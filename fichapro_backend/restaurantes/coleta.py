@@ -0,0 +1,49 @@
+"""Acúmulo de trabalho confirmado por transação para processamento em lote."""
+
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import transaction
+
+
+class ColetorPosCommit:
+    """Acumula itens só depois do commit da transação que os gerou e os processa juntos.
+
+    Dentro de um bloco coletar() os itens confirmados vão para um buffer que é
+    processado uma única vez no fim do bloco; itens de transações desfeitas
+    nunca chegam ao buffer. Fora de um bloco, cada item é processado logo após
+    o commit.
+    """
+
+    def __init__(self, processar):
+        self.processar = processar
+        self._estado = threading.local()
+
+    def adicionar(self, item):
+        buffer = getattr(self._estado, 'buffer', None)
+        if buffer is None:
+            transaction.on_commit(partial(self.processar, [item]))
+        else:
+            transaction.on_commit(partial(buffer.append, item))
+
+    @contextmanager
+    def coletar(self):
+        if getattr(self._estado, 'buffer', None) is not None:
+            # Já existe um bloco externo responsável pelo processamento
+            yield
+            return
+        self._estado.buffer = buffer = []
+        try:
+            yield
+        finally:
+            self._estado.buffer = None
+            if transaction.get_connection().in_atomic_block:
+                # Os itens só entram no buffer no commit da transação externa
+                transaction.on_commit(partial(self._processar_buffer, buffer))
+            else:
+                self._processar_buffer(buffer)
+
+    def _processar_buffer(self, buffer):
+        if buffer:
+            self.processar(buffer)
@@ -0,0 +1,117 @@
+"""Consultas sobre a composição de receitas e fichas técnicas.
+
+Leem a tabela ComposicaoInsumo, que o recálculo de custos mantém com o
+fechamento transitivo da composição (cada receita ou ficha com todos os seus
+insumos, inclusive os que vêm por sub-receitas, e a quantidade bruta já
+corrigida por IC/IPC). Cada consulta é uma única leitura indexada, sem
+percorrer ReceitaInsumo e FichaTecnicaItem recursivamente.
+"""
+
+from django.db.models import Case, F, FloatField, Sum, Value, When
+
+from .historico import precos_em
+from .models import ComposicaoInsumo
+
+
+def _custo(preco, peso, quantidade):
+    if not preco or not peso:
+        return 0
+    return round(float(preco) / float(peso) * quantidade, 2)
+
+
+def usos_do_insumo(insumo_id):
+    """Receitas e fichas que usam o insumo, diretamente ou por sub-receitas"""
+    usos = ComposicaoInsumo.objects.filter(insumo_id=insumo_id).values_list(
+        'receita_id', 'receita__nome', 'ficha_id', 'ficha__nome', 'quantidade', 'profundidade'
+    )
+    resultado = {'receitas': [], 'fichas': []}
+    for receita_id, receita_nome, ficha_id, ficha_nome, quantidade, profundidade in usos:
+        chave, dono_id, nome = ('fichas', ficha_id, ficha_nome) if ficha_id else ('receitas', receita_id, receita_nome)
+        resultado[chave].append({
+            'id': dono_id,
+            'nome': nome,
+            'quantidade': round(quantidade, 3),
+            'direto': profundidade == 0,
+            'profundidade': profundidade,
+        })
+    for lista in resultado.values():
+        lista.sort(key=lambda uso: uso['nome'].lower())
+    return resultado
+
+
+def explosao_ficha(ficha_id, mostrar_custo=False):
+    """Insumos brutos de uma ficha inteira, com sub-receitas expandidas e IC/IPC aplicados"""
+    linhas = ComposicaoInsumo.objects.filter(ficha_id=ficha_id).order_by('insumo__nome').values_list(
+        'insumo_id', 'insumo__nome', 'insumo__unidade_medida', 'insumo__preco', 'insumo__peso', 'quantidade', 'profundidade'
+    )
+    insumos = []
+    for insumo_id, nome, unidade_medida, preco, peso, quantidade, profundidade in linhas:
+        item = {
+            'insumo': insumo_id,
+            'nome': nome,
+            'unidade_medida': unidade_medida,
+            'quantidade': round(quantidade, 3),
+            'direto': profundidade == 0,
+        }
+        if mostrar_custo:
+            item['custo'] = _custo(preco, peso, quantidade)
+        insumos.append(item)
+    return insumos
+
+
+def explosao_lote(quantidades, mostrar_custo=False):
+    """Necessidade total de cada insumo bruto para produzir várias fichas.
+
+    quantidades é {ficha_id: vezes que a ficha inteira será produzida}. A soma
+    ponderada é feita pelo banco em uma única agregação sobre a composição.
+    """
+    if not quantidades:
+        return []
+    peso_da_ficha = Case(
+        *[When(ficha_id=ficha_id, then=Value(float(quantidade))) for ficha_id, quantidade in quantidades.items()],
+        output_field=FloatField(),
+    )
+    linhas = (
+        ComposicaoInsumo.objects.filter(ficha_id__in=list(quantidades))
+        .values('insumo_id', 'insumo__nome', 'insumo__unidade_medida', 'insumo__preco', 'insumo__peso')
+        .annotate(total=Sum(F('quantidade') * peso_da_ficha))
+        .order_by('insumo__nome')
+    )
+    insumos = []
+    for linha in linhas:
+        item = {
+            'insumo': linha['insumo_id'],
+            'nome': linha['insumo__nome'],
+            'unidade_medida': linha['insumo__unidade_medida'],
+            'quantidade': round(linha['total'], 3),
+        }
+        if mostrar_custo:
+            item['custo'] = _custo(linha['insumo__preco'], linha['insumo__peso'], linha['total'])
+        insumos.append(item)
+    return insumos
+
+
+def custos_em(instantes, ficha_ids=None, restaurante_id=None):
+    """{ficha_id: [custo em cada instante]} com os preços vigentes em cada instante.
+
+    Usa a composição atual das fichas (as de ficha_ids ou todas as do
+    restaurante) e o peso atual dos insumos; só os preços vêm do histórico.
+    São poucas consultas no total, qualquer que seja o número de fichas e de
+    instantes.
+    """
+    linhas = ComposicaoInsumo.objects.filter(ficha__isnull=False)
+    if ficha_ids is not None:
+        linhas = linhas.filter(ficha_id__in=ficha_ids)
+    if restaurante_id is not None:
+        linhas = linhas.filter(restaurante_id=restaurante_id)
+    linhas = list(linhas.values_list('ficha_id', 'insumo_id', 'insumo__peso', 'quantidade'))
+    precos = precos_em({insumo_id for _, insumo_id, _, _ in linhas}, instantes)
+    custos = {ficha_id: [0.0] * len(instantes) for ficha_id in ficha_ids or ()}
+    for ficha_id, insumo_id, peso, quantidade in linhas:
+        serie = custos.setdefault(ficha_id, [0.0] * len(instantes))
+        if not peso:
+            continue
+        fator = quantidade / float(peso)
+        for posicao, preco in enumerate(precos[insumo_id]):
+            serie[posicao] += preco * fator
+    return {ficha_id: [round(custo, 2) for custo in serie] for ficha_id, serie in custos.items()}
@@ -0,0 +1,522 @@
+"""Motor de cálculo de custos e pesos de receitas e fichas técnicas.
+
+O motor carrega o grafo de um restaurante (insumos, itens de receitas e itens de
+fichas técnicas) em um número constante de consultas e calcula o custo e o peso
+de cada nó uma única vez, reaproveitando os resultados entre irmãos, entre as
+passagens de custo e de peso e entre todos os objetos de uma mesma resposta.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import DecimalField, F, Q, Value
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from .dependencias import _ordem_topologica
+from .models import (
+    Restaurante, Insumo, Receita, ReceitaInsumo, FichaTecnica, FichaTecnicaItem, ComposicaoInsumo, TAXA_IFOOD_PADRAO,
+)
+
+CENTAVO = Decimal('0.01')
+
+# Acima desta quantidade de nós, carregar o restaurante inteiro sai mais barato
+LIMITE_CARGA_PARCIAL = 200
+
+
+def _float(valor):
+    return float(valor) if valor is not None else None
+
+
+def _decimal(valor):
+    return Decimal(str(round(valor, 2))) if valor is not None else None
+
+
+def _acumular(composicao, insumo_id, quantidade, profundidade):
+    anterior = composicao.get(insumo_id)
+    if anterior is not None:
+        quantidade += anterior[0]
+        profundidade = min(profundidade, anterior[1])
+    composicao[insumo_id] = (quantidade, profundidade)
+
+
+def valores_sugeridos(custo_total, fator_correcao, taxa_ifood=TAXA_IFOOD_PADRAO):
+    """Retorna (valor_restaurante, valor_ifood) para o custo, o fator de correção e a taxa do iFood.
+
+    Calculado em Decimal com arredondamento comercial (metade para cima), o
+    mesmo do UPDATE de atualizar_valores_sugeridos, para que os dois caminhos
+    gravem os mesmos centavos.
+    """
+    custo = Decimal(str(custo_total))
+    fator = Decimal(str(fator_correcao)) if fator_correcao else Decimal(1)
+    taxa = Decimal(str(taxa_ifood if taxa_ifood is not None else TAXA_IFOOD_PADRAO))
+    valor_restaurante = (custo * fator).quantize(CENTAVO, ROUND_HALF_UP)
+    valor_ifood = (custo * fator * (1 + taxa)).quantize(CENTAVO, ROUND_HALF_UP)
+    return float(valor_restaurante), float(valor_ifood)
+
+
+def atualizar_valores_sugeridos(restaurante):
+    """Regrava valor_restaurante e valor_ifood de todas as receitas e fichas do restaurante.
+
+    Usa um único UPDATE por tabela, calculado no banco a partir de custo_total,
+    sem carregar as linhas nem disparar sinais. Retorna (receitas, fichas).
+    """
+    fator = Decimal(str(restaurante.fator_correcao or 1))
+    taxa = Decimal(str(restaurante.taxa_ifood if restaurante.taxa_ifood is not None else TAXA_IFOOD_PADRAO))
+    decimal = DecimalField(max_digits=12, decimal_places=6)
+    valores = {
+        'valor_restaurante': Round(F('custo_total') * Value(fator, output_field=decimal), 2),
+        'valor_ifood': Round(F('custo_total') * Value(fator * (1 + taxa), output_field=decimal), 2),
+    }
+    return tuple(
+        modelo.objects.filter(restaurante_id=restaurante.pk, custo_total__isnull=False).update(**valores)
+        for modelo in (Receita, FichaTecnica)
+    )
+
+
+class MotorCustos:
+    """Calcula custo_total e peso_final de receitas e fichas de um restaurante."""
+
+    def __init__(self, restaurante_id):
+        self.restaurante_id = restaurante_id
+        # insumo_id -> (preco, peso)
+        self._insumos = {}
+        # receita_id -> [(insumo_id, receita_sub_id, quantidade, ic, ipc)]
+        self._itens_receita = {}
+        # ficha_id -> [(insumo_id, receita_id, quantidade, ic, ipc, aplicar_ic_ipc)]
+        self._itens_ficha = {}
+        self._insumos_carregados = False
+        self._receitas_carregadas = False
+        self._fichas_carregadas = False
+        self._custos_receita = {}
+        self._pesos_receita = {}
+        self._custos_ficha = {}
+        self._pesos_ficha = {}
+        self._composicoes_receita = {}
+        self._composicoes_ficha = {}
+
+    # Carregamento do grafo
+
+    def _carregar_insumos(self, ids=None):
+        qs = Insumo.objects.all()
+        if ids is None:
+            qs = qs.filter(restaurante_id=self.restaurante_id)
+            self._insumos_carregados = True
+        else:
+            qs = qs.filter(id__in=ids)
+        for insumo_id, preco, peso in qs.values_list('id', 'preco', 'peso'):
+            self._insumos[insumo_id] = (_float(preco), _float(peso))
+
+    def _insumo(self, insumo_id):
+        if insumo_id not in self._insumos:
+            if not self._insumos_carregados:
+                self._carregar_insumos()
+            if insumo_id not in self._insumos:
+                # Insumo de outro restaurante
+                self._carregar_insumos([insumo_id])
+        return self._insumos.get(insumo_id, (None, None))
+
+    def _carregar_itens_receita(self, receita_ids=None):
+        qs = ReceitaInsumo.objects.all()
+        if receita_ids is None:
+            qs = qs.filter(receita__restaurante_id=self.restaurante_id)
+            self._receitas_carregadas = True
+        else:
+            qs = qs.filter(receita_id__in=receita_ids)
+            for receita_id in receita_ids:
+                self._itens_receita.setdefault(receita_id, [])
+        campos = ('receita_id', 'insumo_id', 'receita_sub_id', 'quantidade_utilizada', 'ic', 'ipc')
+        for receita_id, insumo_id, sub_id, quantidade, ic, ipc in qs.order_by('id').values_list(*campos):
+            self._itens_receita.setdefault(receita_id, []).append(
+                (insumo_id, sub_id, _float(quantidade), _float(ic), _float(ipc))
+            )
+
+    def _itens_da_receita(self, receita_id):
+        if receita_id not in self._itens_receita:
+            if not self._receitas_carregadas:
+                self._carregar_itens_receita()
+            if receita_id not in self._itens_receita:
+                # Receita sem itens ou de outro restaurante
+                self._carregar_itens_receita([receita_id])
+        return self._itens_receita[receita_id]
+
+    def _carregar_itens_ficha(self, ficha_ids=None):
+        qs = FichaTecnicaItem.objects.all()
+        if ficha_ids is None:
+            qs = qs.filter(ficha__restaurante_id=self.restaurante_id)
+            self._fichas_carregadas = True
+        else:
+            qs = qs.filter(ficha_id__in=ficha_ids)
+            for ficha_id in ficha_ids:
+                self._itens_ficha.setdefault(ficha_id, [])
+        campos = ('ficha_id', 'insumo_id', 'receita_id', 'quantidade_utilizada', 'ic', 'ipc', 'aplicar_ic_ipc')
+        for ficha_id, insumo_id, receita_id, quantidade, ic, ipc, aplicar in qs.order_by('id').values_list(*campos):
+            self._itens_ficha.setdefault(ficha_id, []).append(
+                (insumo_id, receita_id, _float(quantidade), _float(ic), _float(ipc), aplicar)
+            )
+
+    def _itens_da_ficha(self, ficha_id):
+        if ficha_id not in self._itens_ficha:
+            if not self._fichas_carregadas:
+                self._carregar_itens_ficha()
+            if ficha_id not in self._itens_ficha:
+                self._carregar_itens_ficha([ficha_id])
+        return self._itens_ficha[ficha_id]
+
+    def carregar(self, receita_ids=(), ficha_ids=()):
+        """Carrega só a parte do grafo usada pelos nós informados (e suas sub-receitas).
+
+        Útil para recálculos pontuais em restaurantes grandes; nós que não
+        foram carregados aqui continuam sendo buscados sob demanda.
+        """
+        novas_fichas = [ficha_id for ficha_id in ficha_ids if ficha_id not in self._itens_ficha]
+        if novas_fichas:
+            self._carregar_itens_ficha(novas_fichas)
+        itens = [item for ficha_id in ficha_ids for item in self._itens_ficha[ficha_id]]
+        pendentes = set(receita_ids) | {item[1] for item in itens if item[1]}
+        while pendentes:
+            novas = [receita_id for receita_id in pendentes if receita_id not in self._itens_receita]
+            if novas:
+                self._carregar_itens_receita(novas)
+            subs = [item for receita_id in pendentes for item in self._itens_receita[receita_id]]
+            itens.extend(subs)
+            pendentes = {item[1] for item in subs if item[1] and item[1] not in self._itens_receita}
+        insumo_ids = {item[0] for item in itens if item[0]} - set(self._insumos)
+        if insumo_ids:
+            self._carregar_insumos(list(insumo_ids))
+
+    def ordem_receitas(self, receita_ids):
+        """Ordena as receitas de baixo para cima (sub-receitas antes das receitas que as usam)"""
+        arestas = [
+            (receita_id, item[1])
+            for receita_id in receita_ids
+            for item in self._itens_da_receita(receita_id)
+            if item[1]
+        ]
+        return _ordem_topologica(list(receita_ids), arestas)
+
+    def _custo_unitario(self, insumo_id):
+        preco, peso = self._insumo(insumo_id)
+        if not preco or not peso:
+            return None
+        return preco / peso
+
+    # Receitas
+
+    def _pos_ordem(self, receita_id, calculadas):
+        """Receitas ainda não calculadas a partir de receita_id, sub-receitas antes das que as usam.
+
+        Percorre as sub-receitas com uma pilha explícita, sem recursão; uma
+        aresta que feche um ciclo (dado antigo, anterior à validação) é ignorada.
+        """
+        pilha = [(receita_id, False)]
+        no_caminho = set()
+        while pilha:
+            atual, expandida = pilha.pop()
+            if atual in calculadas:
+                continue
+            if expandida:
+                no_caminho.discard(atual)
+                yield atual
+                continue
+            no_caminho.add(atual)
+            pilha.append((atual, True))
+            for _, sub_id, *_ in self._itens_da_receita(atual):
+                if sub_id and sub_id not in calculadas and sub_id not in no_caminho:
+                    pilha.append((sub_id, False))
+
+    def _calcular_receita(self, receita_id):
+        # Sub-receitas de um ciclo ainda não calculadas contribuem com zero
+        for atual in self._pos_ordem(receita_id, self._custos_receita):
+            self._custos_receita[atual] = self._somar_custo_receita(atual)
+            self._pesos_receita[atual] = self._somar_peso_receita(atual)
+
+    def _somar_custo_receita(self, receita_id):
+        total = 0
+        for insumo_id, sub_id, quantidade, ic, ipc in self._itens_da_receita(receita_id):
+            if insumo_id:
+                custo_unit = self._custo_unitario(insumo_id)
+                if custo_unit is None:
+                    continue
+                divisor = (ipc / 100) * (ic / 100) or 1
+                total += (custo_unit * quantidade) / divisor
+            elif sub_id:
+                total += self._custos_receita.get(sub_id, 0) * quantidade
+        return total
+
+    def _somar_peso_receita(self, receita_id):
+        peso_total = 0
+        for insumo_id, sub_id, quantidade, ic, ipc in self._itens_da_receita(receita_id):
+            if not quantidade:
+                continue
+            if insumo_id:
+                ic = ic if ic else 100
+                ipc = ipc if ipc else 100
+                peso_total += quantidade * (ipc / 100) * (ic / 100)
+            elif sub_id:
+                peso_total += self._pesos_receita.get(sub_id, 0) * quantidade
+        return round(peso_total, 2)
+
+    def custo_receita(self, receita_id):
+        if receita_id not in self._custos_receita:
+            self._calcular_receita(receita_id)
+        return self._custos_receita[receita_id]
+
+    def peso_receita(self, receita_id):
+        if receita_id not in self._pesos_receita:
+            self._calcular_receita(receita_id)
+        return self._pesos_receita[receita_id]
+
+    def composicao_receita(self, receita_id):
+        """{insumo_id: (quantidade bruta, profundidade)} para a receita inteira, com sub-receitas expandidas"""
+        for atual in self._pos_ordem(receita_id, self._composicoes_receita):
+            composicao = {}
+            for insumo_id, sub_id, quantidade, ic, ipc in self._itens_da_receita(atual):
+                if insumo_id:
+                    divisor = (ipc / 100) * (ic / 100) or 1
+                    _acumular(composicao, insumo_id, quantidade / divisor, 0)
+                elif sub_id:
+                    for sub_insumo_id, (sub_quantidade, profundidade) in self._composicoes_receita.get(sub_id, {}).items():
+                        _acumular(composicao, sub_insumo_id, sub_quantidade * quantidade, profundidade + 1)
+            self._composicoes_receita[atual] = composicao
+        return self._composicoes_receita[receita_id]
+
+    # Fichas técnicas
+
+    def custo_ficha(self, ficha_id):
+        if ficha_id not in self._custos_ficha:
+            total = 0
+            for insumo_id, receita_id, quantidade, ic, ipc, aplicar in self._itens_da_ficha(ficha_id):
+                if insumo_id:
+                    custo_unit = self._custo_unitario(insumo_id)
+                    if custo_unit is None:
+                        continue
+                    if not aplicar:
+                        total += custo_unit * quantidade
+                        continue
+                    ic = ic if ic else 100
+                    ipc = ipc if ipc else 100
+                    if ic == 100 and ipc == 100:
+                        total += custo_unit * quantidade
+                        continue
+                    divisor = (ic / 100) * (ipc / 100) or 1
+                    total += custo_unit * (quantidade / divisor)
+                elif receita_id:
+                    custo_receita = self.custo_receita(receita_id)
+                    peso_receita = self.peso_receita(receita_id)
+                    if peso_receita and peso_receita > 0:
+                        total += custo_receita * (quantidade / peso_receita)
+                    else:
+                        total += custo_receita
+            self._custos_ficha[ficha_id] = round(total, 2)
+        return self._custos_ficha[ficha_id]
+
+    def peso_ficha(self, ficha_id):
+        if ficha_id not in self._pesos_ficha:
+            peso_total = 0
+            for insumo_id, receita_id, quantidade, ic, ipc, aplicar in self._itens_da_ficha(ficha_id):
+                if not quantidade:
+                    continue
+                if insumo_id:
+                    if not aplicar:
+                        peso_total += quantidade
+                    else:
+                        ic = ic if ic else 100
+                        ipc = ipc if ipc else 100
+                        peso_total += quantidade * (ipc / 100) * (ic / 100)
+                elif receita_id:
+                    peso_total += self.peso_receita(receita_id) * quantidade
+            self._pesos_ficha[ficha_id] = round(peso_total, 2)
+        return self._pesos_ficha[ficha_id]
+
+    def composicao_ficha(self, ficha_id):
+        """{insumo_id: (quantidade bruta, profundidade)} para a ficha inteira, com as mesmas regras de custo_ficha"""
+        if ficha_id not in self._composicoes_ficha:
+            composicao = {}
+            for insumo_id, receita_id, quantidade, ic, ipc, aplicar in self._itens_da_ficha(ficha_id):
+                if insumo_id:
+                    ic = ic if ic else 100
+                    ipc = ipc if ipc else 100
+                    if aplicar and (ic != 100 or ipc != 100):
+                        quantidade = quantidade / ((ic / 100) * (ipc / 100) or 1)
+                    _acumular(composicao, insumo_id, quantidade, 0)
+                elif receita_id:
+                    peso_receita = self.peso_receita(receita_id)
+                    fator = quantidade / peso_receita if peso_receita and peso_receita > 0 else 1
+                    for sub_insumo_id, (sub_quantidade, profundidade) in self.composicao_receita(receita_id).items():
+                        _acumular(composicao, sub_insumo_id, sub_quantidade * fator, profundidade + 1)
+            self._composicoes_ficha[ficha_id] = composicao
+        return self._composicoes_ficha[ficha_id]
+
+
+def obter_motor(contexto, restaurante_id):
+    """Retorna o motor do restaurante guardado no contexto (memoização por requisição)."""
+    if contexto is None:
+        return MotorCustos(restaurante_id)
+    motores = contexto.setdefault('motores_custos', {})
+    if restaurante_id not in motores:
+        motores[restaurante_id] = MotorCustos(restaurante_id)
+    return motores[restaurante_id]
+
+
+CAMPOS_VALORES = ['custo_total', 'peso_final', 'valor_restaurante', 'valor_ifood']
+CAMPOS_CALCULADOS = CAMPOS_VALORES + ['custo_calculado_em']
+
+
+def aplicar_calculo(obj, custo_total, peso_final, restaurante, calculado_em):
+    """Copia os valores calculados para a receita/ficha; retorna False se nada mudou"""
+    # Os valores sugeridos partem do custo já arredondado, como no UPDATE de atualizar_valores_sugeridos
+    custo = _decimal(custo_total)
+    valor_restaurante, valor_ifood = valores_sugeridos(custo, restaurante.fator_correcao, restaurante.taxa_ifood)
+    novos = (custo, _decimal(peso_final), _decimal(valor_restaurante), _decimal(valor_ifood))
+    if obj.custo_calculado_em is not None and novos == (obj.custo_total, obj.peso_final, obj.valor_restaurante, obj.valor_ifood):
+        return False
+    obj.custo_total, obj.peso_final, obj.valor_restaurante, obj.valor_ifood = novos
+    obj.custo_calculado_em = calculado_em
+    return True
+
+
+def persistir_custos(receita_ids=(), ficha_ids=(), motores=None):
+    """Recalcula e grava custos, pesos e valores sugeridos das receitas e fichas informadas.
+
+    Cada nó é calculado uma única vez (receitas na ordem recebida, que deve ser
+    topológica) e apenas as linhas cujo valor mudou, ou que nunca foram
+    calculadas, são gravadas, com bulk_update e sem disparar sinais. Os motores
+    usados ficam em motores ({restaurante_id: MotorCustos}) para reaproveitamento.
+    Retorna (receitas_alteradas, fichas_alteradas).
+    """
+    agora = timezone.now()
+    ordem = {receita_id: posicao for posicao, receita_id in enumerate(receita_ids)}
+    receitas = sorted(
+        Receita.objects.filter(id__in=ordem).select_related('restaurante').only(
+            *CAMPOS_CALCULADOS, 'restaurante__fator_correcao', 'restaurante__taxa_ifood'
+        ),
+        key=lambda r: ordem[r.id],
+    )
+    fichas = list(FichaTecnica.objects.filter(id__in=list(ficha_ids)).select_related('restaurante').only(
+        *CAMPOS_CALCULADOS, 'restaurante__fator_correcao', 'restaurante__taxa_ifood'
+    ))
+
+    motores = {} if motores is None else motores
+    nos = {}
+    for obj in receitas + fichas:
+        nos.setdefault(obj.restaurante_id, ([], []))[isinstance(obj, FichaTecnica)].append(obj.id)
+    _preparar_motores(motores, nos)
+
+    alteradas = []
+    for receita in receitas:
+        motor = motores[receita.restaurante_id]
+        custo_total = motor.custo_receita(receita.id)
+        peso_final = motor.peso_receita(receita.id)
+        if aplicar_calculo(receita, custo_total, peso_final, receita.restaurante, agora):
+            alteradas.append(receita)
+    Receita.objects.bulk_update(alteradas, CAMPOS_CALCULADOS, batch_size=500)
+
+    fichas_alteradas = []
+    for ficha in fichas:
+        motor = motores[ficha.restaurante_id]
+        custo_total = motor.custo_ficha(ficha.id)
+        peso_final = motor.peso_ficha(ficha.id)
+        if aplicar_calculo(ficha, custo_total, peso_final, ficha.restaurante, agora):
+            fichas_alteradas.append(ficha)
+    FichaTecnica.objects.bulk_update(fichas_alteradas, CAMPOS_CALCULADOS, batch_size=500)
+    return len(alteradas), len(fichas_alteradas)
+
+
+def _preparar_motores(motores, nos):
+    """Cria os motores que faltam; recálculos pequenos carregam só a parte do grafo que usam"""
+    for restaurante_id, (ids_receitas, ids_fichas) in nos.items():
+        motor = motores.setdefault(restaurante_id, MotorCustos(restaurante_id))
+        if len(ids_receitas) + len(ids_fichas) <= LIMITE_CARGA_PARCIAL:
+            motor.carregar(ids_receitas, ids_fichas)
+
+
+def _linhas_composicao(motor, restaurante_id, receita_ids, ficha_ids):
+    for receita_id in receita_ids:
+        for insumo_id, (quantidade, profundidade) in motor.composicao_receita(receita_id).items():
+            yield ComposicaoInsumo(
+                restaurante_id=restaurante_id, receita_id=receita_id, insumo_id=insumo_id,
+                quantidade=quantidade, profundidade=profundidade,
+            )
+    for ficha_id in ficha_ids:
+        for insumo_id, (quantidade, profundidade) in motor.composicao_ficha(ficha_id).items():
+            yield ComposicaoInsumo(
+                restaurante_id=restaurante_id, ficha_id=ficha_id, insumo_id=insumo_id,
+                quantidade=quantidade, profundidade=profundidade,
+            )
+
+
+def persistir_composicao(receita_ids=(), ficha_ids=(), motores=None):
+    """Regrava as linhas de ComposicaoInsumo das receitas e fichas informadas.
+
+    Deve receber todos os ancestrais dos nós cuja estrutura mudou (ver
+    dependencias.dependentes). Retorna o número de linhas gravadas.
+    """
+    motores = {} if motores is None else motores
+    receita_ids, ficha_ids = list(receita_ids), list(ficha_ids)
+    nos = {}
+    for receita_id, restaurante_id in Receita.objects.filter(id__in=receita_ids).values_list('id', 'restaurante_id'):
+        nos.setdefault(restaurante_id, ([], []))[0].append(receita_id)
+    for ficha_id, restaurante_id in FichaTecnica.objects.filter(id__in=ficha_ids).values_list('id', 'restaurante_id'):
+        nos.setdefault(restaurante_id, ([], []))[1].append(ficha_id)
+    _preparar_motores(motores, nos)
+
+    linhas = [
+        linha
+        for restaurante_id, (ids_receitas, ids_fichas) in nos.items()
+        for linha in _linhas_composicao(motores[restaurante_id], restaurante_id, ids_receitas, ids_fichas)
+    ]
+    ComposicaoInsumo.objects.filter(Q(receita_id__in=receita_ids) | Q(ficha_id__in=ficha_ids)).delete()
+    ComposicaoInsumo.objects.bulk_create(linhas, batch_size=500)
+    return len(linhas)
+
+
+def recalcular_restaurante(restaurante_id, gravar=True):
+    """Recalcula todas as receitas e fichas de um restaurante, de baixo para cima.
+
+    O grafo do restaurante é carregado de uma vez e as receitas são calculadas
+    em ordem topológica. Retorna as contagens, as linhas alteradas, a composição
+    completa (ComposicaoInsumo) e a lista de divergências (tipo, id, nome, campo,
+    gravado, calculado); com gravar=True tudo é gravado com gravar_recalculo.
+    """
+    restaurante = Restaurante.objects.only('fator_correcao', 'taxa_ifood').get(pk=restaurante_id)
+    motor = MotorCustos(restaurante_id)
+    receitas = {
+        receita.id: receita
+        for receita in Receita.objects.filter(restaurante_id=restaurante_id).only('nome', *CAMPOS_CALCULADOS)
+    }
+    fichas = list(FichaTecnica.objects.filter(restaurante_id=restaurante_id).only('nome', *CAMPOS_CALCULADOS))
+    agora = timezone.now()
+    resultado = {'receitas': len(receitas), 'fichas': len(fichas), 'alterados': {}, 'divergencias': []}
+    etapas = (
+        ('receita', [receitas[i] for i in motor.ordem_receitas(receitas)], motor.custo_receita, motor.peso_receita),
+        ('ficha', fichas, motor.custo_ficha, motor.peso_ficha),
+    )
+    for tipo, objetos, custo, peso in etapas:
+        alterados = resultado['alterados'][tipo] = []
+        for obj in objetos:
+            gravados = [getattr(obj, campo) for campo in CAMPOS_VALORES]
+            if not aplicar_calculo(obj, custo(obj.id), peso(obj.id), restaurante, agora):
+                continue
+            alterados.append(obj)
+            resultado['divergencias'].extend(
+                (tipo, obj.id, obj.nome, campo, antes, getattr(obj, campo))
+                for campo, antes in zip(CAMPOS_VALORES, gravados)
+                if antes != getattr(obj, campo)
+            )
+        resultado[f'{tipo}s_alteradas'] = len(alterados)
+    resultado['restaurante'] = restaurante_id
+    resultado['composicao'] = list(_linhas_composicao(motor, restaurante_id, receitas, [ficha.id for ficha in fichas]))
+    if gravar:
+        gravar_recalculo(resultado)
+    return resultado
+
+
+def gravar_recalculo(resultado):
+    """Grava as linhas alteradas e a composição completa calculadas por recalcular_restaurante"""
+    Receita.objects.bulk_update(resultado['alterados']['receita'], CAMPOS_CALCULADOS, batch_size=500)
+    FichaTecnica.objects.bulk_update(resultado['alterados']['ficha'], CAMPOS_CALCULADOS, batch_size=500)
+    ComposicaoInsumo.objects.filter(restaurante_id=resultado['restaurante']).delete()
+    ComposicaoInsumo.objects.bulk_create(resultado['composicao'], batch_size=500)
+    if resultado['alterados']['receita'] or resultado['alterados']['ficha']:
+        from .cache_catalogo import agendar_invalidacao
+        agendar_invalidacao(restaurante_ids=[resultado['restaurante']])
@@ -0,0 +1,104 @@
+"""Índice reverso de dependências de custo: insumo → receitas → receitas pai → fichas.
+
+As próprias tabelas de itens (ReceitaInsumo e FichaTecnicaItem, indexadas por
+insumo_id, receita_sub_id e receita_id) formam o índice persistente. A busca
+sobe o grafo um nível por consulta, de modo que o número de consultas depende
+apenas da profundidade de aninhamento das sub-receitas, e devolve as receitas
+afetadas em ordem topológica (sub-receitas antes das receitas que as usam).
+
+As mesmas tabelas servem para manter as sub-receitas como um grafo acíclico
+e com profundidade limitada (validar_subreceita).
+"""
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import ReceitaInsumo, FichaTecnicaItem
+
+
+def _ordem_topologica(receita_ids, arestas):
+    """Ordena receitas de forma que cada sub-receita venha antes das receitas pai"""
+    pendentes = {receita_id: 0 for receita_id in receita_ids}
+    pais = {}
+    for pai_id, sub_id in arestas:
+        if pai_id in pendentes and sub_id in pendentes:
+            pendentes[pai_id] += 1
+            pais.setdefault(sub_id, []).append(pai_id)
+    fila = [receita_id for receita_id, grau in pendentes.items() if grau == 0]
+    ordem = []
+    while fila:
+        receita_id = fila.pop()
+        ordem.append(receita_id)
+        for pai_id in pais.get(receita_id, []):
+            pendentes[pai_id] -= 1
+            if pendentes[pai_id] == 0:
+                fila.append(pai_id)
+    # Receitas presas em ciclo ficam no fim, uma única vez
+    visitadas = set(ordem)
+    ordem.extend(receita_id for receita_id in receita_ids if receita_id not in visitadas)
+    return ordem
+
+
+def dependentes(insumo_ids=(), receita_ids=()):
+    """Retorna (receita_ids, ficha_ids) afetados por mudanças nos insumos e receitas informados.
+
+    As receitas informadas fazem parte do resultado. A lista de receitas vem em
+    ordem topológica; a de fichas não tem ordem definida.
+    """
+    insumo_ids = set(insumo_ids)
+    afetadas = set(receita_ids)
+    arestas = []
+    if insumo_ids:
+        diretas = ReceitaInsumo.objects.filter(insumo_id__in=insumo_ids).values_list('receita_id', flat=True)
+        afetadas.update(diretas)
+    fronteira = set(afetadas)
+    while fronteira:
+        pares = list(
+            ReceitaInsumo.objects.filter(receita_sub_id__in=fronteira).values_list('receita_id', 'receita_sub_id')
+        )
+        arestas.extend(pares)
+        fronteira = {pai_id for pai_id, _ in pares} - afetadas
+        afetadas.update(fronteira)
+
+    filtro = Q(receita_id__in=afetadas)
+    if insumo_ids:
+        filtro |= Q(insumo_id__in=insumo_ids)
+    fichas = set()
+    if afetadas or insumo_ids:
+        fichas = set(FichaTecnicaItem.objects.filter(filtro).values_list('ficha_id', flat=True))
+    return _ordem_topologica(sorted(afetadas), arestas), sorted(fichas)
+
+
+def _altura(receita_id, origem, destino, limite):
+    """Maior distância a partir da receita, seguindo as arestas origem → destino.
+
+    Expande um nível por consulta e para ao passar de limite. Retorna
+    (altura, receitas alcançadas).
+    """
+    alcancadas = set()
+    fronteira = {receita_id}
+    altura = 0
+    while fronteira and altura <= limite:
+        fronteira = set(
+            ReceitaInsumo.objects.filter(**{f'{origem}__in': fronteira}, receita_sub__isnull=False)
+            .values_list(destino, flat=True)
+        )
+        alcancadas |= fronteira
+        if fronteira:
+            altura += 1
+    return altura, alcancadas
+
+
+def validar_subreceita(receita_id, sub_id):
+    """Retorna a mensagem de erro se usar sub_id dentro de receita_id criar um ciclo
+    ou passar da profundidade máxima de aninhamento; None se a ligação for válida."""
+    limite = settings.PROFUNDIDADE_MAXIMA_SUBRECEITAS
+    if receita_id == sub_id:
+        return "Uma receita não pode ser sub-receita de si mesma."
+    abaixo, descendentes = _altura(sub_id, 'receita_id', 'receita_sub_id', limite)
+    if receita_id in descendentes:
+        return "Esta sub-receita já usa a receita atual; a ligação criaria um ciclo."
+    acima, _ = _altura(receita_id, 'receita_sub_id', 'receita_id', limite)
+    if acima + 1 + abaixo > limite:
+        return f"A ligação passaria do limite de {limite} níveis de sub-receitas."
+    return None
@@ -0,0 +1,94 @@
+"""Exportação do catálogo de um restaurante em planilhas (ver planilhas.py).
+
+Cada conteúdo devolve o cabeçalho e um gerador de linhas lido com
+values_list().iterator(), em lotes de LOTE_EXPORTACAO, sem montar objetos de
+modelo nem a lista completa em memória. Custos e valores sugeridos são os
+gravados pelo recálculo; as colunas de custo só entram para quem pode vê-los.
+"""
+
+from .models import FichaTecnica, FichaTecnicaItem, Insumo, Receita, ReceitaInsumo
+
+LOTE_EXPORTACAO = 2000
+
+
+def _linhas(queryset, campos):
+    return (list(linha) for linha in queryset.values_list(*campos).iterator(chunk_size=LOTE_EXPORTACAO))
+
+
+def _insumos(restaurante_id, custos):
+    cabecalho = ['id', 'nome', 'categoria', 'unidade_medida', 'peso', 'preco']
+    campos = ['id', 'nome', 'categoria__nome', 'unidade_medida', 'peso', 'preco']
+    qs = Insumo.objects.filter(restaurante_id=restaurante_id).order_by('nome', 'id')
+    return cabecalho, _linhas(qs, campos)
+
+
+def _receitas(restaurante_id, custos):
+    cabecalho = ['id', 'nome', 'tempo_preparo', 'porcao_sugerida', 'rendimento', 'peso_final', 'modo_preparo']
+    if custos:
+        cabecalho += ['custo_total', 'valor_restaurante', 'valor_ifood', 'custo_calculado_em']
+    qs = Receita.objects.filter(restaurante_id=restaurante_id).order_by('nome', 'id')
+    return cabecalho, _linhas(qs, cabecalho)
+
+
+def _fichas(restaurante_id, custos):
+    cabecalho = ['id', 'nome', 'rendimento', 'peso_final', 'modo_preparo']
+    if custos:
+        cabecalho += ['custo_total', 'valor_restaurante', 'valor_ifood', 'custo_calculado_em']
+    qs = FichaTecnica.objects.filter(restaurante_id=restaurante_id).order_by('nome', 'id')
+    return cabecalho, _linhas(qs, cabecalho)
+
+
+def _itens_receitas(restaurante_id, custos):
+    cabecalho = [
+        'receita_id', 'receita', 'item_id', 'insumo_id', 'insumo', 'subreceita_id', 'subreceita',
+        'quantidade_utilizada', 'ic', 'ipc', 'aplicar_ic_ipc',
+    ]
+    campos = [
+        'receita_id', 'receita__nome', 'id', 'insumo_id', 'insumo__nome', 'receita_sub_id', 'receita_sub__nome',
+        'quantidade_utilizada', 'ic', 'ipc', 'aplicar_ic_ipc',
+    ]
+    qs = ReceitaInsumo.objects.filter(receita__restaurante_id=restaurante_id).order_by('receita__nome', 'receita_id', 'id')
+    return cabecalho, _linhas(qs, campos)
+
+
+def _itens_fichas(restaurante_id, custos):
+    cabecalho = [
+        'ficha_id', 'ficha', 'item_id', 'insumo_id', 'insumo', 'receita_id', 'receita', 'quantidade_utilizada',
+        'unidade_medida', 'ic', 'ic_tipo', 'ipc', 'aplicar_ic_ipc',
+    ]
+    campos = [
+        'ficha_id', 'ficha__nome', 'id', 'insumo_id', 'insumo__nome', 'receita_id', 'receita__nome',
+        'quantidade_utilizada', 'unidade_medida', 'ic', 'ic_tipo', 'ipc', 'aplicar_ic_ipc',
+    ]
+    qs = FichaTecnicaItem.objects.filter(ficha__restaurante_id=restaurante_id).order_by('ficha__nome', 'ficha_id', 'id')
+    return cabecalho, _linhas(qs, campos)
+
+
+# ?conteudo= -> (função, nome da aba/arquivo)
+CONTEUDOS_EXPORTACAO = {
+    'insumos': (_insumos, 'Insumos'),
+    'receitas': (_receitas, 'Receitas'),
+    'receitas-itens': (_itens_receitas, 'Itens das receitas'),
+    'fichas': (_fichas, 'Fichas técnicas'),
+    'fichas-itens': (_itens_fichas, 'Itens das fichas'),
+}
+
+
+def exportar_catalogo(restaurante_id, conteudo, custos=False):
+    """(cabeçalho, gerador de linhas, título) do conteúdo pedido do restaurante"""
+    funcao, titulo = CONTEUDOS_EXPORTACAO[conteudo]
+    cabecalho, linhas = funcao(restaurante_id, custos)
+    return cabecalho, linhas, titulo
+
+
+def calcular_pendentes(restaurante_id):
+    """Calcula antes da exportação as receitas e fichas que ainda não têm custo gravado"""
+    from .recalculo import recalcular
+    receita_ids = list(
+        Receita.objects.filter(restaurante_id=restaurante_id, custo_calculado_em__isnull=True).values_list('id', flat=True)
+    )
+    ficha_ids = list(
+        FichaTecnica.objects.filter(restaurante_id=restaurante_id, custo_calculado_em__isnull=True).values_list('id', flat=True)
+    )
+    if receita_ids or ficha_ids:
+        recalcular(receita_ids=receita_ids, ficha_ids=ficha_ids)
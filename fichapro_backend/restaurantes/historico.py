@@ -0,0 +1,191 @@
+"""Séries de preço dos insumos: consulta por período, agrupamento e compactação.
+
+Linhas compactadas resumem vários pontos antigos de um período (preco_minimo,
+preco_maximo, preco_medio e pontos); as agregações tratam uma linha comum como
+um único ponto, de modo que o resultado é o mesmo antes e depois da compactação.
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import HistoricoPrecoInsumo, Insumo
+
+AGRUPAMENTOS = {'dia': TruncDay, 'semana': TruncWeek, 'mes': TruncMonth}
+
+
+def _periodo(data, agrupar):
+    """Início do período (dia, semana ou mês) da data, no fuso atual, como as funções Trunc"""
+    dia = timezone.localtime(data).date()
+    if agrupar == 'semana':
+        return dia - timedelta(days=dia.weekday())
+    if agrupar == 'mes':
+        return dia.replace(day=1)
+    return dia
+
+
+def _historico(insumo_ids, inicio=None, fim=None):
+    qs = HistoricoPrecoInsumo.objects.filter(insumo_id__in=insumo_ids)
+    if inicio is not None:
+        qs = qs.filter(data__gte=inicio)
+    if fim is not None:
+        qs = qs.filter(data__lt=fim)
+    return qs
+
+
+def serie_precos(insumo_ids, inicio=None, fim=None, agrupar=None):
+    """{insumo_id: [pontos]} com o histórico de preços no intervalo [inicio, fim).
+
+    Sem agrupar, devolve as linhas como estão. Com agrupar ('dia', 'semana' ou
+    'mes') cada ponto é um período com mínimo, máximo, média, quantidade de
+    pontos e o último preço; a agregação é feita pelo banco.
+    """
+    series = {insumo_id: [] for insumo_id in insumo_ids}
+    qs = _historico(insumo_ids, inicio, fim)
+    if agrupar is None:
+        campos = ('insumo_id', 'id', 'preco', 'data', 'preco_minimo', 'preco_maximo', 'preco_medio', 'pontos')
+        for linha in qs.order_by('insumo_id', 'data', 'id').values(*campos):
+            series[linha.pop('insumo_id')].append(linha)
+        return series
+
+    soma = ExpressionWrapper(
+        Coalesce('preco_medio', 'preco') * F('pontos'), output_field=DecimalField(max_digits=20, decimal_places=4)
+    )
+    grupos = list(
+        qs.annotate(periodo=AGRUPAMENTOS[agrupar]('data'))
+        .values('insumo_id', 'periodo')
+        .annotate(
+            minimo=Min(Coalesce('preco_minimo', 'preco')),
+            maximo=Max(Coalesce('preco_maximo', 'preco')),
+            soma=Sum(soma),
+            total_pontos=Sum('pontos'),
+            ultima_data=Max('data'),
+        )
+        .order_by('insumo_id', 'periodo')
+    )
+    # Último preço de cada período: a linha com a maior data do grupo
+    datas = sorted({grupo['ultima_data'] for grupo in grupos})
+    ultimos = {}
+    for posicao in range(0, len(datas), 500):
+        linhas = _historico(insumo_ids).filter(data__in=datas[posicao:posicao + 500]).order_by('id')
+        for insumo_id, data, preco in linhas.values_list('insumo_id', 'data', 'preco'):
+            ultimos[(insumo_id, data)] = preco
+    for grupo in grupos:
+        series[grupo['insumo_id']].append({
+            'data': grupo['periodo'],
+            'preco': float(ultimos[(grupo['insumo_id'], grupo['ultima_data'])]),
+            'minimo': float(grupo['minimo']),
+            'maximo': float(grupo['maximo']),
+            'media': round(float(grupo['soma']) / grupo['total_pontos'], 2),
+            'pontos': grupo['total_pontos'],
+        })
+    return series
+
+
+def fechamentos(inicio, fim, agrupar):
+    """Último dia de cada período (dia, semana ou mês) entre as datas inicio e fim, inclusive; o último é fim"""
+    datas = []
+    dia = inicio
+    while dia <= fim:
+        if agrupar == 'semana':
+            proximo = dia - timedelta(days=dia.weekday()) + timedelta(days=7)
+        elif agrupar == 'mes':
+            proximo = (dia.replace(day=1) + timedelta(days=32)).replace(day=1)
+        else:
+            proximo = dia + timedelta(days=1)
+        datas.append(min(proximo - timedelta(days=1), fim))
+        dia = proximo
+    return datas
+
+
+def fim_do_dia(dia):
+    """Instante em que o dia termina (início do dia seguinte), no fuso atual"""
+    return timezone.make_aware(datetime.combine(dia + timedelta(days=1), time.min))
+
+
+def precos_em(insumo_ids, instantes):
+    """{insumo_id: [preço vigente em cada instante]}, com instantes em ordem crescente.
+
+    O preço vigente é o do último registro de histórico anterior ao instante.
+    Antes do primeiro registro vale o primeiro preço conhecido e, sem
+    histórico algum, o preço atual do insumo. Por lote de insumos são duas
+    consultas, ambas pelo índice (insumo, data): o preço vigente no primeiro
+    instante e as mudanças entre o primeiro e o último, percorridas em ordem.
+    """
+    precos = {}
+    if not instantes:
+        return {insumo_id: [] for insumo_id in insumo_ids}
+    primeiro, ultimo = instantes[0], instantes[-1]
+    insumo_ids = sorted(insumo_ids)
+    for posicao in range(0, len(insumo_ids), 500):
+        lote = insumo_ids[posicao:posicao + 500]
+        historico = HistoricoPrecoInsumo.objects.filter(insumo=OuterRef('pk'))
+        iniciais = Insumo.objects.filter(id__in=lote).annotate(
+            vigente=Subquery(historico.filter(data__lt=primeiro).order_by('-data', '-id').values('preco')[:1]),
+            seguinte=Subquery(historico.filter(data__gte=primeiro).order_by('data', 'id').values('preco')[:1]),
+        ).values_list('id', 'vigente', 'seguinte', 'preco')
+        mudancas = {}
+        for insumo_id, data, preco in _historico(lote, primeiro, ultimo).order_by('insumo_id', 'data', 'id').values_list(
+            'insumo_id', 'data', 'preco'
+        ):
+            mudancas.setdefault(insumo_id, []).append((data, float(preco)))
+        for insumo_id, vigente, seguinte, atual in iniciais:
+            preco = float(next(valor for valor in (vigente, seguinte, atual) if valor is not None))
+            serie, linhas, proxima = [], mudancas.get(insumo_id, []), 0
+            for instante in instantes:
+                while proxima < len(linhas) and linhas[proxima][0] < instante:
+                    preco = linhas[proxima][1]
+                    proxima += 1
+                serie.append(preco)
+            precos[insumo_id] = serie
+    return precos
+
+
+def _resumir(linhas):
+    """Transforma a última linha do período no resumo de todas; retorna (resumo, ids a excluir)"""
+    ultima = linhas[-1]
+    pontos = sum(linha.pontos for linha in linhas)
+    soma = sum((linha.preco_medio if linha.preco_medio is not None else linha.preco) * linha.pontos for linha in linhas)
+    ultima.preco_minimo = min(linha.preco_minimo if linha.preco_minimo is not None else linha.preco for linha in linhas)
+    ultima.preco_maximo = max(linha.preco_maximo if linha.preco_maximo is not None else linha.preco for linha in linhas)
+    ultima.preco_medio = (soma / pontos).quantize(Decimal('0.0001'))
+    ultima.pontos = pontos
+    return ultima, [linha.id for linha in linhas[:-1]]
+
+
+def compactar_historico(antes_de, agrupar='dia', insumos_por_lote=200, gravar=True):
+    """Resume em uma linha por insumo e período os pontos de histórico anteriores a antes_de.
+
+    Processa os insumos em lotes; cada lote é lido de uma vez e gravado em uma
+    transação (bulk_update dos resumos e exclusão dos demais pontos).
+    Retorna (periodos_resumidos, linhas_excluidas).
+    """
+    antigos = HistoricoPrecoInsumo.objects.filter(data__lt=antes_de)
+    insumo_ids = list(antigos.values_list('insumo_id', flat=True).distinct().order_by('insumo_id'))
+    campos = ['preco_minimo', 'preco_maximo', 'preco_medio', 'pontos']
+    total_resumos = total_excluidas = 0
+    for inicio in range(0, len(insumo_ids), insumos_por_lote):
+        lote = insumo_ids[inicio:inicio + insumos_por_lote]
+        grupos = {}
+        for linha in antigos.filter(insumo_id__in=lote).order_by('insumo_id', 'data', 'id').only(
+            'insumo_id', 'preco', 'data', *campos
+        ):
+            grupos.setdefault((linha.insumo_id, _periodo(linha.data, agrupar)), []).append(linha)
+        resumos, excluir = [], []
+        for linhas in grupos.values():
+            if len(linhas) > 1:
+                resumo, ids = _resumir(linhas)
+                resumos.append(resumo)
+                excluir.extend(ids)
+        total_resumos += len(resumos)
+        total_excluidas += len(excluir)
+        if gravar and resumos:
+            with transaction.atomic():
+                HistoricoPrecoInsumo.objects.bulk_update(resumos, campos, batch_size=500)
+                for posicao in range(0, len(excluir), 500):
+                    HistoricoPrecoInsumo.objects.filter(id__in=excluir[posicao:posicao + 500]).delete()
+    return total_resumos, total_excluidas
@@ -0,0 +1,625 @@
+"""Importação em lote de dados de restaurantes a partir de planilhas."""
+
+import csv
+import itertools
+import zipfile
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import (
+    FichaTecnica, FichaTecnicaItem, Insumo, HistoricoPrecoInsumo, Receita, ReceitaInsumo, registrar_atividade,
+)
+from .planilhas import valores_xlsx
+
+
+def ler_decimal(valor, casas):
+    """Converte texto como '12,50', '1.234,5' ou '12.5' em Decimal com as casas informadas"""
+    if valor is None:
+        return None
+    texto = str(valor).strip().replace('R$', '').replace(' ', '')
+    if not texto:
+        return None
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        numero = Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f"inválido: {valor!r}")
+    if not numero.is_finite():
+        raise ValueError(f"inválido: {valor!r}")
+    try:
+        return numero.quantize(Decimal(1).scaleb(-casas))
+    except InvalidOperation:
+        # Números grandes demais para as casas pedidas (ex.: '1e30')
+        raise ValueError(f"inválido: {valor!r}")
+
+
+def ler_booleano(valor, padrao=True):
+    """Converte 'sim'/'não', '1'/'0', 'true'/'false' ou 'x' em bool; vazio retorna o padrão"""
+    texto = str(valor if valor is not None else '').strip().lower()
+    if not texto:
+        return padrao
+    if texto in ('1', 'sim', 's', 'x', 'true', 'verdadeiro', 'yes'):
+        return True
+    if texto in ('0', 'não', 'nao', 'n', 'false', 'falso', 'no'):
+        return False
+    raise ValueError(f"inválido: {valor!r}")
+
+
+def _como_dicionarios(linhas):
+    cabecalho = [str(coluna).strip().lower() for coluna in next(linhas, [])]
+    for valores in linhas:
+        if any(str(valor).strip() for valor in valores):
+            yield dict(zip(cabecalho, valores))
+
+
+def _decodificar(linha):
+    try:
+        return linha.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError("o arquivo CSV deve estar em UTF-8")
+
+
+def ler_linhas_csv(arquivo):
+    """Lê um arquivo CSV enviado (separado por ',' ou ';') linha a linha, como dicionários.
+
+    ValueError, durante a leitura, se o arquivo não estiver em UTF-8.
+    """
+    linhas = (_decodificar(linha) for linha in arquivo)
+    primeira = next(linhas, '')
+    delimitador = ';' if primeira.count(';') > primeira.count(',') else ','
+    yield from _como_dicionarios(csv.reader(itertools.chain([primeira], linhas), delimiter=delimitador))
+
+
+def ler_planilha(arquivo):
+    """Linhas (dicionários pelo cabeçalho) de um CSV ou da primeira aba de um XLSX enviado.
+
+    ValueError se o XLSX for inválido. As linhas são lidas sob demanda: um
+    arquivo corrompido no meio também gera ValueError, durante a iteração.
+    """
+    if zipfile.is_zipfile(arquivo):
+        arquivo.seek(0)
+        return _como_dicionarios(valores_xlsx(arquivo))
+    arquivo.seek(0)
+    return ler_linhas_csv(arquivo)
+
+
+def importar_precos_insumos(restaurante_id, linhas, usuario=None, perfil=""):
+    """Aplica preços e pesos de insumos em lote e devolve um relatório por linha.
+
+    Cada linha identifica o insumo por 'id' ou 'nome' e traz 'preco' e,
+    opcionalmente, 'peso'. Todas as linhas são validadas em uma única passagem
+    contra os insumos do restaurante; as válidas são gravadas com bulk_update,
+    o histórico de preços com bulk_create e o custo das receitas e fichas
+    afetadas é recalculado uma única vez para o lote todo.
+    """
+    from .cache_catalogo import agendar_invalidacao
+    from .recalculo import recalcular
+
+    insumos = {
+        insumo_id: [nome, preco, peso]
+        for insumo_id, nome, preco, peso in Insumo.objects.filter(restaurante_id=restaurante_id).values_list(
+            'id', 'nome', 'preco', 'peso'
+        )
+    }
+    por_nome = {}
+    for insumo_id, (nome, _, _) in insumos.items():
+        por_nome.setdefault(nome.strip().lower(), []).append(insumo_id)
+
+    relatorio = []
+    alterados = {}
+    vistos = set()
+    for numero, linha in enumerate(linhas, start=1):
+        resultado = {'linha': numero, 'insumo': None, 'status': 'erro', 'erros': []}
+        relatorio.append(resultado)
+        erros = resultado['erros']
+
+        identificador = str(linha.get('id') or '').strip()
+        nome = str(linha.get('nome') or '').strip()
+        insumo_id = None
+        if identificador:
+            try:
+                insumo_id = int(identificador)
+            except ValueError:
+                erros.append(f"id inválido: {identificador!r}")
+            else:
+                if insumo_id not in insumos:
+                    erros.append(f"insumo {insumo_id} não encontrado neste restaurante")
+                    insumo_id = None
+        elif nome:
+            encontrados = por_nome.get(nome.lower(), [])
+            if len(encontrados) == 1:
+                insumo_id = encontrados[0]
+            elif encontrados:
+                erros.append(f"nome {nome!r} corresponde a mais de um insumo; informe o id")
+            else:
+                erros.append(f"insumo {nome!r} não encontrado neste restaurante")
+        else:
+            erros.append("informe o id ou o nome do insumo")
+
+        try:
+            preco = ler_decimal(linha.get('preco'), 2)
+            if preco is None:
+                erros.append("preço obrigatório")
+            elif preco < 0 or preco >= Decimal('1e8'):
+                erros.append("preço fora do intervalo permitido")
+        except ValueError as e:
+            erros.append(f"preço {e}")
+            preco = None
+        try:
+            peso = ler_decimal(linha.get('peso'), 3)
+            if peso is not None and (peso <= 0 or peso >= Decimal('1e7')):
+                erros.append("peso fora do intervalo permitido")
+        except ValueError as e:
+            erros.append(f"peso {e}")
+            peso = None
+
+        if insumo_id is not None:
+            resultado['insumo'] = insumo_id
+            if insumo_id in vistos:
+                erros.append("insumo repetido na importação")
+            vistos.add(insumo_id)
+        if erros:
+            continue
+
+        dados = insumos[insumo_id]
+        novo_peso = peso if peso is not None else dados[2]
+        if preco == dados[1] and novo_peso == dados[2]:
+            resultado['status'] = 'sem_alteracao'
+            continue
+        alterados[insumo_id] = (preco, novo_peso, preco != dados[1])
+        resultado['status'] = 'atualizado'
+
+    receitas_recalculadas = fichas_recalculadas = 0
+    if alterados:
+        with transaction.atomic():
+            Insumo.objects.bulk_update(
+                [Insumo(id=insumo_id, preco=preco, peso=peso) for insumo_id, (preco, peso, _) in alterados.items()],
+                ['preco', 'peso'],
+                batch_size=500,
+            )
+            HistoricoPrecoInsumo.objects.bulk_create(
+                [
+                    HistoricoPrecoInsumo(insumo_id=insumo_id, preco=preco)
+                    for insumo_id, (preco, _, preco_mudou) in alterados.items() if preco_mudou
+                ],
+                batch_size=500,
+            )
+            receitas_recalculadas, fichas_recalculadas = recalcular(insumo_ids=list(alterados))
+            agendar_invalidacao(restaurante_ids=[restaurante_id], insumo_ids=list(alterados))
+            registrar_atividade(
+                usuario=usuario,
+                perfil=perfil,
+                tipo="insumo",
+                acao="editado",
+                nome="Importação de preços",
+                descricao=f"{len(alterados)} insumos atualizados por importação em lote",
+                restaurante_id=restaurante_id,
+            )
+
+    return {
+        'linhas': relatorio,
+        'atualizados': len(alterados),
+        'sem_alteracao': sum(1 for r in relatorio if r['status'] == 'sem_alteracao'),
+        'erros': sum(1 for r in relatorio if r['status'] == 'erro'),
+        'receitas_recalculadas': receitas_recalculadas,
+        'fichas_recalculadas': fichas_recalculadas,
+    }
+
+
+def _preenchido(linha, campo):
+    return str(linha.get(campo) if linha.get(campo) is not None else '').strip() != ''
+
+
+def _mapa_de_nomes(queryset):
+    """{nome em minúsculas: [ids]} dos objetos do queryset"""
+    por_nome = {}
+    for obj_id, nome in queryset.values_list('id', 'nome'):
+        por_nome.setdefault(nome.strip().lower(), []).append(obj_id)
+    return por_nome
+
+
+def _referencia(linha, campo):
+    """(id ou None, nome ou None) informados em '<campo>_id' e '<campo>'; None se as duas colunas estão vazias"""
+    numero = nome = None
+    if _preenchido(linha, f'{campo}_id'):
+        texto = str(linha[f'{campo}_id']).strip()
+        try:
+            numero = Decimal(texto)
+        except InvalidOperation:
+            raise ValueError(f"{campo}_id inválido: {texto!r}")
+        if not numero.is_finite() or numero != numero.to_integral_value():
+            raise ValueError(f"{campo}_id inválido: {texto!r}")
+        numero = int(numero)
+    if _preenchido(linha, campo):
+        nome = str(linha[campo]).strip()
+    if numero is None and nome is None:
+        return None
+    return numero, nome
+
+
+def _resolver(referencia, por_nome, ids, rotulo, erros):
+    """Id existente para a referência, ou None com o motivo acrescentado a erros.
+
+    O id vale quando é deste restaurante; senão (como em uma planilha exportada
+    de outro restaurante) o objeto é procurado pelo nome, se houver.
+    """
+    numero, nome = referencia
+    if numero is not None and (numero in ids or nome is None):
+        if numero in ids:
+            return numero
+        erros.append(f"{rotulo} {numero} não encontrado neste restaurante")
+        return None
+    encontrados = por_nome.get(nome.lower(), [])
+    if len(encontrados) == 1:
+        return encontrados[0]
+    if encontrados:
+        erros.append(f"nome {nome!r} corresponde a mais de um {rotulo}; informe o id")
+    else:
+        erros.append(f"{rotulo} {nome!r} não encontrado neste restaurante")
+    return None
+
+
+def _ler_texto(linha, campo, campos, erros, limite=None):
+    if campo in campos or not _preenchido(linha, campo):
+        return
+    texto = str(linha[campo]).strip()
+    if limite and len(texto) > limite:
+        erros.append(f"{campo} com mais de {limite} caracteres")
+    else:
+        campos[campo] = texto
+
+
+def _ler_numeros_item(linha, erros):
+    """Quantidade, IC, IPC e aplicar_ic_ipc de um item; None em algum campo inválido"""
+    item = {}
+    try:
+        quantidade = ler_decimal(linha.get('quantidade_utilizada'), 3)
+        if quantidade is None:
+            erros.append("quantidade_utilizada obrigatória")
+        elif quantidade <= 0 or quantidade >= Decimal('1e7'):
+            erros.append("quantidade_utilizada fora do intervalo permitido")
+        item['quantidade_utilizada'] = quantidade
+    except ValueError as e:
+        erros.append(f"quantidade_utilizada {e}")
+    for indice in ('ic', 'ipc'):
+        try:
+            valor = ler_decimal(linha.get(indice), 2)
+            if valor is not None and (valor < 0 or valor >= 1000):
+                erros.append(f"{indice} fora do intervalo permitido")
+            item[indice] = Decimal('100') if valor is None else valor
+        except ValueError as e:
+            erros.append(f"{indice} {e}")
+    try:
+        item['aplicar_ic_ipc'] = ler_booleano(linha.get('aplicar_ic_ipc'))
+    except ValueError as e:
+        erros.append(f"aplicar_ic_ipc {e}")
+    return item
+
+
+def _agrupar(linhas, campo, ler_campos, ler_item, erros):
+    """Lê as linhas uma a uma e as agrupa pelo nome na coluna `campo`.
+
+    Retorna ({nome em minúsculas: {'nome', 'linha', 'campos', 'itens'}}, linhas lidas);
+    os erros de cada linha vão para erros[numero].
+    """
+    grupos = {}
+    total = 0
+    for numero, linha in enumerate(linhas, start=1):
+        total = numero
+        mensagens = []
+        nome = str(linha.get(campo) or '').strip()
+        if not nome:
+            mensagens.append(f"informe o nome na coluna '{campo}'")
+        elif len(nome) > 255:
+            mensagens.append("nome com mais de 255 caracteres")
+        else:
+            grupo = grupos.setdefault(nome.lower(), {'nome': nome, 'linha': numero, 'campos': {}, 'itens': []})
+            ler_campos(linha, grupo['campos'], mensagens)
+            item = ler_item(linha, mensagens)
+            if item is not None:
+                item['linha'] = numero
+                grupo['itens'].append(item)
+        if mensagens:
+            erros.setdefault(numero, []).extend(mensagens)
+    return grupos, total
+
+
+def _alturas(filhos):
+    """Níveis de sub-receitas abaixo de cada receita do grafo {receita: {sub-receitas}}.
+
+    Calculadas das folhas para cima; receitas em ciclo (ou acima de um) ficam de fora.
+    """
+    nos = set(filhos) | {sub for subs in filhos.values() for sub in subs}
+    pendentes = {no: len(filhos.get(no, ())) for no in nos}
+    pais = {}
+    for pai, subs in filhos.items():
+        for sub in subs:
+            pais.setdefault(sub, []).append(pai)
+    fila = [no for no, quantidade in pendentes.items() if quantidade == 0]
+    altura = dict.fromkeys(fila, 0)
+    while fila:
+        no = fila.pop()
+        for pai in pais.get(no, ()):
+            altura[pai] = max(altura.get(pai, 0), altura[no] + 1)
+            pendentes[pai] -= 1
+            if pendentes[pai] == 0:
+                fila.append(pai)
+    return {no: altura[no] for no in nos if pendentes[no] == 0}
+
+
+def _ids_criados(model, restaurante_id, objetos):
+    """Ids dos objetos recém-criados por bulk_create, pelo nome em minúsculas"""
+    if all(obj.pk is not None for obj in objetos):
+        return {obj.nome.lower(): obj.pk for obj in objetos}
+    # Bancos sem RETURNING no INSERT em lote: os nomes são únicos no restaurante
+    criados = model.objects.filter(restaurante_id=restaurante_id, nome__in=[obj.nome for obj in objetos])
+    return {nome.lower(): obj_id for obj_id, nome in criados.values_list('id', 'nome')}
+
+
+def _relatorio(total, grupos, erros, gravar, rotulo):
+    return {
+        'dry_run': not gravar,
+        'gravado': gravar and not erros and bool(grupos),
+        'linhas': total,
+        rotulo: len(grupos),
+        'itens': sum(len(grupo['itens']) for grupo in grupos.values()),
+        'erros': [{'linha': numero, 'erros': mensagens} for numero, mensagens in sorted(erros.items())],
+    }
+
+
+def importar_receitas(restaurante_id, linhas, usuario=None, perfil="", gravar=True):
+    """Cria receitas completas (dados e itens) a partir das linhas de uma planilha.
+
+    Cada linha traz o nome da receita em 'receita' e, opcionalmente, um item:
+    'insumo' (ou 'insumo_id') ou 'subreceita' (ou 'subreceita_id'; pode ser
+    outra receita da própria planilha), com 'quantidade_utilizada', 'ic', 'ipc'
+    e 'aplicar_ic_ipc'. 'tempo_preparo', 'porcao_sugerida', 'rendimento' e
+    'modo_preparo' são lidos da primeira linha da receita em que aparecem.
+
+    Os nomes são resolvidos com mapas carregados uma única vez e tudo é
+    validado antes de gravar: com qualquer erro (ou gravar=False) nada é
+    gravado e o relatório traz os erros por linha. Sem erros, receitas e itens
+    são criados com bulk_create em uma transação, sem disparar os sinais de
+    recálculo, e o custo das novas receitas é calculado uma única vez no final.
+    """
+    from .cache_catalogo import agendar_invalidacao
+    from .recalculo import recalcular
+
+    insumos = _mapa_de_nomes(Insumo.objects.filter(restaurante_id=restaurante_id))
+    ids_insumos = {insumo_id for ids in insumos.values() for insumo_id in ids}
+    existentes = _mapa_de_nomes(Receita.objects.filter(restaurante_id=restaurante_id))
+    ids_existentes = {receita_id for ids in existentes.values() for receita_id in ids}
+
+    def ler_campos(linha, campos, erros):
+        if 'tempo_preparo' not in campos and _preenchido(linha, 'tempo_preparo'):
+            try:
+                tempo = ler_decimal(linha['tempo_preparo'], 0)
+                if tempo is None:
+                    # Preenchido só com 'R$' ou espaços
+                    erros.append(f"tempo_preparo inválido: {linha['tempo_preparo']!r}")
+                elif tempo < 0 or tempo >= 2 ** 31:
+                    erros.append("tempo_preparo fora do intervalo permitido")
+                else:
+                    campos['tempo_preparo'] = int(tempo)
+            except ValueError as e:
+                erros.append(f"tempo_preparo {e}")
+        _ler_texto(linha, 'porcao_sugerida', campos, erros, limite=100)
+        _ler_texto(linha, 'rendimento', campos, erros, limite=100)
+        _ler_texto(linha, 'modo_preparo', campos, erros)
+
+    def ler_item(linha, erros):
+        try:
+            insumo = _referencia(linha, 'insumo')
+            subreceita = _referencia(linha, 'subreceita')
+        except ValueError as e:
+            erros.append(str(e))
+            return None
+        if insumo is None and subreceita is None:
+            if _preenchido(linha, 'quantidade_utilizada'):
+                erros.append("informe o insumo ou a sub-receita do item")
+            return None
+        if insumo is not None and subreceita is not None:
+            erros.append("informe o insumo ou a sub-receita, não os dois")
+            return None
+        item = _ler_numeros_item(linha, erros)
+        if insumo is not None:
+            item['insumo_id'] = _resolver(insumo, insumos, ids_insumos, 'insumo', erros)
+        else:
+            item['subreceita'] = subreceita
+        return item
+
+    erros = {}
+    grupos, total = _agrupar(linhas, 'receita', ler_campos, ler_item, erros)
+
+    filhos = {}
+    for chave, grupo in grupos.items():
+        if chave in existentes:
+            erros.setdefault(grupo['linha'], []).append("já existe uma receita com este nome neste restaurante")
+        for item in grupo['itens']:
+            if 'subreceita' not in item:
+                continue
+            numero, nome = subreceita = item.pop('subreceita')
+            if numero not in ids_existentes and nome is not None and nome.lower() in grupos:
+                item['subreceita_nova'] = nome.lower()
+                filhos.setdefault(('nova', chave), set()).add(('nova', nome.lower()))
+                continue
+            mensagens = []
+            item['receita_sub_id'] = _resolver(subreceita, existentes, ids_existentes, 'receita', mensagens)
+            if mensagens:
+                erros.setdefault(item['linha'], []).extend(mensagens)
+            else:
+                filhos.setdefault(('nova', chave), set()).add(('existente', item['receita_sub_id']))
+    if filhos:
+        # Ciclos e profundidade no grafo das novas receitas com as sub-receitas já gravadas
+        gravadas = ReceitaInsumo.objects.filter(
+            receita__restaurante_id=restaurante_id, receita_sub__isnull=False
+        ).values_list('receita_id', 'receita_sub_id')
+        for receita_id, sub_id in gravadas:
+            filhos.setdefault(('existente', receita_id), set()).add(('existente', sub_id))
+        alturas = _alturas(filhos)
+        limite = settings.PROFUNDIDADE_MAXIMA_SUBRECEITAS
+        for chave, grupo in grupos.items():
+            if ('nova', chave) not in filhos:
+                continue
+            altura = alturas.get(('nova', chave))
+            if altura is None:
+                erros.setdefault(grupo['linha'], []).append("as sub-receitas desta receita formam um ciclo")
+            elif altura > limite:
+                erros.setdefault(grupo['linha'], []).append(f"passa do limite de {limite} níveis de sub-receitas")
+
+    relatorio = _relatorio(total, grupos, erros, gravar, 'receitas')
+    if erros or not gravar or not grupos:
+        return relatorio
+
+    with transaction.atomic():
+        receitas = [
+            Receita(
+                restaurante_id=restaurante_id,
+                nome=grupo['nome'],
+                tempo_preparo=grupo['campos'].get('tempo_preparo', 0),
+                porcao_sugerida=grupo['campos'].get('porcao_sugerida', ''),
+                rendimento=grupo['campos'].get('rendimento'),
+                modo_preparo=grupo['campos'].get('modo_preparo', ''),
+            )
+            for grupo in grupos.values()
+        ]
+        Receita.objects.bulk_create(receitas, batch_size=500)
+        ids = _ids_criados(Receita, restaurante_id, receitas)
+        ReceitaInsumo.objects.bulk_create(
+            [
+                ReceitaInsumo(
+                    receita_id=ids[chave],
+                    insumo_id=item.get('insumo_id'),
+                    receita_sub_id=ids[item['subreceita_nova']] if 'subreceita_nova' in item else item.get('receita_sub_id'),
+                    quantidade_utilizada=item['quantidade_utilizada'],
+                    ic=item['ic'],
+                    ipc=item['ipc'],
+                    aplicar_ic_ipc=item['aplicar_ic_ipc'],
+                )
+                for chave, grupo in grupos.items() for item in grupo['itens']
+            ],
+            batch_size=1000,
+        )
+        recalcular(receita_ids=list(ids.values()))
+        agendar_invalidacao(restaurante_ids=[restaurante_id])
+        registrar_atividade(
+            usuario=usuario,
+            perfil=perfil,
+            tipo="receita",
+            acao="criado",
+            nome="Importação de receitas",
+            descricao=f"{len(ids)} receitas e {relatorio['itens']} itens criados por importação em lote",
+            restaurante_id=restaurante_id,
+        )
+    return relatorio
+
+
+def importar_fichas(restaurante_id, linhas, usuario=None, perfil="", gravar=True):
+    """Cria fichas técnicas completas (dados e itens) a partir das linhas de uma planilha.
+
+    Como importar_receitas: o nome da ficha vem em 'ficha', 'rendimento' e
+    'modo_preparo' na primeira linha em que aparecem e o item, opcional, em
+    'insumo' (ou 'insumo_id') ou 'receita' (ou 'receita_id', uma receita já
+    cadastrada), com 'quantidade_utilizada', 'unidade_medida' (padrão: a do
+    insumo), 'ic', 'ic_tipo', 'ipc' e 'aplicar_ic_ipc'.
+    """
+    from .cache_catalogo import agendar_invalidacao
+    from .recalculo import recalcular
+
+    unidades_insumos = dict(Insumo.objects.filter(restaurante_id=restaurante_id).values_list('id', 'unidade_medida'))
+    insumos = _mapa_de_nomes(Insumo.objects.filter(restaurante_id=restaurante_id))
+    receitas = _mapa_de_nomes(Receita.objects.filter(restaurante_id=restaurante_id))
+    ids_receitas = {receita_id for ids in receitas.values() for receita_id in ids}
+    existentes = _mapa_de_nomes(FichaTecnica.objects.filter(restaurante_id=restaurante_id))
+    unidades = {valor for valor, _ in FichaTecnicaItem._meta.get_field('unidade_medida').choices}
+    tipos_ic = {valor for valor, _ in FichaTecnicaItem._meta.get_field('ic_tipo').choices}
+
+    def ler_campos(linha, campos, erros):
+        _ler_texto(linha, 'rendimento', campos, erros, limite=100)
+        _ler_texto(linha, 'modo_preparo', campos, erros)
+
+    def ler_item(linha, erros):
+        try:
+            insumo = _referencia(linha, 'insumo')
+            receita = _referencia(linha, 'receita')
+        except ValueError as e:
+            erros.append(str(e))
+            return None
+        if insumo is None and receita is None:
+            if _preenchido(linha, 'quantidade_utilizada'):
+                erros.append("informe o insumo ou a receita do item")
+            return None
+        if insumo is not None and receita is not None:
+            erros.append("informe o insumo ou a receita, não os dois")
+            return None
+        item = _ler_numeros_item(linha, erros)
+        if insumo is not None:
+            item['insumo_id'] = _resolver(insumo, insumos, unidades_insumos, 'insumo', erros)
+        else:
+            item['receita_id'] = _resolver(receita, receitas, ids_receitas, 'receita', erros)
+        unidade = str(linha.get('unidade_medida') or '').strip().lower()
+        if not unidade:
+            unidade = unidades_insumos.get(item.get('insumo_id'), 'g')
+        if unidade not in unidades:
+            erros.append(f"unidade_medida inválida: {unidade!r}")
+        item['unidade_medida'] = unidade
+        ic_tipo = str(linha.get('ic_tipo') or '').strip().lower() or 'menos'
+        if ic_tipo not in tipos_ic:
+            erros.append(f"ic_tipo inválido: {ic_tipo!r}")
+        item['ic_tipo'] = ic_tipo
+        return item
+
+    erros = {}
+    grupos, total = _agrupar(linhas, 'ficha', ler_campos, ler_item, erros)
+    for chave, grupo in grupos.items():
+        if chave in existentes:
+            erros.setdefault(grupo['linha'], []).append("já existe uma ficha técnica com este nome neste restaurante")
+
+    relatorio = _relatorio(total, grupos, erros, gravar, 'fichas')
+    if erros or not gravar or not grupos:
+        return relatorio
+
+    with transaction.atomic():
+        fichas = [
+            FichaTecnica(
+                restaurante_id=restaurante_id,
+                nome=grupo['nome'],
+                rendimento=grupo['campos'].get('rendimento', ''),
+                modo_preparo=grupo['campos'].get('modo_preparo', ''),
+            )
+            for grupo in grupos.values()
+        ]
+        FichaTecnica.objects.bulk_create(fichas, batch_size=500)
+        ids = _ids_criados(FichaTecnica, restaurante_id, fichas)
+        FichaTecnicaItem.objects.bulk_create(
+            [
+                FichaTecnicaItem(
+                    ficha_id=ids[chave],
+                    insumo_id=item.get('insumo_id'),
+                    receita_id=item.get('receita_id'),
+                    quantidade_utilizada=item['quantidade_utilizada'],
+                    unidade_medida=item['unidade_medida'],
+                    ic=item['ic'],
+                    ic_tipo=item['ic_tipo'],
+                    ipc=item['ipc'],
+                    aplicar_ic_ipc=item['aplicar_ic_ipc'],
+                )
+                for chave, grupo in grupos.items() for item in grupo['itens']
+            ],
+            batch_size=1000,
+        )
+        recalcular(ficha_ids=list(ids.values()))
+        agendar_invalidacao(restaurante_ids=[restaurante_id])
+        registrar_atividade(
+            usuario=usuario,
+            perfil=perfil,
+            tipo="ficha_tecnica",
+            acao="criado",
+            nome="Importação de fichas técnicas",
+            descricao=f"{len(ids)} fichas técnicas e {relatorio['itens']} itens criados por importação em lote",
+            restaurante_id=restaurante_id,
+        )
+    return relatorio
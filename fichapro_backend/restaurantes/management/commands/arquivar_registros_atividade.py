@@ -0,0 +1,46 @@
+"""Aplica a política de retenção do registro de atividades.
+
+Os meses anteriores ao corte são gravados em arquivos JSONL comprimidos (um por
+mês) e excluídos do banco em lotes. Pensado para rodar uma vez por mês (cron).
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurantes.retencao import arquivar_mes, corte_de_retencao, meses_anteriores, previa
+
+
+class Command(BaseCommand):
+    help = "Arquiva em JSONL comprimido e exclui do banco os registros de atividade mais antigos que --meses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=getattr(settings, 'RETENCAO_REGISTROS_MESES', 12),
+                            help="Meses mantidos no banco além do atual")
+        parser.add_argument('--destino', default=getattr(settings, 'ARQUIVO_REGISTROS_DIR', None),
+                            help="Pasta dos arquivos registros_atividade_AAAA-MM.jsonl.gz")
+        parser.add_argument('--sem-arquivo', action='store_true', help="Exclui sem gravar os arquivos")
+        parser.add_argument('--lote', type=int, default=5000, help="Registros excluídos por transação")
+        parser.add_argument('--dry-run', action='store_true', help="Apenas conta o que seria arquivado")
+
+    def handle(self, *args, **options):
+        if options['meses'] < 0 or options['lote'] < 1:
+            raise CommandError("--meses não pode ser negativo e --lote deve ser maior que zero")
+        destino = None if options['sem_arquivo'] else options['destino']
+        if destino is None and not options['sem_arquivo']:
+            raise CommandError("Informe --destino ou use --sem-arquivo")
+        antes_de = corte_de_retencao(options['meses'])
+
+        if options['dry_run']:
+            total = 0
+            for inicio, quantidade in previa(antes_de):
+                self.stdout.write(f"{inicio:%m/%Y}: {quantidade} registros")
+                total += quantidade
+            self.stdout.write(f"{total} registros anteriores a {antes_de:%d/%m/%Y} seriam arquivados.")
+            return
+
+        total = 0
+        for inicio in meses_anteriores(antes_de):
+            excluidos, caminho = arquivar_mes(inicio, antes_de, destino, options['lote'])
+            total += excluidos
+            self.stdout.write(f"{inicio:%m/%Y}: {excluidos} registros" + (f" -> {caminho}" if caminho else ""))
+        self.stdout.write(self.style.SUCCESS(f"{total} registros anteriores a {antes_de:%d/%m/%Y} arquivados."))
@@ -0,0 +1,34 @@
+"""Recalcula os resumos lidos pelo dashboard.
+
+O dashboard já recalcula sozinho os resumos de restaurantes cujo catálogo mudou;
+este comando serve para uma atualização agendada (cron) fora do horário de uso
+e, com --usuarios, para refazer os contadores de ações dos usuários a partir de
+todo o registro de atividades.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from restaurantes.resumos import atualizar_resumos, reconstruir_resumos_usuarios
+
+
+class Command(BaseCommand):
+    help = "Recalcula os resumos de restaurantes (e, com --usuarios, de atividades por usuário) do dashboard"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurante', type=int, action='append', dest='restaurantes',
+                            help="Limita a um restaurante (pode ser repetido)")
+        parser.add_argument('--usuarios', action='store_true',
+                            help="Refaz também os contadores de ações por usuário (só conta os registros "
+                                 "ainda no banco, não os já arquivados)")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = atualizar_resumos(options['restaurantes'])
+        self.stdout.write(f"{total} resumos de restaurantes recalculados em {time.perf_counter() - inicio:.1f}s")
+        if options['usuarios']:
+            inicio = time.perf_counter()
+            total = reconstruir_resumos_usuarios()
+            self.stdout.write(f"{total} resumos de usuários refeitos em {time.perf_counter() - inicio:.1f}s")
+        self.stdout.write(self.style.SUCCESS("Resumos atualizados."))
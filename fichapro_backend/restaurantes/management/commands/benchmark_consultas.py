@@ -0,0 +1,170 @@
+"""Mede as consultas mais frequentes por restaurante com e sem os índices compostos.
+
+Cria uma massa de dados sintética dentro de uma transação, mede cada consulta
+sem os índices da migração 0016 e depois com eles, mostrando o EXPLAIN e a
+latência mediana. Ao final a transação é desfeita e o banco fica como estava.
+"""
+
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from restaurantes.models import (
+    CategoriaInsumo, HistoricoPrecoInsumo, Insumo, RegistroAtividade, Restaurante, UsuarioRestaurantePerfil,
+)
+
+INDICES = [
+    (HistoricoPrecoInsumo, 'historico_insumo_data_idx'),
+    (Insumo, 'insumo_rest_categoria_idx'),
+    (Insumo, 'insumo_rest_nome_idx'),
+    (RegistroAtividade, 'registro_data_hora_idx'),
+    (RegistroAtividade, 'registro_tipo_data_idx'),
+    (RegistroAtividade, 'registro_acao_data_idx'),
+]
+
+
+class _Desfazer(Exception):
+    pass
+
+
+@contextmanager
+def _datas_manuais(*campos):
+    """Permite gravar datas arbitrárias em campos auto_now_add durante a carga sintética"""
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = "Compara planos de execução e latências das consultas por restaurante com e sem os índices compostos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurantes', type=int, default=50)
+        parser.add_argument('--insumos', type=int, default=400, help="Insumos por restaurante")
+        parser.add_argument('--historico', type=int, default=20, help="Pontos de histórico de preço por insumo")
+        parser.add_argument('--registros', type=int, default=200000, help="Total de registros de atividade")
+        parser.add_argument('--repeticoes', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                alvos = self._popular(options)
+                consultas = self._consultas(alvos)
+                self._executar_indices('remove_sql')
+                antes = self._medir(consultas, options['repeticoes'])
+                self._executar_indices('create_sql')
+                depois = self._medir(consultas, options['repeticoes'])
+                self._relatorio(consultas, antes, depois)
+                raise _Desfazer
+        except _Desfazer:
+            pass
+
+    def _popular(self, options):
+        rnd = random.Random(42)
+        agora = timezone.now()
+        self.stdout.write("Criando massa de dados sintética...")
+        restaurantes = Restaurante.objects.bulk_create([
+            Restaurante(
+                nome=f"Bench {i}", cnpj=f"bench-{i}", email="bench@example.com", telefone="0",
+                cep="0", rua="-", numero="0", bairro="-", cidade="-", estado="SP",
+            )
+            for i in range(options['restaurantes'])
+        ])
+        categorias = CategoriaInsumo.objects.bulk_create([
+            CategoriaInsumo(nome=f"Categoria {c}", restaurante=r) for r in restaurantes for c in range(8)
+        ])
+        por_restaurante = {}
+        for categoria in categorias:
+            por_restaurante.setdefault(categoria.restaurante_id, []).append(categoria)
+        insumos = Insumo.objects.bulk_create([
+            Insumo(
+                restaurante=r, categoria=rnd.choice(por_restaurante[r.id]), nome=f"Insumo {i}",
+                peso=Decimal('1000'), unidade_medida='g', preco=Decimal(rnd.randint(100, 9999)) / 100,
+            )
+            for r in restaurantes for i in range(options['insumos'])
+        ], batch_size=1000)
+        with _datas_manuais(HistoricoPrecoInsumo._meta.get_field('data'), RegistroAtividade._meta.get_field('data_hora')):
+            HistoricoPrecoInsumo.objects.bulk_create((
+                HistoricoPrecoInsumo(
+                    insumo=insumo, preco=insumo.preco, data=agora - timedelta(days=d * 7, minutes=rnd.randint(0, 1440)),
+                )
+                for insumo in insumos for d in range(options['historico'])
+            ), batch_size=1000)
+            tipos = ['insumo', 'receita', 'ficha_tecnica', 'usuario', 'restaurante']
+            acoes = ['criado', 'editado', 'excluido']
+            RegistroAtividade.objects.bulk_create((
+                RegistroAtividade(
+                    perfil='master', tipo=rnd.choice(tipos), acao=rnd.choice(acoes), nome=f"Bench {i}",
+                    descricao="Registro sintético", data_hora=agora - timedelta(minutes=rnd.randint(0, 525600)),
+                )
+                for i in range(options['registros'])
+            ), batch_size=1000)
+        usuario = User.objects.create(username=f"bench-{agora.timestamp()}")
+        UsuarioRestaurantePerfil.objects.bulk_create([
+            UsuarioRestaurantePerfil(usuario=usuario, restaurante=r, perfil='master') for r in restaurantes
+        ])
+        restaurante = restaurantes[len(restaurantes) // 2]
+        return {
+            'restaurante': restaurante,
+            'categoria': por_restaurante[restaurante.id][0],
+            'insumo': insumos[len(insumos) // 2],
+            'usuario': usuario,
+            'inicio': agora - timedelta(days=30),
+            'fim': agora - timedelta(days=23),
+        }
+
+    def _consultas(self, alvos):
+        return [
+            ("Insumos por restaurante e categoria", lambda: Insumo.objects.filter(
+                restaurante_id=alvos['restaurante'].id, categoria_id=alvos['categoria'].id)),
+            ("Registros por tipo em uma semana", lambda: RegistroAtividade.objects.filter(
+                tipo='receita', data_hora__gte=alvos['inicio'], data_hora__lt=alvos['fim']).order_by('-data_hora')[:50]),
+            ("Registros por ação, mais recentes", lambda: RegistroAtividade.objects.filter(
+                acao='editado').order_by('-data_hora')[:50]),
+            ("Histórico de preço de um insumo", lambda: HistoricoPrecoInsumo.objects.filter(
+                insumo_id=alvos['insumo'].id).order_by('data')),
+            ("Perfil do usuário no restaurante", lambda: UsuarioRestaurantePerfil.objects.filter(
+                usuario_id=alvos['usuario'].id, restaurante_id=alvos['restaurante'].id)),
+        ]
+
+    def _executar_indices(self, operacao):
+        # Editor usado apenas para gerar o SQL; no SQLite, entrar no contexto
+        # dele exigiria desligar as chaves estrangeiras, o que não é possível
+        # dentro de uma transação
+        editor = connection.schema_editor()
+        editor.deferred_sql = []
+        with connection.cursor() as cursor:
+            for model, nome in INDICES:
+                indice = next(i for i in model._meta.indexes if i.name == nome)
+                cursor.execute(str(getattr(indice, operacao)(model, editor)))
+
+    def _medir(self, consultas, repeticoes):
+        resultados = []
+        for _, consulta in consultas:
+            tempos = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                list(consulta())
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            resultados.append((statistics.median(tempos), consulta().explain()))
+        return resultados
+
+    def _relatorio(self, consultas, antes, depois):
+        for (titulo, _), (ms_antes, plano_antes), (ms_depois, plano_depois) in zip(consultas, antes, depois):
+            self.stdout.write(self.style.MIGRATE_HEADING(titulo))
+            self.stdout.write(f"  sem índices: {ms_antes:8.2f} ms")
+            self.stdout.write(f"    {plano_antes}".replace('\n', '\n    '))
+            self.stdout.write(f"  com índices: {ms_depois:8.2f} ms")
+            self.stdout.write(f"    {plano_depois}".replace('\n', '\n    '))
@@ -0,0 +1,143 @@
+"""Mede serialização, renderização JSON e compressão das respostas grandes da API.
+
+Cria dentro de uma transação um restaurante sintético (por padrão com 1.000
+receitas) e um volume de registros de atividade, serializa as listagens como
+os viewsets fazem e compara o JSONRenderer do DRF com o JSONRapidoRenderer
+(orjson), além do tamanho do corpo sem compressão, com gzip e com brotli. Ao
+final a transação é desfeita e o banco fica como estava.
+"""
+
+import gzip
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from restaurantes.custos import recalcular_restaurante
+from restaurantes.models import Insumo, Receita, ReceitaInsumo, RegistroAtividade, Restaurante
+from restaurantes.renderizadores import JSONRapidoRenderer, orjson
+from restaurantes.serializers import ReceitaSerializer, RegistroAtividadeSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class _Desfazer(Exception):
+    pass
+
+
+def _mediana_ms(funcao, repeticoes):
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos), resultado
+
+
+class Command(BaseCommand):
+    help = "Compara tempo de serialização/renderização JSON e bytes transferidos com e sem compressão"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receitas', type=int, default=1000)
+        parser.add_argument('--insumos', type=int, default=300, help="Insumos do restaurante")
+        parser.add_argument('--itens', type=int, default=6, help="Itens por receita")
+        parser.add_argument('--registros', type=int, default=5000, help="Registros de atividade")
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson não instalado: JSONRapidoRenderer usa o renderizador do DRF."))
+        try:
+            with transaction.atomic():
+                restaurante = self._popular(options)
+                self._medir("Receitas (listagem completa, com itens)", self._receitas(restaurante), options)
+                self._medir("Registros de atividade", self._registros(), options)
+                raise _Desfazer
+        except _Desfazer:
+            pass
+
+    def _popular(self, options):
+        rnd = random.Random(42)
+        self.stdout.write("Criando massa de dados sintética...")
+        restaurante = Restaurante.objects.create(
+            nome="Bench serialização", cnpj="bench-serializacao", email="bench@example.com", telefone="0",
+            cep="0", rua="-", numero="0", bairro="-", cidade="-", estado="SP",
+        )
+        insumos = Insumo.objects.bulk_create([
+            Insumo(
+                restaurante=restaurante, nome=f"Insumo {i}", peso=Decimal('1000'), unidade_medida='g',
+                preco=Decimal(rnd.randint(100, 9999)) / 100,
+            )
+            for i in range(options['insumos'])
+        ])
+        receitas = Receita.objects.bulk_create([
+            Receita(
+                restaurante=restaurante, nome=f"Receita {i}", tempo_preparo=rnd.randint(5, 120), porcao_sugerida="1 porção",
+                modo_preparo="Misture os ingredientes e leve ao forno. " * 5, rendimento=None,
+            )
+            for i in range(options['receitas'])
+        ], batch_size=500)
+        itens = []
+        for posicao, receita in enumerate(receitas):
+            for _ in range(options['itens']):
+                itens.append(ReceitaInsumo(
+                    receita=receita, insumo=rnd.choice(insumos), quantidade_utilizada=Decimal(rnd.randint(1, 500)),
+                    ic=Decimal('100'), ipc=Decimal('90'), aplicar_ic_ipc=rnd.random() < 0.5,
+                ))
+            if posicao and rnd.random() < 0.2:
+                itens.append(ReceitaInsumo(receita=receita, receita_sub=receitas[rnd.randrange(posicao)],
+                                           quantidade_utilizada=Decimal('1')))
+        ReceitaInsumo.objects.bulk_create(itens, batch_size=1000)
+        RegistroAtividade.objects.bulk_create([
+            RegistroAtividade(
+                perfil='master', tipo='receita', acao='editado', nome=f"Receita {i}",
+                descricao=f"Receita Receita {i} editada no restaurante {restaurante.nome}",
+            )
+            for i in range(options['registros'])
+        ], batch_size=1000)
+        recalcular_restaurante(restaurante.id)
+        return restaurante
+
+    def _receitas(self, restaurante):
+        qs = Receita.objects.filter(restaurante=restaurante).prefetch_related('itens__insumo', 'itens__receita_sub')
+        return lambda: ReceitaSerializer(qs, many=True).data
+
+    def _registros(self):
+        qs = RegistroAtividade.objects.select_related('usuario').order_by('-data_hora')
+        return lambda: RegistroAtividadeSerializer(qs, many=True).data
+
+    def _medir(self, titulo, serializar, options):
+        repeticoes = options['repeticoes']
+        ms_serializacao, dados = _mediana_ms(serializar, repeticoes)
+        ms_drf, corpo_drf = _mediana_ms(lambda: JSONRenderer().render(dados), repeticoes)
+        ms_rapido, corpo = _mediana_ms(lambda: JSONRapidoRenderer().render(dados), repeticoes)
+        ms_gzip, comprimido_gzip = _mediana_ms(lambda: gzip.compress(corpo, compresslevel=6), repeticoes)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{titulo}: {len(dados)} objetos"))
+        self.stdout.write(f"  serialização (ModelSerializer): {ms_serializacao:8.1f} ms")
+        self.stdout.write(f"  JSON com DRF:                   {ms_drf:8.1f} ms")
+        self.stdout.write(
+            f"  JSON com orjson:                {ms_rapido:8.1f} ms"
+            f" ({ms_drf / ms_rapido if ms_rapido else 0:.1f}x; saída idêntica: {'sim' if corpo == corpo_drf else 'não'})"
+        )
+        self.stdout.write(f"  sem compressão: {len(corpo) / 1024:10.1f} KiB")
+        self.stdout.write(
+            f"  gzip:           {len(comprimido_gzip) / 1024:10.1f} KiB"
+            f" ({len(comprimido_gzip) / len(corpo):.0%}) em {ms_gzip:.1f} ms"
+        )
+        if brotli is not None:
+            ms_br, comprimido_br = _mediana_ms(lambda: brotli.compress(corpo, quality=5), repeticoes)
+            self.stdout.write(
+                f"  brotli:         {len(comprimido_br) / 1024:10.1f} KiB"
+                f" ({len(comprimido_br) / len(corpo):.0%}) em {ms_br:.1f} ms"
+            )
+        else:
+            self.stdout.write("  brotli:         pacote Brotli não instalado")
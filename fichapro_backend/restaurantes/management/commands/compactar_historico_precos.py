@@ -0,0 +1,30 @@
+"""Resume os pontos antigos do histórico de preços em um ponto por insumo e período."""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from restaurantes.historico import AGRUPAMENTOS, compactar_historico
+
+
+class Command(BaseCommand):
+    help = "Compacta o histórico de preços anterior a --dias em um ponto (mín/máx/média/último) por período"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=180, help="Mantém intactos os pontos dos últimos N dias")
+        parser.add_argument('--agrupar', choices=sorted(AGRUPAMENTOS), default='dia')
+        parser.add_argument('--lote', type=int, default=200, help="Insumos processados por transação")
+        parser.add_argument('--dry-run', action='store_true', help="Apenas conta o que seria compactado")
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1 or options['lote'] < 1:
+            raise CommandError("--dias e --lote devem ser maiores que zero")
+        antes_de = timezone.now() - timedelta(days=options['dias'])
+        resumos, excluidas = compactar_historico(
+            antes_de, agrupar=options['agrupar'], insumos_por_lote=options['lote'], gravar=not options['dry_run']
+        )
+        acao = "seriam resumidos" if options['dry_run'] else "resumidos"
+        self.stdout.write(
+            f"{resumos} períodos {acao} ({excluidas} pontos a menos) antes de {antes_de:%d/%m/%Y}."
+        )
@@ -0,0 +1,114 @@
+"""Recalcula custos, pesos e valores sugeridos de todo o catálogo.
+
+Os restaurantes são lidos em lotes com iterator() e calculados em paralelo,
+um lote por vez em cada processo do pool (cada processo com sua própria
+conexão). Dentro de um restaurante o grafo é carregado de uma vez e calculado
+de baixo para cima. A gravação fica no processo principal, com bulk_update e
+uma transação por restaurante, porque o SQLite não aceita escritas
+concorrentes.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from restaurantes.custos import gravar_recalculo, recalcular_restaurante
+from restaurantes.models import Restaurante
+
+
+def _iniciar_processo():
+    # Necessário quando o pool usa spawn (Windows); não faz nada se já configurado
+    django.setup()
+
+
+def _calcular_lote(restaurante_ids):
+    resultados = []
+    for restaurante_id in restaurante_ids:
+        inicio = time.perf_counter()
+        resultado = recalcular_restaurante(restaurante_id, gravar=False)
+        resultado['segundos'] = time.perf_counter() - inicio
+        resultados.append(resultado)
+    return resultados
+
+
+class Command(BaseCommand):
+    help = "Recalcula custos, pesos e valores sugeridos de receitas e fichas técnicas de todos os restaurantes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurante', type=int, action='append', dest='restaurantes',
+                            help="Limita a um restaurante (pode ser repetido)")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Processos calculando em paralelo")
+        parser.add_argument('--lote', type=int, default=10, help="Restaurantes por lote enviado a cada processo")
+        parser.add_argument('--dry-run', action='store_true', help="Calcula e compara, sem gravar")
+        parser.add_argument('--verify', action='store_true', help="Lista cada valor gravado que diverge do calculado")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['lote'] < 1:
+            raise CommandError("--workers e --lote devem ser maiores que zero")
+        gravar = not options['dry_run']
+
+        restaurantes = Restaurante.objects.order_by('id')
+        if options['restaurantes']:
+            restaurantes = restaurantes.filter(id__in=options['restaurantes'])
+        lotes, lote = [], []
+        for restaurante_id in restaurantes.values_list('id', flat=True).iterator(chunk_size=500):
+            lote.append(restaurante_id)
+            if len(lote) == options['lote']:
+                lotes.append(lote)
+                lote = []
+        if lote:
+            lotes.append(lote)
+
+        inicio = time.perf_counter()
+        totais = {'restaurantes': 0, 'receitas': 0, 'fichas': 0, 'receitas_alteradas': 0, 'fichas_alteradas': 0,
+                  'divergencias': 0}
+        for resultados in self._calcular(lotes, options['workers']):
+            for resultado in resultados:
+                if gravar:
+                    with transaction.atomic():
+                        gravar_recalculo(resultado)
+                self._relatar(resultado, totais, options)
+        duracao = time.perf_counter() - inicio
+
+        nos = totais['receitas'] + totais['fichas']
+        self.stdout.write(
+            f"{totais['restaurantes']} restaurantes, {totais['receitas']} receitas e {totais['fichas']} fichas "
+            f"em {duracao:.1f}s ({nos / duracao if duracao else 0:.0f} nós/s, "
+            f"{totais['restaurantes'] / duracao if duracao else 0:.1f} restaurantes/s)"
+        )
+        acao = "a gravar" if not gravar else "gravadas"
+        self.stdout.write(
+            f"Linhas {acao}: {totais['receitas_alteradas']} receitas, {totais['fichas_alteradas']} fichas; "
+            f"{totais['divergencias']} valores divergentes"
+        )
+        if gravar:
+            self.stdout.write(self.style.SUCCESS("Recálculo concluído."))
+
+    def _calcular(self, lotes, workers):
+        if workers == 1 or len(lotes) <= 1:
+            for lote in lotes:
+                yield _calcular_lote(lote)
+            return
+        # Os processos abrem suas próprias conexões; a do processo principal não pode ser herdada
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_processo) as pool:
+            yield from pool.map(_calcular_lote, lotes)
+
+    def _relatar(self, resultado, totais, options):
+        totais['restaurantes'] += 1
+        for chave in ('receitas', 'fichas', 'receitas_alteradas', 'fichas_alteradas'):
+            totais[chave] += resultado[chave]
+        totais['divergencias'] += len(resultado['divergencias'])
+        if options['verbosity'] >= 2:
+            self.stdout.write(
+                f"Restaurante {resultado['restaurante']}: {resultado['receitas']} receitas, "
+                f"{resultado['fichas']} fichas, {resultado['receitas_alteradas'] + resultado['fichas_alteradas']} "
+                f"alteradas em {resultado['segundos']:.2f}s"
+            )
+        if options['verify']:
+            for tipo, obj_id, nome, campo, gravado, calculado in resultado['divergencias']:
+                self.stdout.write(f"  {tipo} {obj_id} '{nome}': {campo} gravado={gravado} calculado={calculado}")
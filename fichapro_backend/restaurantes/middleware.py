@@ -0,0 +1,101 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from .atividades import RequisicaoAtual, coletar_atividades
+from .cache_catalogo import coletar_invalidacoes
+from .recalculo import coletar_recalculos
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # dependência opcional: sem ela, só gzip
+
+
+class RegistroAtividadeMiddleware:
+    """Associa os eventos de atividade ao usuário da requisição e os grava em lote no final"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with RequisicaoAtual(request), coletar_atividades():
+            return self.get_response(request)
+
+
+class RecalculoCustosMiddleware:
+    """Une os recálculos de custo agendados durante a requisição em um único passo no final"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with coletar_recalculos():
+            return self.get_response(request)
+
+
+class CacheCatalogoMiddleware:
+    """Une as invalidações do cache e dos ETags do catálogo da requisição em uma única atualização no final.
+
+    Deve vir antes de RecalculoCustosMiddleware, para incluir os restaurantes
+    alterados pelo recálculo feito ao final da requisição.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with coletar_invalidacoes():
+            return self.get_response(request)
+
+
+class CompressaoMiddleware:
+    """Comprime as respostas com brotli, quando o pacote Brotli está instalado e o cliente aceita, ou com gzip.
+
+    Corpos menores que settings.COMPRESSAO_TAMANHO_MINIMO saem sem compressão,
+    porque o ganho não paga o custo. Respostas em streaming usam gzip. Como no
+    GZipMiddleware do Django, o gzip recebe bytes aleatórios no cabeçalho
+    (mitigação do BREACH) e o ETag passa a ser fraco.
+    """
+    aceita_br = re.compile(r'\bbr\b')
+    aceita_gzip = re.compile(r'\bgzip\b')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.tamanho_minimo = getattr(settings, 'COMPRESSAO_TAMANHO_MINIMO', 1024)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or getattr(response, 'is_async', False):
+            return response
+        if not response.streaming and len(response.content) < self.tamanho_minimo:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        aceitas = request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+        if response.streaming:
+            if not self.aceita_gzip.search(aceitas):
+                return response
+            response.streaming_content = compress_sequence(response.streaming_content, max_random_bytes=100)
+            del response.headers['Content-Length']
+            codificacao = 'gzip'
+        elif brotli is not None and self.aceita_br.search(aceitas):
+            response.content = brotli.compress(response.content, quality=5)
+            codificacao = 'br'
+        elif self.aceita_gzip.search(aceitas):
+            comprimido = compress_string(response.content, max_random_bytes=100)
+            if len(comprimido) >= len(response.content):
+                return response
+            response.content = comprimido
+            codificacao = 'gzip'
+        else:
+            return response
+        if not response.streaming:
+            response.headers['Content-Length'] = str(len(response.content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = codificacao
+        return response
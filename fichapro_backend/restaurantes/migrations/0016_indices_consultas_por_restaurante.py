@@ -0,0 +1,39 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurantes', '0015_historicoprecoinsumo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicoprecoinsumo',
+            index=models.Index(fields=['insumo', 'data'], name='historico_insumo_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insumo',
+            index=models.Index(fields=['restaurante', 'categoria'], name='insumo_rest_categoria_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insumo',
+            index=models.Index(fields=['restaurante', 'nome'], name='insumo_rest_nome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroatividade',
+            index=models.Index(fields=['-data_hora'], name='registro_data_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroatividade',
+            index=models.Index(fields=['tipo', '-data_hora'], name='registro_tipo_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroatividade',
+            index=models.Index(fields=['acao', '-data_hora'], name='registro_acao_data_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurantes', '0016_indices_consultas_por_restaurante'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fichatecnica',
+            name='custo_calculado_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='receita',
+            name='custo_calculado_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
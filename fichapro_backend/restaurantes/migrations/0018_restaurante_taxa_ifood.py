@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:21
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurantes', '0017_custo_calculado_em'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurante',
+            name='taxa_ifood',
+            field=models.DecimalField(decimal_places=4, default=Decimal('0.12'), help_text='Acréscimo do iFood sobre o valor de venda (0.12 = 12%)', max_digits=5),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurantes', '0018_restaurante_taxa_ifood'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComposicaoInsumo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.FloatField()),
+                ('profundidade', models.PositiveSmallIntegerField(default=0, help_text='0 quando o insumo é usado diretamente')),
+                ('ficha', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='composicao', to='restaurantes.fichatecnica')),
+                ('insumo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='composicoes', to='restaurantes.insumo')),
+                ('receita', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='composicao', to='restaurantes.receita')),
+                ('restaurante', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='composicoes', to='restaurantes.restaurante')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['restaurante', 'ficha'], name='composicao_rest_ficha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurantes', '0019_composicao_insumo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicoprecoinsumo',
+            name='pontos',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='historicoprecoinsumo',
+            name='preco_maximo',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicoprecoinsumo',
+            name='preco_medio',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicoprecoinsumo',
+            name='preco_minimo',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+    ]
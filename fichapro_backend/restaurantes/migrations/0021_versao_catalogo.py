@@ -0,0 +1,23 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurantes', '0020_historico_preco_compactado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoCatalogo',
+            fields=[
+                ('restaurante', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='versao_catalogo', serialize=False, to='restaurantes.restaurante')),
+                ('versao', models.PositiveBigIntegerField(default=0)),
+                ('alterado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def preencher_resumos_usuarios(apps, schema_editor):
+    """Soma em ResumoUsuario os registros de atividade já existentes"""
+    RegistroAtividade = apps.get_model('restaurantes', 'RegistroAtividade')
+    ResumoUsuario = apps.get_model('restaurantes', 'ResumoUsuario')
+    linhas = (
+        RegistroAtividade.objects.filter(usuario__isnull=False).values('usuario_id').annotate(
+            ultima_atividade=Max('data_hora'),
+            criados=Count('id', filter=Q(acao='criado')),
+            editados=Count('id', filter=Q(acao='editado')),
+            excluidos=Count('id', filter=Q(acao='excluido')),
+        ).order_by()
+    )
+    ResumoUsuario.objects.bulk_create([ResumoUsuario(**linha) for linha in linhas], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('restaurantes', '0021_versao_catalogo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoRestaurante',
+            fields=[
+                ('restaurante', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo', serialize=False, to='restaurantes.restaurante')),
+                ('total_insumos', models.PositiveIntegerField(default=0)),
+                ('total_receitas', models.PositiveIntegerField(default=0)),
+                ('total_fichas', models.PositiveIntegerField(default=0)),
+                ('custo_total_receitas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('custo_medio_receitas', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('custo_total_fichas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('custo_medio_fichas', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('maiores_custos', models.JSONField(blank=True, default=list)),
+                ('versao_catalogo', models.PositiveBigIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumoUsuario',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo_atividades', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('criados', models.PositiveIntegerField(default=0)),
+                ('editados', models.PositiveIntegerField(default=0)),
+                ('excluidos', models.PositiveIntegerField(default=0)),
+                ('ultima_atividade', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='registroatividade',
+            name='restaurante',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='registros_atividade', to='restaurantes.restaurante'),
+        ),
+        migrations.RunPython(preencher_resumos_usuarios, migrations.RunPython.noop),
+    ]
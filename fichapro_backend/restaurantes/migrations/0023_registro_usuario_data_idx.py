@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurantes', '0022_resumos_dashboard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registroatividade',
+            index=models.Index(fields=['usuario', '-data_hora'], name='registro_usuario_data_idx'),
+        ),
+    ]
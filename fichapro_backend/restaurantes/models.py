@@ -5,9 +5,13 @@ from django.contrib.auth.models import User, Group
 from django.contrib.auth import get_user_model
 from django.contrib.auth.signals import user_logged_in
 from django.utils import timezone
+from decimal import Decimal
 
 User = get_user_model()
 
+# Acréscimo padrão do iFood sobre o valor de venda (12%)
+TAXA_IFOOD_PADRAO = Decimal('0.12')
+
 # Create your models here.
 
 class Restaurante(models.Model):
@@ -25,6 +29,21 @@ class Restaurante(models.Model):
     cidade = models.CharField(max_length=255)
     estado = models.CharField(max_length=2)
     fator_correcao = models.DecimalField(max_digits=5, decimal_places=2, default=1.00)
+    taxa_ifood = models.DecimalField(
+        max_digits=5, decimal_places=4, default=TAXA_IFOOD_PADRAO,
+        help_text="Acréscimo do iFood sobre o valor de venda (0.12 = 12%)"
+    )
+
+    def save(self, *args, **kwargs):
+        valores_antigos = None
+        if self.pk:
+            valores_antigos = Restaurante.objects.filter(pk=self.pk).values_list('fator_correcao', 'taxa_ifood').first()
+        # Lido pelo sinal que atualiza os valores sugeridos de receitas e fichas
+        self._precificacao_alterada = (
+            valores_antigos is not None and valores_antigos != (self.fator_correcao, self.taxa_ifood)
+        )
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.nome
 
@@ -39,6 +58,17 @@ class HistoricoPrecoInsumo(models.Model):
     insumo = models.ForeignKey('Insumo', on_delete=models.CASCADE, related_name='historico_precos')
     preco = models.DecimalField(max_digits=10, decimal_places=2)
     data = models.DateTimeField(auto_now_add=True)
+    # Preenchidos quando a linha resume vários pontos antigos (compactar_historico_precos);
+    # nesse caso preco e data são os do último ponto do período
+    preco_minimo = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    preco_maximo = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    preco_medio = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    pontos = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['insumo', 'data'], name='historico_insumo_data_idx'),
+        ]
 
     def __str__(self):
         return f"{self.insumo.nome} - {self.preco} em {self.data.strftime('%d/%m/%Y')}"
@@ -56,15 +86,24 @@ class Insumo(models.Model):
     unidade_medida = models.CharField(max_length=2, choices=UNIDADES)
     preco = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurante', 'categoria'], name='insumo_rest_categoria_idx'),
+            models.Index(fields=['restaurante', 'nome'], name='insumo_rest_nome_idx'),
+        ]
+
     def __str__(self):
         return f"{self.nome} ({self.restaurante.nome})"
 
     def save(self, *args, **kwargs):
         preco_antigo = None
+        peso_antigo = None
         if self.pk:
-            insumo_antigo = Insumo.objects.filter(pk=self.pk).first()
-            if insumo_antigo:
-                preco_antigo = insumo_antigo.preco
+            valores_antigos = Insumo.objects.filter(pk=self.pk).values_list('preco', 'peso').first()
+            if valores_antigos:
+                preco_antigo, peso_antigo = valores_antigos
+        # Lido pelo sinal que propaga o novo custo para receitas e fichas
+        self._custo_alterado = preco_antigo is not None and (preco_antigo != self.preco or peso_antigo != self.peso)
         super().save(*args, **kwargs)
         if preco_antigo is None or preco_antigo != self.preco:
             HistoricoPrecoInsumo.objects.create(insumo=self, preco=self.preco)
@@ -81,6 +120,8 @@ class Receita(models.Model):
     imagem = models.ImageField(upload_to='receitas/', null=True, blank=True)
     valor_restaurante = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     valor_ifood = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Momento do último cálculo de custo_total/peso_final; nulo enquanto nunca calculados
+    custo_calculado_em = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.nome} ({self.restaurante.nome})"
@@ -111,6 +152,8 @@ class FichaTecnica(models.Model):
     imagem = models.ImageField(upload_to='fichas_tecnicas/', null=True, blank=True)
     valor_restaurante = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     valor_ifood = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Momento do último cálculo de custo_total/peso_final; nulo enquanto nunca calculados
+    custo_calculado_em = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.nome} ({self.restaurante.nome})"
@@ -133,94 +176,67 @@ class FichaTecnicaItem(models.Model):
             return f"{self.receita.nome} na ficha {self.ficha.nome}"
         return f"Item na ficha {self.ficha.nome}"
 
+class ComposicaoInsumo(models.Model):
+    """Fechamento transitivo da composição: quanto de cada insumo entra em uma receita ou ficha.
+
+    Há uma linha por (receita ou ficha, insumo) somando todos os caminhos, diretos
+    ou por sub-receitas. A quantidade é a bruta, na unidade do insumo, já corrigida
+    por IC/IPC, para uma receita ou ficha inteira. Mantida pelo recálculo de
+    custos; não deve ser editada diretamente.
+    """
+    restaurante = models.ForeignKey(Restaurante, on_delete=models.CASCADE, related_name="composicoes")
+    receita = models.ForeignKey(Receita, on_delete=models.CASCADE, null=True, blank=True, related_name="composicao")
+    ficha = models.ForeignKey(FichaTecnica, on_delete=models.CASCADE, null=True, blank=True, related_name="composicao")
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name="composicoes")
+    quantidade = models.FloatField()
+    profundidade = models.PositiveSmallIntegerField(default=0, help_text="0 quando o insumo é usado diretamente")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurante', 'ficha'], name='composicao_rest_ficha_idx'),
+        ]
+
+    def __str__(self):
+        dono = self.ficha or self.receita
+        return f"{self.quantidade} de {self.insumo.nome} em {dono.nome}"
+
+class VersaoCatalogo(models.Model):
+    """Versão do catálogo (categorias, insumos, receitas e fichas) de um restaurante.
+
+    Usada nas chaves de cache e nos ETags da API. Incrementada após o commit de
+    qualquer alteração que mude as respostas desses recursos no restaurante. Fica fora de Restaurante para que salvar
+    o restaurante nunca sobrescreva a versão com um valor antigo.
+    """
+    restaurante = models.OneToOneField(Restaurante, on_delete=models.CASCADE, primary_key=True, related_name="versao_catalogo")
+    versao = models.PositiveBigIntegerField(default=0)
+    alterado_em = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.restaurante_id}: versão {self.versao}"
+
 @receiver(post_save, sender=ReceitaInsumo)
 def atualizar_valores_receita_apos_item(sender, instance, **kwargs):
-    """Atualiza custo_total e valores sugeridos da receita quando um item é salvo"""
-    receita = instance.receita
-    from .serializers import ReceitaSerializer
-    serializer = ReceitaSerializer(receita, context={})
-    
-    # Atualiza custo_total
-    custo_total = serializer.get_custo_total(receita)
-    if custo_total is not None:
-        receita.custo_total = custo_total
-        
-        # Calcula valores sugeridos
-        fator = float(receita.restaurante.fator_correcao) if receita.restaurante.fator_correcao else 1.0
-        taxa_ifood = 0.12
-        receita.valor_restaurante = round(float(custo_total) * fator, 2)
-        receita.valor_ifood = round(float(custo_total) * fator * (1 + taxa_ifood), 2)
-        
-        receita.save(update_fields=["custo_total", "valor_restaurante", "valor_ifood"])
+    """Agenda o recálculo da receita (e dependentes) quando um item é salvo"""
+    from .recalculo import agendar_recalculo
+    agendar_recalculo(receita_ids=[instance.receita_id])
 
 @receiver(post_delete, sender=ReceitaInsumo)
 def atualizar_valores_receita_apos_item_deletado(sender, instance, **kwargs):
-    """Atualiza custo_total e valores sugeridos da receita quando um item é deletado"""
-    receita = instance.receita
-    from .serializers import ReceitaSerializer
-    serializer = ReceitaSerializer(receita, context={})
-    
-    # Atualiza custo_total
-    custo_total = serializer.get_custo_total(receita)
-    if custo_total is not None:
-        receita.custo_total = custo_total
-        
-        # Calcula valores sugeridos
-        fator = float(receita.restaurante.fator_correcao) if receita.restaurante.fator_correcao else 1.0
-        taxa_ifood = 0.12
-        receita.valor_restaurante = round(float(custo_total) * fator, 2)
-        receita.valor_ifood = round(float(custo_total) * fator * (1 + taxa_ifood), 2)
-        
-        receita.save(update_fields=["custo_total", "valor_restaurante", "valor_ifood"])
+    """Agenda o recálculo da receita (e dependentes) quando um item é deletado"""
+    from .recalculo import agendar_recalculo
+    agendar_recalculo(receita_ids=[instance.receita_id])
 
 @receiver(post_save, sender=FichaTecnicaItem)
 def atualizar_ficha_tecnica_apos_item(sender, instance, **kwargs):
-    ficha = instance.ficha
-    from .serializers import FichaTecnicaSerializer
-    serializer = FichaTecnicaSerializer(ficha, context={})
-    
-    # Atualiza custo_total e peso_final
-    custo_total = serializer.get_custo_total(ficha)
-    peso_final = serializer.get_peso_final(ficha)
-    
-    if custo_total is not None:
-        ficha.custo_total = custo_total
-        
-        # Calcula valores sugeridos
-        fator = float(ficha.restaurante.fator_correcao) if ficha.restaurante.fator_correcao else 1.0
-        taxa_ifood = 0.12
-        ficha.valor_restaurante = round(float(custo_total) * fator, 2)
-        ficha.valor_ifood = round(float(custo_total) * fator * (1 + taxa_ifood), 2)
-    
-    if peso_final is not None:
-        ficha.peso_final = peso_final
-    
-    ficha.save(update_fields=["custo_total", "peso_final", "valor_restaurante", "valor_ifood"])
+    """Agenda o recálculo da ficha quando um item é salvo"""
+    from .recalculo import agendar_recalculo
+    agendar_recalculo(ficha_ids=[instance.ficha_id])
 
 @receiver(post_delete, sender=FichaTecnicaItem)
 def atualizar_ficha_tecnica_apos_item_deletado(sender, instance, **kwargs):
-    """Atualiza custo_total e valores sugeridos da ficha quando um item é deletado"""
-    ficha = instance.ficha
-    from .serializers import FichaTecnicaSerializer
-    serializer = FichaTecnicaSerializer(ficha, context={})
-    
-    # Atualiza custo_total e peso_final
-    custo_total = serializer.get_custo_total(ficha)
-    peso_final = serializer.get_peso_final(ficha)
-    
-    if custo_total is not None:
-        ficha.custo_total = custo_total
-        
-        # Calcula valores sugeridos
-        fator = float(ficha.restaurante.fator_correcao) if ficha.restaurante.fator_correcao else 1.0
-        taxa_ifood = 0.12
-        ficha.valor_restaurante = round(float(custo_total) * fator, 2)
-        ficha.valor_ifood = round(float(custo_total) * fator * (1 + taxa_ifood), 2)
-    
-    if peso_final is not None:
-        ficha.peso_final = peso_final
-    
-    ficha.save(update_fields=["custo_total", "peso_final", "valor_restaurante", "valor_ifood"])
+    """Agenda o recálculo da ficha quando um item é deletado"""
+    from .recalculo import agendar_recalculo
+    agendar_recalculo(ficha_ids=[instance.ficha_id])
 
 PERFIS = (
     ("administrador", "Administrador"),
@@ -241,7 +257,9 @@ class UsuarioRestaurantePerfil(models.Model):
         return f"{self.usuario.username} - {self.restaurante.nome} ({self.get_perfil_display()})"
 
 class RegistroAtividade(models.Model):
-    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Sem índice próprio: o índice (usuario, -data_hora) atende as buscas por usuário
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, db_index=False)
+    restaurante = models.ForeignKey(Restaurante, on_delete=models.SET_NULL, null=True, blank=True, related_name="registros_atividade")
     perfil = models.CharField(max_length=50)
     tipo = models.CharField(max_length=50)  # insumo, receita, ficha_tecnica, usuario, restaurante
     acao = models.CharField(max_length=20)  # criado, editado, excluido
@@ -249,23 +267,72 @@ class RegistroAtividade(models.Model):
     descricao = models.TextField(blank=True)
     data_hora = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-data_hora'], name='registro_data_hora_idx'),
+            models.Index(fields=['tipo', '-data_hora'], name='registro_tipo_data_idx'),
+            models.Index(fields=['acao', '-data_hora'], name='registro_acao_data_idx'),
+            models.Index(fields=['usuario', '-data_hora'], name='registro_usuario_data_idx'),
+        ]
+
     def __str__(self):
         return f"{self.tipo} {self.acao} por {self.usuario} em {self.data_hora}"
 
+class ResumoRestaurante(models.Model):
+    """Números do catálogo de um restaurante lidos pelo dashboard (ver resumos.py).
+
+    Recalculado quando a versão do catálogo (VersaoCatalogo) muda, na primeira
+    leitura depois da alteração, ou por atualizar_resumos.
+    """
+    restaurante = models.OneToOneField(Restaurante, on_delete=models.CASCADE, primary_key=True, related_name="resumo")
+    total_insumos = models.PositiveIntegerField(default=0)
+    total_receitas = models.PositiveIntegerField(default=0)
+    total_fichas = models.PositiveIntegerField(default=0)
+    custo_total_receitas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    custo_medio_receitas = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    custo_total_fichas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    custo_medio_fichas = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    # Até cinco receitas/fichas de maior custo: [{'tipo', 'id', 'nome', 'custo_total'}]
+    maiores_custos = models.JSONField(default=list, blank=True)
+    versao_catalogo = models.PositiveBigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Resumo de {self.restaurante_id}"
+
+class ResumoUsuario(models.Model):
+    """Total de ações de cada usuário no registro de atividades, somado na gravação dos registros"""
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="resumo_atividades")
+    criados = models.PositiveIntegerField(default=0)
+    editados = models.PositiveIntegerField(default=0)
+    excluidos = models.PositiveIntegerField(default=0)
+    ultima_atividade = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Atividades de {self.usuario_id}"
+
 # Signals para registrar atividades
-def registrar_atividade(usuario, perfil, tipo, acao, nome, descricao=""):
-    """Função auxiliar para registrar atividades"""
-    try:
-        RegistroAtividade.objects.create(
-            usuario=usuario,
-            perfil=perfil,
-            tipo=tipo,
-            acao=acao,
-            nome=nome,
-            descricao=descricao
-        )
-    except Exception as e:
-        print(f"Erro ao registrar atividade: {e}")
+def registrar_atividade(usuario, perfil, tipo, acao, nome, descricao="", restaurante_id=None):
+    """Função auxiliar para registrar atividades.
+
+    Sem usuário informado, usa o da requisição atual; o perfil é resolvido no
+    restaurante_id. A gravação é feita em lote depois do commit.
+    """
+    from .atividades import enfileirar, usuario_atual
+    if usuario is None:
+        usuario = usuario_atual()
+    if usuario is not None and not perfil:
+        from .permissoes import is_admin, get_perfil_usuario_restaurante
+        perfil = "administrador" if is_admin(usuario) else get_perfil_usuario_restaurante(usuario, restaurante_id) or ""
+    enfileirar(RegistroAtividade(
+        usuario=usuario,
+        restaurante_id=restaurante_id,
+        perfil=perfil,
+        tipo=tipo,
+        acao=acao,
+        nome=nome,
+        descricao=descricao
+    ))
 
 # Signal para Restaurante
 @receiver(post_save, sender=Restaurante)
@@ -277,7 +344,8 @@ def registrar_restaurante(sender, instance, created, **kwargs):
             tipo="restaurante",
             acao="criado",
             nome=instance.nome,
-            descricao=f"Restaurante {instance.nome} criado"
+            descricao=f"Restaurante {instance.nome} criado",
+            restaurante_id=instance.id
         )
     else:
         registrar_atividade(
@@ -286,7 +354,8 @@ def registrar_restaurante(sender, instance, created, **kwargs):
             tipo="restaurante",
             acao="editado",
             nome=instance.nome,
-            descricao=f"Restaurante {instance.nome} editado"
+            descricao=f"Restaurante {instance.nome} editado",
+            restaurante_id=instance.id
         )
 
 @receiver(post_delete, sender=Restaurante)
@@ -297,7 +366,8 @@ def registrar_restaurante_excluido(sender, instance, **kwargs):
         tipo="restaurante",
         acao="excluido",
         nome=instance.nome,
-        descricao=f"Restaurante {instance.nome} excluído"
+        descricao=f"Restaurante {instance.nome} excluído",
+        restaurante_id=instance.id
     )
 
 # Signal para Insumo
@@ -310,7 +380,8 @@ def registrar_insumo(sender, instance, created, **kwargs):
             tipo="insumo",
             acao="criado",
             nome=instance.nome,
-            descricao=f"Insumo {instance.nome} criado no restaurante {instance.restaurante.nome}"
+            descricao=f"Insumo {instance.nome} criado no restaurante {instance.restaurante.nome}",
+            restaurante_id=instance.restaurante_id
         )
     else:
         registrar_atividade(
@@ -319,9 +390,18 @@ def registrar_insumo(sender, instance, created, **kwargs):
             tipo="insumo",
             acao="editado",
             nome=instance.nome,
-            descricao=f"Insumo {instance.nome} editado no restaurante {instance.restaurante.nome}"
+            descricao=f"Insumo {instance.nome} editado no restaurante {instance.restaurante.nome}",
+            restaurante_id=instance.restaurante_id
         )
 
+@receiver(post_save, sender=Insumo)
+def propagar_custos_insumo(sender, instance, created, **kwargs):
+    """Recalcula receitas e fichas que usam o insumo quando preço ou peso mudam"""
+    if created or not getattr(instance, '_custo_alterado', False):
+        return
+    from .recalculo import agendar_recalculo
+    agendar_recalculo(insumo_ids=[instance.pk])
+
 @receiver(post_delete, sender=Insumo)
 def registrar_insumo_excluido(sender, instance, **kwargs):
     registrar_atividade(
@@ -330,7 +410,8 @@ def registrar_insumo_excluido(sender, instance, **kwargs):
         tipo="insumo",
         acao="excluido",
         nome=instance.nome,
-        descricao=f"Insumo {instance.nome} excluído do restaurante {instance.restaurante.nome}"
+        descricao=f"Insumo {instance.nome} excluído do restaurante {instance.restaurante.nome}",
+        restaurante_id=instance.restaurante_id
     )
 
 # Signal para Receita
@@ -343,7 +424,8 @@ def registrar_receita(sender, instance, created, **kwargs):
             tipo="receita",
             acao="criado",
             nome=instance.nome,
-            descricao=f"Receita {instance.nome} criada no restaurante {instance.restaurante.nome}"
+            descricao=f"Receita {instance.nome} criada no restaurante {instance.restaurante.nome}",
+            restaurante_id=instance.restaurante_id
         )
     else:
         registrar_atividade(
@@ -352,7 +434,8 @@ def registrar_receita(sender, instance, created, **kwargs):
             tipo="receita",
             acao="editado",
             nome=instance.nome,
-            descricao=f"Receita {instance.nome} editada no restaurante {instance.restaurante.nome}"
+            descricao=f"Receita {instance.nome} editada no restaurante {instance.restaurante.nome}",
+            restaurante_id=instance.restaurante_id
         )
 
 @receiver(post_delete, sender=Receita)
@@ -363,23 +446,17 @@ def registrar_receita_excluida(sender, instance, **kwargs):
         tipo="receita",
         acao="excluido",
         nome=instance.nome,
-        descricao=f"Receita {instance.nome} excluída do restaurante {instance.restaurante.nome}"
+        descricao=f"Receita {instance.nome} excluída do restaurante {instance.restaurante.nome}",
+        restaurante_id=instance.restaurante_id
     )
 
 @receiver(post_save, sender=Receita)
-def atualizar_valores_sugeridos_receita(sender, instance, **kwargs):
-    # Atualiza valor_restaurante e valor_ifood automaticamente
-    if instance.custo_total is not None:
-        # Verifica se já está atualizando apenas os campos de valor para evitar loop
-        update_fields = kwargs.get('update_fields')
-        if update_fields and set(update_fields).issubset({'valor_restaurante', 'valor_ifood'}):
-            return  # Evita loop infinito
-            
-        fator = float(instance.restaurante.fator_correcao) if instance.restaurante.fator_correcao else 1.0
-        taxa_ifood = 0.12
-        instance.valor_restaurante = round(float(instance.custo_total) * fator, 2)
-        instance.valor_ifood = round(float(instance.custo_total) * fator * (1 + taxa_ifood), 2)
-        instance.save(update_fields=["valor_restaurante", "valor_ifood"])
+def atualizar_valores_sugeridos_receita(sender, instance, update_fields=None, **kwargs):
+    """Agenda o recálculo de custos e valores sugeridos quando a receita é salva pelo usuário"""
+    if update_fields is not None:
+        return  # Gravações internas de campos calculados
+    from .recalculo import agendar_recalculo
+    agendar_recalculo(receita_ids=[instance.pk])
 
 # Signal para FichaTecnica
 @receiver(post_save, sender=FichaTecnica)
@@ -391,7 +468,8 @@ def registrar_ficha_tecnica(sender, instance, created, **kwargs):
             tipo="ficha_tecnica",
             acao="criado",
             nome=instance.nome,
-            descricao=f"Ficha técnica {instance.nome} criada no restaurante {instance.restaurante.nome}"
+            descricao=f"Ficha técnica {instance.nome} criada no restaurante {instance.restaurante.nome}",
+            restaurante_id=instance.restaurante_id
         )
     else:
         registrar_atividade(
@@ -400,7 +478,8 @@ def registrar_ficha_tecnica(sender, instance, created, **kwargs):
             tipo="ficha_tecnica",
             acao="editado",
             nome=instance.nome,
-            descricao=f"Ficha técnica {instance.nome} editada no restaurante {instance.restaurante.nome}"
+            descricao=f"Ficha técnica {instance.nome} editada no restaurante {instance.restaurante.nome}",
+            restaurante_id=instance.restaurante_id
         )
 
 @receiver(post_delete, sender=FichaTecnica)
@@ -411,23 +490,17 @@ def registrar_ficha_tecnica_excluida(sender, instance, **kwargs):
         tipo="ficha_tecnica",
         acao="excluido",
         nome=instance.nome,
-        descricao=f"Ficha técnica {instance.nome} excluída do restaurante {instance.restaurante.nome}"
+        descricao=f"Ficha técnica {instance.nome} excluída do restaurante {instance.restaurante.nome}",
+        restaurante_id=instance.restaurante_id
     )
 
 @receiver(post_save, sender=FichaTecnica)
-def atualizar_valores_sugeridos_ficha(sender, instance, **kwargs):
-    # Atualiza valor_restaurante e valor_ifood automaticamente
-    if instance.custo_total is not None:
-        # Verifica se já está atualizando apenas os campos de valor para evitar loop
-        update_fields = kwargs.get('update_fields')
-        if update_fields and set(update_fields).issubset({'valor_restaurante', 'valor_ifood'}):
-            return  # Evita loop infinito
-            
-        fator = float(instance.restaurante.fator_correcao) if instance.restaurante.fator_correcao else 1.0
-        taxa_ifood = 0.12
-        instance.valor_restaurante = round(float(instance.custo_total) * fator, 2)
-        instance.valor_ifood = round(float(instance.custo_total) * fator * (1 + taxa_ifood), 2)
-        instance.save(update_fields=["valor_restaurante", "valor_ifood"])
+def atualizar_valores_sugeridos_ficha(sender, instance, update_fields=None, **kwargs):
+    """Agenda o recálculo de custos e valores sugeridos quando a ficha é salva pelo usuário"""
+    if update_fields is not None:
+        return  # Gravações internas de campos calculados
+    from .recalculo import agendar_recalculo
+    agendar_recalculo(ficha_ids=[instance.pk])
 
 # Signal para UsuarioRestaurantePerfil
 @receiver(post_save, sender=UsuarioRestaurantePerfil)
@@ -439,7 +512,8 @@ def registrar_usuario_restaurante(sender, instance, created, **kwargs):
             tipo="usuario",
             acao="criado",
             nome=instance.usuario.username,
-            descricao=f"Usuário {instance.usuario.username} vinculado ao restaurante {instance.restaurante.nome} como {instance.get_perfil_display()}"
+            descricao=f"Usuário {instance.usuario.username} vinculado ao restaurante {instance.restaurante.nome} como {instance.get_perfil_display()}",
+            restaurante_id=instance.restaurante_id
         )
     else:
         registrar_atividade(
@@ -448,7 +522,8 @@ def registrar_usuario_restaurante(sender, instance, created, **kwargs):
             tipo="usuario",
             acao="editado",
             nome=instance.usuario.username,
-            descricao=f"Perfil do usuário {instance.usuario.username} editado no restaurante {instance.restaurante.nome}"
+            descricao=f"Perfil do usuário {instance.usuario.username} editado no restaurante {instance.restaurante.nome}",
+            restaurante_id=instance.restaurante_id
         )
 
 @receiver(post_delete, sender=UsuarioRestaurantePerfil)
@@ -459,26 +534,56 @@ def registrar_usuario_restaurante_excluido(sender, instance, **kwargs):
         tipo="usuario",
         acao="excluido",
         nome=instance.usuario.username,
-        descricao=f"Usuário {instance.usuario.username} desvinculado do restaurante {instance.restaurante.nome}"
+        descricao=f"Usuário {instance.usuario.username} desvinculado do restaurante {instance.restaurante.nome}",
+        restaurante_id=instance.restaurante_id
     )
 
 @receiver(post_save, sender=Restaurante)
 def atualizar_valores_sugeridos_ao_mudar_fator(sender, instance, created, **kwargs):
-    if created:
-        return  # Só recalcula em edição
-    # Atualiza todas as receitas
-    for receita in instance.receitas.all():
-        if receita.custo_total is not None:
-            fator = float(instance.fator_correcao) if instance.fator_correcao else 1.0
-            taxa_ifood = 0.12
-            receita.valor_restaurante = round(float(receita.custo_total) * fator, 2)
-            receita.valor_ifood = round(float(receita.custo_total) * fator * (1 + taxa_ifood), 2)
-            receita.save(update_fields=["valor_restaurante", "valor_ifood"])
-    # Atualiza todas as fichas técnicas
-    for ficha in instance.fichas_tecnicas.all():
-        if ficha.custo_total is not None:
-            fator = float(instance.fator_correcao) if instance.fator_correcao else 1.0
-            taxa_ifood = 0.12
-            ficha.valor_restaurante = round(float(ficha.custo_total) * fator, 2)
-            ficha.valor_ifood = round(float(ficha.custo_total) * fator * (1 + taxa_ifood), 2)
-            ficha.save(update_fields=["valor_restaurante", "valor_ifood"])
+    if created or not getattr(instance, '_precificacao_alterada', False):
+        return  # Só recalcula quando o fator de correção ou a taxa do iFood mudam
+    from .custos import atualizar_valores_sugeridos
+    atualizar_valores_sugeridos(instance)
+
+# Invalidação do cache e dos ETags do catálogo (ver cache_catalogo)
+@receiver(post_save, sender=Restaurante)
+def invalidar_catalogo_restaurante(sender, instance, **kwargs):
+    from .cache_catalogo import agendar_invalidacao
+    agendar_invalidacao(restaurante_ids=[instance.pk])
+
+@receiver(post_save, sender=CategoriaInsumo)
+@receiver(post_delete, sender=CategoriaInsumo)
+def invalidar_catalogo_categoria(sender, instance, **kwargs):
+    from .cache_catalogo import agendar_invalidacao
+    agendar_invalidacao(restaurante_ids=[instance.restaurante_id])
+
+@receiver(post_save, sender=Insumo)
+@receiver(post_delete, sender=Insumo)
+def invalidar_catalogo_insumo(sender, instance, **kwargs):
+    """Nomes e custos de insumos aparecem em todas as receitas e fichas que os usam"""
+    from .cache_catalogo import agendar_invalidacao
+    agendar_invalidacao(restaurante_ids=[instance.restaurante_id], insumo_ids=[instance.pk])
+
+@receiver(post_save, sender=Receita)
+@receiver(post_delete, sender=Receita)
+def invalidar_catalogo_receita(sender, instance, **kwargs):
+    from .cache_catalogo import agendar_invalidacao
+    agendar_invalidacao(restaurante_ids=[instance.restaurante_id], receita_ids=[instance.pk])
+
+@receiver(post_save, sender=ReceitaInsumo)
+@receiver(post_delete, sender=ReceitaInsumo)
+def invalidar_catalogo_item_receita(sender, instance, **kwargs):
+    from .cache_catalogo import agendar_invalidacao
+    agendar_invalidacao(receita_ids=[instance.receita_id])
+
+@receiver(post_save, sender=FichaTecnica)
+@receiver(post_delete, sender=FichaTecnica)
+def invalidar_catalogo_ficha(sender, instance, **kwargs):
+    from .cache_catalogo import agendar_invalidacao
+    agendar_invalidacao(restaurante_ids=[instance.restaurante_id])
+
+@receiver(post_save, sender=FichaTecnicaItem)
+@receiver(post_delete, sender=FichaTecnicaItem)
+def invalidar_catalogo_item_ficha(sender, instance, **kwargs):
+    from .cache_catalogo import agendar_invalidacao
+    agendar_invalidacao(ficha_ids=[instance.ficha_id])
@@ -0,0 +1,29 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CursorPaginacao(CursorPagination):
+    """Paginação por cursor em ordem decrescente de id (chave primária, sempre indexada).
+
+    É ativada quando o cliente envia ?cursor= ou ?page_size=; sem esses
+    parâmetros a listagem continua retornando a lista completa, como o
+    frontend atual espera.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = '-id'
+
+    # Com True, pagina mesmo sem ?cursor= e ?page_size=
+    sempre_paginar = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (not self.sempre_paginar
+                and self.cursor_query_param not in request.query_params
+                and self.page_size_query_param not in request.query_params):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class CursorPaginacaoObrigatoria(CursorPaginacao):
+    """Paginação por cursor sempre ativa, para tabelas que crescem sem limite (registro de atividades)"""
+    sempre_paginar = True
@@ -0,0 +1,63 @@
+"""Resolução de perfis de usuários por restaurante.
+
+Os vínculos do usuário são carregados uma única vez e guardados no próprio
+objeto do usuário, que o DRF recria a cada requisição autenticada; assim, uma
+listagem com milhares de receitas consulta os perfis apenas uma vez. O cache
+vive só durante a requisição (não há estado compartilhado entre processos);
+uma alteração nos vínculos do próprio usuário durante a requisição o descarta.
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .atividades import usuario_atual
+from .models import UsuarioRestaurantePerfil
+
+PERFIS_COM_ACESSO = ('master', 'redator', 'usuario_comum')
+
+
+@receiver(post_save, sender=UsuarioRestaurantePerfil)
+@receiver(post_delete, sender=UsuarioRestaurantePerfil)
+def invalidar_perfis(sender, instance, **kwargs):
+    usuarios = [usuario_atual()]
+    if UsuarioRestaurantePerfil.usuario.is_cached(instance):
+        usuarios.append(instance.usuario)
+    for user in usuarios:
+        if user is not None and user.pk == instance.usuario_id:
+            user.__dict__.pop('_perfis_restaurante', None)
+
+
+def perfis_do_usuario(user):
+    """Retorna {restaurante_id: perfil} com todos os vínculos do usuário"""
+    if not user or not hasattr(user, 'is_authenticated') or not user.is_authenticated:
+        return {}
+    perfis = getattr(user, '_perfis_restaurante', None)
+    if perfis is None:
+        perfis = dict(UsuarioRestaurantePerfil.objects.filter(usuario=user).values_list('restaurante_id', 'perfil'))
+        user._perfis_restaurante = perfis
+    return perfis
+
+
+def restaurantes_acessiveis(user):
+    """Ids dos restaurantes em que o usuário tem algum perfil com acesso"""
+    return [restaurante_id for restaurante_id, perfil in perfis_do_usuario(user).items() if perfil in PERFIS_COM_ACESSO]
+
+
+def get_perfil_usuario_restaurante(user, restaurante_id):
+    try:
+        restaurante_id = int(restaurante_id)
+    except (TypeError, ValueError):
+        return None
+    return perfis_do_usuario(user).get(restaurante_id)
+
+def is_admin(user):
+    return user.is_superuser or user.is_staff
+
+def is_master(user, restaurante_id):
+    return get_perfil_usuario_restaurante(user, restaurante_id) == 'master'
+
+def is_redator(user, restaurante_id):
+    return get_perfil_usuario_restaurante(user, restaurante_id) == 'redator'
+
+def is_usuario_comum(user, restaurante_id):
+    return get_perfil_usuario_restaurante(user, restaurante_id) == 'usuario_comum'
@@ -0,0 +1,272 @@
+"""Planilhas CSV e XLSX geradas linha a linha, para respostas em streaming.
+
+linhas_csv() e linhas_xlsx() recebem o cabeçalho e um iterável de linhas
+(listas de valores) e devolvem um gerador de blocos de bytes: o cabeçalho sai
+logo no primeiro bloco e o restante em blocos de cerca de TAMANHO_BLOCO, de
+modo que a memória usada não depende do número de linhas. O XLSX é montado
+sem dependências, com o zipfile gravando em uma saída sem seek e a planilha
+com textos em linha (inlineStr), que dispensa a tabela de textos
+compartilhados.
+
+valores_xlsx() faz o caminho inverso para a importação: lê a primeira aba de
+um XLSX com iterparse, uma linha por vez, descartando cada linha já lida.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from decimal import Decimal
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+TAMANHO_BLOCO = 64 * 1024
+
+TIPO_CSV = 'text/csv; charset=utf-8'
+TIPO_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _texto_csv(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'sim' if valor else 'não'
+    if isinstance(valor, (Decimal, float)):
+        # Vírgula decimal, como o Excel em português espera (e a importação aceita)
+        return str(valor).replace('.', ',')
+    return str(valor)
+
+
+class _Eco:
+    """Destino do csv.writer que devolve a linha formatada em vez de gravá-la"""
+
+    def write(self, valor):
+        return valor
+
+
+def linhas_csv(cabecalho, linhas):
+    """CSV separado por ';' com BOM UTF-8 (para o Excel reconhecer a codificação)"""
+    escritor = csv.writer(_Eco(), delimiter=';')
+    yield ('\ufeff' + escritor.writerow(cabecalho)).encode('utf-8')
+    partes, tamanho = [], 0
+    for linha in linhas:
+        texto = escritor.writerow([_texto_csv(valor) for valor in linha])
+        partes.append(texto)
+        tamanho += len(texto)
+        if tamanho >= TAMANHO_BLOCO:
+            yield ''.join(partes).encode('utf-8')
+            partes, tamanho = [], 0
+    if partes:
+        yield ''.join(partes).encode('utf-8')
+
+
+# Caracteres de controle não são permitidos em XML 1.0
+_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{aba}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_INICIO_PLANILHA = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_FIM_PLANILHA = '</sheetData></worksheet>'
+
+
+def _celula_xlsx(valor):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_INVALIDOS_XML.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _linha_xlsx(valores):
+    return '<row>' + ''.join(_celula_xlsx(valor) for valor in valores) + '</row>'
+
+
+class _Saida(io.RawIOBase):
+    """Arquivo só de escrita e sem seek que acumula o que o zipfile grava até ser esvaziado"""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def esvaziar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def linhas_xlsx(cabecalho, linhas, aba='Planilha1'):
+    """Pasta de trabalho XLSX com uma aba; números e booleanos viram células numéricas"""
+    saida = _Saida()
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED) as pacote:
+        pacote.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        pacote.writestr('_rels/.rels', _RELS)
+        pacote.writestr('xl/workbook.xml', _WORKBOOK.format(aba=escape(aba[:31], {'"': '&quot;'})))
+        pacote.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        with pacote.open('xl/worksheets/sheet1.xml', 'w') as planilha:
+            planilha.write((_INICIO_PLANILHA + _linha_xlsx(cabecalho)).encode('utf-8'))
+            yield saida.esvaziar()
+            partes, tamanho = [], 0
+            for linha in linhas:
+                texto = _linha_xlsx(linha)
+                partes.append(texto)
+                tamanho += len(texto)
+                if tamanho >= TAMANHO_BLOCO:
+                    planilha.write(''.join(partes).encode('utf-8'))
+                    partes, tamanho = [], 0
+                    dados = saida.esvaziar()
+                    if dados:
+                        yield dados
+            planilha.write((''.join(partes) + _FIM_PLANILHA).encode('utf-8'))
+    yield saida.esvaziar()
+
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+
+
+def _indice_coluna(referencia):
+    """Índice (a partir de 0) da coluna de uma referência como 'AB12'"""
+    indice = 0
+    for letra in referencia:
+        if not letra.isalpha():
+            break
+        indice = indice * 26 + ord(letra.upper()) - 64
+    return indice - 1
+
+
+def _texto_rico(elemento):
+    """Texto de um <si> ou <is>: <t> direto ou trechos <r><t>, sem as anotações fonéticas"""
+    partes = []
+    for filho in elemento:
+        if filho.tag == f'{_NS}t':
+            partes.append(filho.text or '')
+        elif filho.tag == f'{_NS}r':
+            partes.extend(t.text or '' for t in filho.iter(f'{_NS}t'))
+    return ''.join(partes)
+
+
+def _caminho_primeira_aba(pacote):
+    aba = ElementTree.fromstring(pacote.read('xl/workbook.xml')).find(f'{_NS}sheets/{_NS}sheet')
+    if aba is None:
+        raise ValueError("a pasta de trabalho não tem abas")
+    relacoes = ElementTree.fromstring(pacote.read('xl/_rels/workbook.xml.rels'))
+    for relacao in relacoes:
+        if relacao.get('Id') == aba.get(_NS_ID):
+            alvo = relacao.get('Target')
+            return alvo[1:] if alvo.startswith('/') else f'xl/{alvo}'
+    raise ValueError("aba não encontrada no pacote")
+
+
+def _textos_compartilhados(pacote):
+    try:
+        arquivo = pacote.open('xl/sharedStrings.xml')
+    except KeyError:
+        return []
+    textos = []
+    with arquivo:
+        for _, elemento in ElementTree.iterparse(arquivo):
+            if elemento.tag == f'{_NS}si':
+                textos.append(_texto_rico(elemento))
+                elemento.clear()
+    return textos
+
+
+def _valor_xlsx(celula, compartilhados):
+    tipo = celula.get('t')
+    if tipo == 'inlineStr':
+        texto = celula.find(f'{_NS}is')
+        return '' if texto is None else _texto_rico(texto)
+    valor = celula.find(f'{_NS}v')
+    valor = '' if valor is None or valor.text is None else valor.text
+    if tipo == 's' and valor:
+        return compartilhados[int(valor)]
+    if tipo == 'e':
+        return ''
+    return valor
+
+
+def _linhas_da_aba(pacote, caminho, compartilhados):
+    try:
+        with pacote, pacote.open(caminho) as aba:
+            dados = None
+            for evento, elemento in ElementTree.iterparse(aba, events=('start', 'end')):
+                if evento == 'start':
+                    if elemento.tag == f'{_NS}sheetData':
+                        dados = elemento
+                    continue
+                if elemento.tag != f'{_NS}row':
+                    continue
+                valores = []
+                for celula in elemento.iter(f'{_NS}c'):
+                    referencia = celula.get('r')
+                    coluna = _indice_coluna(referencia) if referencia else len(valores)
+                    valores.extend([''] * (coluna - len(valores)))
+                    valores.append(_valor_xlsx(celula, compartilhados))
+                # Descarta as linhas já lidas, para a memória não crescer com a planilha
+                if dados is not None:
+                    dados.clear()
+                yield valores
+    except (zipfile.BadZipFile, KeyError, IndexError, ElementTree.ParseError) as e:
+        # A aba só é lida durante a importação: erros de XML, de compressão ou
+        # índices de textos compartilhados inexistentes também viram ValueError
+        raise ValueError(f"planilha XLSX inválida ({e})")
+
+
+def valores_xlsx(arquivo):
+    """Valores (como texto) de cada linha da primeira aba de um arquivo XLSX.
+
+    A estrutura do pacote é conferida antes de retornar, de modo que um arquivo
+    inválido gera ValueError já na chamada; as linhas são lidas sob demanda, e
+    uma aba corrompida gera ValueError durante a leitura.
+    """
+    try:
+        pacote = zipfile.ZipFile(arquivo)
+        caminho = _caminho_primeira_aba(pacote)
+        compartilhados = _textos_compartilhados(pacote)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise ValueError(f"planilha XLSX inválida ({e})")
+    return _linhas_da_aba(pacote, caminho, compartilhados)
@@ -0,0 +1,48 @@
+"""Recálculo de custos agendado para o commit da transação.
+
+Sinais de itens, insumos, receitas e fichas apenas agendam os nós alterados.
+Dentro de uma requisição (ou de um bloco coletar_recalculos()) todos os pedidos
+confirmados são unidos e resolvidos em um único passo: a busca de dependentes
+roda uma vez e cada receita ou ficha afetada recebe no máximo um UPDATE, sem
+gerar registros de atividade.
+"""
+
+from django.db import transaction
+
+from .coleta import ColetorPosCommit
+
+
+def recalcular(insumo_ids=(), receita_ids=(), ficha_ids=()):
+    """Recalcula imediatamente os nós informados e tudo o que depende deles"""
+    from .custos import persistir_composicao, persistir_custos
+    from .dependencias import dependentes
+    receitas, fichas = dependentes(insumo_ids=insumo_ids, receita_ids=receita_ids)
+    motores = {}
+    with transaction.atomic():
+        resultado = persistir_custos(receitas, set(fichas) | set(ficha_ids), motores)
+        if receita_ids or ficha_ids:
+            # A composição só muda com os itens; preço de insumo não a altera
+            if insumo_ids:
+                receitas, fichas = dependentes(receita_ids=receita_ids) if receita_ids else ([], [])
+            persistir_composicao(receitas, set(fichas) | set(ficha_ids), motores)
+    return resultado
+
+
+def _processar(pedidos):
+    insumos, receitas, fichas = set(), set(), set()
+    for insumo_ids, receita_ids, ficha_ids in pedidos:
+        insumos.update(insumo_ids)
+        receitas.update(receita_ids)
+        fichas.update(ficha_ids)
+    recalcular(insumos, receitas, fichas)
+
+
+_coletor = ColetorPosCommit(_processar)
+
+# Acumula os recálculos agendados no bloco e executa todos juntos ao final
+coletar_recalculos = _coletor.coletar
+
+
+def agendar_recalculo(insumo_ids=(), receita_ids=(), ficha_ids=()):
+    """Agenda o recálculo dos nós informados (e dependentes) para depois do commit"""
+    _coletor.adicionar((tuple(insumo_ids), tuple(receita_ids), tuple(ficha_ids)))
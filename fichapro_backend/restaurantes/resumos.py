@@ -0,0 +1,175 @@
+"""Resumos lidos pelo dashboard: números do catálogo por restaurante e ações por usuário.
+
+ResumoRestaurante guarda a versão do catálogo (VersaoCatalogo) com que foi
+calculado. resumos_restaurantes() recalcula antes só os que ficaram para trás,
+com consultas agrupadas por restaurante, e o dashboard lê uma tabela pequena
+em vez de agregar as tabelas inteiras de receitas e fichas. ResumoUsuario é
+somado a cada lote de registros de atividade gravado.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Avg, BigIntegerField, Count, F, Max, Q, Sum, Value, Window
+from django.db.models.functions import Coalesce, Rank, RowNumber
+from django.utils import timezone
+
+from .models import FichaTecnica, Insumo, Receita, RegistroAtividade, Restaurante, ResumoRestaurante, ResumoUsuario
+
+MAIORES_CUSTOS = 5
+
+# Ação do registro de atividade -> contador em ResumoUsuario
+CONTADORES = {'criado': 'criados', 'editado': 'editados', 'excluido': 'excluidos'}
+
+CAMPOS_RESUMO = [
+    'total_insumos', 'total_receitas', 'total_fichas', 'custo_total_receitas', 'custo_medio_receitas',
+    'custo_total_fichas', 'custo_medio_fichas', 'maiores_custos', 'versao_catalogo', 'atualizado_em',
+]
+
+
+def _com_versao(restaurantes):
+    return restaurantes.annotate(
+        versao=Coalesce('versao_catalogo__versao', Value(0), output_field=BigIntegerField())
+    )
+
+
+def _centavos(valor):
+    return None if valor is None else Decimal(valor).quantize(Decimal('0.01'))
+
+
+def _calcular(versoes):
+    """ResumoRestaurante (não gravado) de cada restaurante de {restaurante_id: versão}"""
+    agora = timezone.now()
+    ids = list(versoes)
+    resumos = {
+        restaurante_id: ResumoRestaurante(restaurante_id=restaurante_id, versao_catalogo=versao, atualizado_em=agora)
+        for restaurante_id, versao in versoes.items()
+    }
+    contagem_insumos = Insumo.objects.filter(restaurante_id__in=ids).values('restaurante_id').annotate(total=Count('id'))
+    for linha in contagem_insumos.order_by():
+        resumos[linha['restaurante_id']].total_insumos = linha['total']
+
+    maiores = {restaurante_id: [] for restaurante_id in ids}
+    for model, sufixo, tipo in ((Receita, 'receitas', 'receita'), (FichaTecnica, 'fichas', 'ficha_tecnica')):
+        agregados = model.objects.filter(restaurante_id__in=ids).values('restaurante_id').annotate(
+            total=Count('id'), soma=Sum('custo_total'), media=Avg('custo_total'),
+        )
+        for linha in agregados.order_by():
+            resumo = resumos[linha['restaurante_id']]
+            setattr(resumo, f'total_{sufixo}', linha['total'])
+            setattr(resumo, f'custo_total_{sufixo}', _centavos(linha['soma']) or Decimal('0'))
+            setattr(resumo, f'custo_medio_{sufixo}', _centavos(linha['media']))
+        # Os mais caros de cada restaurante em uma consulta, numerados por restaurante
+        ranking = model.objects.filter(restaurante_id__in=ids, custo_total__isnull=False).annotate(
+            posicao=Window(RowNumber(), partition_by=F('restaurante_id'), order_by=[F('custo_total').desc(), F('id')]),
+        ).filter(posicao__lte=MAIORES_CUSTOS)
+        for restaurante_id, obj_id, nome, custo_total in ranking.values_list('restaurante_id', 'id', 'nome', 'custo_total'):
+            maiores[restaurante_id].append({'tipo': tipo, 'id': obj_id, 'nome': nome, 'custo_total': float(custo_total)})
+    for restaurante_id, itens in maiores.items():
+        itens.sort(key=lambda item: -item['custo_total'])
+        resumos[restaurante_id].maiores_custos = itens[:MAIORES_CUSTOS]
+    return list(resumos.values())
+
+
+def atualizar_resumos(restaurante_ids=None, lote=500):
+    """Recalcula os resumos dos restaurantes informados (ou de todos) e retorna quantos foram gravados"""
+    restaurantes = Restaurante.objects.order_by('id')
+    if restaurante_ids is not None:
+        restaurantes = restaurantes.filter(id__in=restaurante_ids)
+    versoes = list(_com_versao(restaurantes).values_list('id', 'versao'))
+    for inicio in range(0, len(versoes), lote):
+        _gravar(_calcular(dict(versoes[inicio:inicio + lote])))
+    return len(versoes)
+
+
+def _gravar(resumos):
+    with transaction.atomic():
+        ResumoRestaurante.objects.bulk_create(
+            resumos, update_conflicts=True, unique_fields=['restaurante'], update_fields=CAMPOS_RESUMO,
+        )
+
+
+def resumos_restaurantes():
+    """Resumos de todos os restaurantes, recalculando antes os que estão desatualizados"""
+    pendentes = dict(
+        _com_versao(Restaurante.objects.all())
+        .annotate(versao_resumo=F('resumo__versao_catalogo'))
+        .filter(Q(versao_resumo__isnull=True) | ~Q(versao_resumo=F('versao')))
+        .values_list('id', 'versao')
+    )
+    if pendentes:
+        _gravar(_calcular(pendentes))
+    return ResumoRestaurante.objects.select_related('restaurante').only('restaurante__nome', *CAMPOS_RESUMO)
+
+
+def contabilizar_atividades(registros):
+    """Soma os registros de atividade recém-gravados aos contadores de ResumoUsuario"""
+    contagens = {}
+    agora = None
+    for registro in registros:
+        campo = CONTADORES.get(registro.acao)
+        if registro.usuario_id is None or campo is None:
+            continue
+        contagem = contagens.setdefault(registro.usuario_id, {'criados': 0, 'editados': 0, 'excluidos': 0})
+        contagem[campo] += 1
+        if registro.data_hora and (agora is None or registro.data_hora > agora):
+            agora = registro.data_hora
+    if not contagens:
+        return
+    agora = agora or timezone.now()
+    existentes = set(ResumoUsuario.objects.filter(usuario_id__in=contagens).values_list('usuario_id', flat=True))
+    for usuario_id in existentes:
+        incrementos = {campo: F(campo) + valor for campo, valor in contagens[usuario_id].items() if valor}
+        ResumoUsuario.objects.filter(usuario_id=usuario_id).update(ultima_atividade=agora, **incrementos)
+    ResumoUsuario.objects.bulk_create(
+        [
+            ResumoUsuario(usuario_id=usuario_id, ultima_atividade=agora, **contagem)
+            for usuario_id, contagem in contagens.items() if usuario_id not in existentes
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def reconstruir_resumos_usuarios():
+    """Refaz ResumoUsuario a partir de todo o registro de atividades; retorna o número de usuários"""
+    filtros = {campo: Count('id', filter=Q(acao=acao)) for acao, campo in CONTADORES.items()}
+    linhas = (
+        RegistroAtividade.objects.filter(usuario__isnull=False).values('usuario_id')
+        .annotate(ultima_atividade=Max('data_hora'), **filtros).order_by()
+    )
+    resumos = [ResumoUsuario(**linha) for linha in linhas]
+    with transaction.atomic():
+        ResumoUsuario.objects.all().delete()
+        ResumoUsuario.objects.bulk_create(resumos, batch_size=500)
+    return len(resumos)
+
+
+def ranking_autores(inicio=None, fim=None, restaurante_ids=None, usuario_id=None, limite=5):
+    """Os `limite` usuários mais ativos de cada restaurante entre inicio (inclusive) e fim (exclusive).
+
+    Uma única consulta agrupada por restaurante e usuário conta criações,
+    edições e exclusões; a posição (RANK por criações + edições) é calculada
+    no banco e só as linhas dentro do limite voltam (empatados na última
+    posição entram todos). Retorna {restaurante_id: [linhas em ordem de posição]}.
+    """
+    registros = RegistroAtividade.objects.filter(usuario__isnull=False, restaurante__isnull=False)
+    if inicio is not None:
+        registros = registros.filter(data_hora__gte=inicio)
+    if fim is not None:
+        registros = registros.filter(data_hora__lt=fim)
+    if restaurante_ids is not None:
+        registros = registros.filter(restaurante_id__in=restaurante_ids)
+    if usuario_id is not None:
+        registros = registros.filter(usuario_id=usuario_id)
+    contadores = {campo: Count('id', filter=Q(acao=acao)) for acao, campo in CONTADORES.items()}
+    linhas = (
+        registros.values('restaurante_id', 'usuario_id')
+        .annotate(total=Count('id'), pontuacao=Count('id', filter=Q(acao__in=['criado', 'editado'])), **contadores)
+        .annotate(posicao=Window(Rank(), partition_by=F('restaurante_id'), order_by=F('pontuacao').desc()))
+        .filter(posicao__lte=limite)
+        .order_by('restaurante_id', 'posicao', '-total', 'usuario_id')
+    )
+    ranking = {}
+    for linha in linhas:
+        ranking.setdefault(linha.pop('restaurante_id'), []).append(linha)
+    return ranking
@@ -0,0 +1,107 @@
+"""Retenção do registro de atividades: arquivamento por mês e exclusão em lote.
+
+Os registros anteriores ao corte são gravados mês a mês em arquivos JSONL
+comprimidos com gzip (registros_atividade_AAAA-MM.jsonl.gz) e só depois
+excluídos do banco, em lotes, cada lote em sua própria transação. A tabela
+guarda apenas a janela de retenção, e as consultas por período (índices sobre
+data_hora) e as gravações não pesam mais com o passar dos anos. Se um mês for
+arquivado de novo (por exemplo, depois de uma execução interrompida entre a
+gravação do arquivo e a exclusão), as linhas são acrescentadas ao arquivo
+existente como um novo membro gzip; o id de cada linha identifica repetições.
+"""
+
+import gzip
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RegistroAtividade
+
+CAMPOS_ARQUIVO = (
+    'id', 'data_hora', 'usuario_id', 'usuario__username', 'restaurante_id', 'perfil', 'tipo', 'acao', 'nome',
+    'descricao',
+)
+
+
+def _mes(ano, mes):
+    return timezone.make_aware(datetime(ano + (mes - 1) // 12, (mes - 1) % 12 + 1, 1))
+
+
+def corte_de_retencao(meses, agora=None):
+    """Início do mês `meses` meses antes do atual, no fuso atual; registros anteriores saem da tabela"""
+    hoje = timezone.localdate(agora)
+    return _mes(hoje.year, hoje.month - meses)
+
+
+def meses_anteriores(antes_de):
+    """Início (no fuso atual) de cada mês com registros anteriores a antes_de"""
+    return list(RegistroAtividade.objects.filter(data_hora__lt=antes_de).datetimes('data_hora', 'month'))
+
+
+def caminho_do_arquivo(destino, inicio):
+    return Path(destino) / f'registros_atividade_{inicio:%Y-%m}.jsonl.gz'
+
+
+def _escrever(registros, caminho, lote):
+    """Grava os registros em caminho (acrescentando se já existir); retorna (quantidade, maior id)"""
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    temporario = caminho.with_name(caminho.name + '.tmp')
+    quantidade, ultimo = 0, None
+    with gzip.open(temporario, 'wt', encoding='utf-8') as arquivo:
+        for linha in registros.order_by('id').values(*CAMPOS_ARQUIVO).iterator(chunk_size=lote):
+            linha['usuario'] = linha.pop('usuario__username')
+            arquivo.write(json.dumps(linha, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+            quantidade += 1
+            ultimo = linha['id']
+    if not quantidade:
+        temporario.unlink()
+    elif caminho.exists():
+        with open(caminho, 'ab') as final, open(temporario, 'rb') as parte:
+            shutil.copyfileobj(parte, final)
+        temporario.unlink()
+    else:
+        os.replace(temporario, caminho)
+    return quantidade, ultimo
+
+
+def excluir_em_lotes(registros, lote=5000):
+    """Exclui os registros do queryset em lotes de ids, uma transação por lote; retorna quantos saíram"""
+    excluidos = 0
+    while True:
+        with transaction.atomic():
+            ids = list(registros.order_by('id').values_list('id', flat=True)[:lote])
+            if not ids:
+                return excluidos
+            excluidos += RegistroAtividade.objects.filter(id__in=ids).delete()[0]
+
+
+def arquivar_mes(inicio, antes_de, destino=None, lote=5000):
+    """Arquiva em destino (None: só exclui) e exclui os registros do mês iniciado em inicio anteriores a antes_de.
+
+    Retorna (registros excluídos, caminho do arquivo ou None).
+    """
+    fim = min(_mes(inicio.year, inicio.month + 1), antes_de)
+    registros = RegistroAtividade.objects.filter(data_hora__gte=inicio, data_hora__lt=fim)
+    if destino is None:
+        return excluir_em_lotes(registros, lote), None
+    caminho = caminho_do_arquivo(destino, inicio)
+    quantidade, ultimo = _escrever(registros, caminho, lote)
+    if not quantidade:
+        return 0, caminho
+    # Só o que foi gravado no arquivo: registros incluídos depois ficam para a próxima execução
+    return excluir_em_lotes(registros.filter(id__lte=ultimo), lote), caminho
+
+
+def previa(antes_de):
+    """[(início do mês, registros)] do que seria arquivado antes de antes_de"""
+    resultado = []
+    for inicio in meses_anteriores(antes_de):
+        fim = min(_mes(inicio.year, inicio.month + 1), antes_de)
+        resultado.append((inicio, RegistroAtividade.objects.filter(data_hora__gte=inicio, data_hora__lt=fim).count()))
+    return resultado
@@ -1,31 +1,96 @@
 from rest_framework import serializers
 from .models import Restaurante, Insumo, Receita, ReceitaInsumo, FichaTecnica, FichaTecnicaItem, UsuarioRestaurantePerfil, RegistroAtividade, CategoriaInsumo, HistoricoPrecoInsumo
 from django.contrib.auth.models import User
+from .custos import obter_motor
+from .dependencias import validar_subreceita
+from .permissoes import is_admin, is_master
 
-class RestauranteSerializer(serializers.ModelSerializer):
+def campos_da_requisicao(request):
+    """Campos pedidos em ?fields= e ?expand=, ou None quando a resposta deve ser completa"""
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    fields = request.query_params.get('fields')
+    expand = request.query_params.get('expand')
+    if not fields and not expand:
+        return None
+    campos = {campo.strip() for campo in (fields or '').split(',') if campo.strip()}
+    if not fields:
+        # Só ?expand=: campos leves completos mais os expandidos pedidos
+        campos = {'*'}
+    campos.update(campo.strip() for campo in (expand or '').split(',') if campo.strip())
+    return campos
+
+def valores_gravados_validos(contexto, obj):
+    """Indica se custo_total/peso_final gravados podem ser servidos sem recalcular.
+
+    Os valores gravados são mantidos a cada alteração de itens e preços;
+    ?recalcular=1 força um cálculo novo pelo motor de custos.
+    """
+    if obj.custo_calculado_em is None:
+        return False
+    request = contexto.get('request')
+    return getattr(request, 'query_params', {}).get('recalcular') not in ('1', 'true')
+
+class CamposDinamicosMixin:
+    """Permite ao cliente escolher os campos da resposta.
+
+    ?fields=id,nome retorna apenas esses campos; ?expand=itens acrescenta campos
+    listados em Meta.campos_expansiveis (itens aninhados, modo de preparo e
+    custos calculados), que ficam de fora quando ?expand é usado sem ?fields.
+    Sem nenhum dos parâmetros a resposta é completa.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expansiveis = getattr(self.Meta, 'campos_expansiveis', ())
+        campos = campos_da_requisicao(self.context.get('request'))
+        if campos is None:
+            return
+        for nome in list(self.fields):
+            if nome in campos:
+                continue
+            if '*' in campos and nome not in expansiveis:
+                continue
+            self.fields.pop(nome)
+
+
+class RestauranteSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Restaurante
         fields = '__all__'
 
-class CategoriaInsumoSerializer(serializers.ModelSerializer):
+class CategoriaInsumoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = CategoriaInsumo
         fields = ['id', 'nome', 'restaurante']
 
-class InsumoSerializer(serializers.ModelSerializer):
+class InsumoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     categoria_nome = serializers.CharField(source='categoria.nome', read_only=True)
     class Meta:
         model = Insumo
         fields = '__all__'
 
-class ReceitaInsumoSerializer(serializers.ModelSerializer):
+class ReceitaInsumoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     insumo_nome = serializers.CharField(source='insumo.nome', read_only=True)
     receita_sub_nome = serializers.CharField(source='receita_sub.nome', read_only=True)
     class Meta:
         model = ReceitaInsumo
         fields = ['id', 'insumo', 'insumo_nome', 'receita_sub', 'receita_sub_nome', 'quantidade_utilizada', 'ic', 'ipc', 'aplicar_ic_ipc', 'receita']
 
-class ReceitaSerializer(serializers.ModelSerializer):
+    def validate(self, attrs):
+        # As sub-receitas precisam formar um grafo acíclico e de profundidade limitada
+        receita = attrs.get('receita', getattr(self.instance, 'receita', None))
+        receita_sub = attrs.get('receita_sub', getattr(self.instance, 'receita_sub', None))
+        inalterado = self.instance is not None and (
+            (self.instance.receita_id, self.instance.receita_sub_id) == (getattr(receita, 'id', None), getattr(receita_sub, 'id', None))
+        )
+        if receita is not None and receita_sub is not None and not inalterado:
+            erro = validar_subreceita(receita.id, receita_sub.id)
+            if erro:
+                raise serializers.ValidationError({'receita_sub': erro})
+        return attrs
+
+class ReceitaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     itens = ReceitaInsumoSerializer(many=True, read_only=True)
     custo_total = serializers.SerializerMethodField()
     peso_final = serializers.SerializerMethodField()
@@ -34,45 +99,25 @@ class ReceitaSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Receita
-        fields = ['id', 'restaurante', 'nome', 'tempo_preparo', 'porcao_sugerida', 'modo_preparo', 'itens', 'peso_final', 'custo_total', 'rendimento', 'imagem', 'valor_restaurante', 'valor_ifood']
+        fields = ['id', 'restaurante', 'nome', 'tempo_preparo', 'porcao_sugerida', 'modo_preparo', 'itens', 'peso_final', 'custo_total', 'rendimento', 'imagem', 'valor_restaurante', 'valor_ifood', 'custo_calculado_em']
+        read_only_fields = ['custo_calculado_em']
+        campos_expansiveis = ['itens', 'modo_preparo', 'peso_final', 'custo_total', 'rendimento']
 
     def get_custo_total(self, obj):
         request = self.context.get('request')
         if request:
             user = request.user
             restaurante_id = obj.restaurante_id
-            from .views import is_admin, is_master
             if not (is_admin(user) or is_master(user, restaurante_id)):
                 return None
-        def custo_item(item):
-            if item.insumo:
-                insumo = item.insumo
-                if not insumo.preco or not insumo.peso:
-                    return 0
-                custo_unit = float(insumo.preco) / float(insumo.peso)
-                divisor = (float(item.ipc) / 100) * (float(item.ic) / 100) or 1
-                return (custo_unit * float(item.quantidade_utilizada)) / divisor
-            elif item.receita_sub:
-                sub_serializer = ReceitaSerializer(item.receita_sub, context=self.context)
-                return sub_serializer.get_custo_total(item.receita_sub) * float(item.quantidade_utilizada)
-            return 0
-        return sum([custo_item(item) for item in obj.itens.all()])
+        if valores_gravados_validos(self.context, obj):
+            return float(obj.custo_total)
+        return obter_motor(self.context, obj.restaurante_id).custo_receita(obj.id)
 
     def get_peso_final(self, obj):
-        peso_total = 0
-        for item in obj.itens.all():
-            if item.insumo:
-                if item.quantidade_utilizada:
-                    ic = float(item.ic) if item.ic else 100
-                    ipc = float(item.ipc) if item.ipc else 100
-                    peso_total += float(item.quantidade_utilizada) * (ipc / 100) * (ic / 100)
-            elif hasattr(item, 'receita_sub') and item.receita_sub:
-                if item.quantidade_utilizada:
-                    sub_serializer = ReceitaSerializer(item.receita_sub, context=self.context)
-                    peso_sub = sub_serializer.get_peso_final(item.receita_sub)
-                    if peso_sub is not None:
-                        peso_total += peso_sub * float(item.quantidade_utilizada)
-        return round(peso_total, 2)
+        if valores_gravados_validos(self.context, obj):
+            return float(obj.peso_final)
+        return obter_motor(self.context, obj.restaurante_id).peso_receita(obj.id)
 
     def get_rendimento(self, obj):
         # Retorna o rendimento da receita se existir, senão calcula baseado no peso final
@@ -91,7 +136,7 @@ class ReceitaSerializer(serializers.ModelSerializer):
             return obj.imagem.url
         return None
 
-class FichaTecnicaItemSerializer(serializers.ModelSerializer):
+class FichaTecnicaItemSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     insumo_nome = serializers.CharField(source='insumo.nome', read_only=True)
     receita_nome = serializers.CharField(source='receita.nome', read_only=True)
     
@@ -99,7 +144,7 @@ class FichaTecnicaItemSerializer(serializers.ModelSerializer):
         model = FichaTecnicaItem
         fields = ['id', 'ficha', 'insumo', 'insumo_nome', 'receita', 'receita_nome', 'quantidade_utilizada', 'unidade_medida', 'ic', 'ic_tipo', 'ipc', 'aplicar_ic_ipc']
 
-class FichaTecnicaSerializer(serializers.ModelSerializer):
+class FichaTecnicaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     itens = FichaTecnicaItemSerializer(many=True, read_only=True)
     custo_total = serializers.SerializerMethodField()
     peso_final = serializers.SerializerMethodField()
@@ -107,63 +152,25 @@ class FichaTecnicaSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = FichaTecnica
-        fields = ['id', 'restaurante', 'nome', 'rendimento', 'modo_preparo', 'itens', 'peso_final', 'custo_total', 'imagem', 'valor_restaurante', 'valor_ifood']
+        fields = ['id', 'restaurante', 'nome', 'rendimento', 'modo_preparo', 'itens', 'peso_final', 'custo_total', 'imagem', 'valor_restaurante', 'valor_ifood', 'custo_calculado_em']
+        read_only_fields = ['custo_calculado_em']
+        campos_expansiveis = ['itens', 'modo_preparo', 'peso_final', 'custo_total']
 
     def get_custo_total(self, obj):
         request = self.context.get('request')
         if request:
             user = request.user
             restaurante_id = obj.restaurante_id
-            from .views import is_admin, is_master
             if not (is_admin(user) or is_master(user, restaurante_id)):
                 return None
-        def custo_item(item):
-            if item.insumo:
-                insumo = item.insumo
-                if not insumo.preco or not insumo.peso:
-                    return 0
-                custo_unit = float(insumo.preco) / float(insumo.peso)
-                quantidade = float(item.quantidade_utilizada)
-                if hasattr(item, 'aplicar_ic_ipc') and not item.aplicar_ic_ipc:
-                    return custo_unit * quantidade
-                ic = float(item.ic) if item.ic else 100
-                ipc = float(item.ipc) if item.ipc else 100
-                if ic == 100 and ipc == 100:
-                    return custo_unit * quantidade
-                divisor = (ic / 100) * (ipc / 100)
-                if divisor == 0:
-                    divisor = 1
-                quantidade_ajustada = quantidade / divisor
-                return custo_unit * quantidade_ajustada
-            elif item.receita:
-                sub_serializer = ReceitaSerializer(item.receita, context=self.context)
-                custo_total_receita = sub_serializer.get_custo_total(item.receita)
-                peso_final_receita = sub_serializer.get_peso_final(item.receita)
-                if peso_final_receita and peso_final_receita > 0:
-                    proporcao = float(item.quantidade_utilizada) / peso_final_receita
-                    return custo_total_receita * proporcao
-                return custo_total_receita
-            return 0
-        resultado = round(sum([custo_item(item) for item in obj.itens.all()]), 2)
-        return resultado
+        if valores_gravados_validos(self.context, obj):
+            return float(obj.custo_total)
+        return obter_motor(self.context, obj.restaurante_id).custo_ficha(obj.id)
 
     def get_peso_final(self, obj):
-        peso_total = 0
-        for item in obj.itens.all():
-            if item.insumo:
-                if item.quantidade_utilizada:
-                    if hasattr(item, 'aplicar_ic_ipc') and not item.aplicar_ic_ipc:
-                        peso_total += float(item.quantidade_utilizada)
-                    else:
-                        ic = float(item.ic) if item.ic else 100
-                        ipc = float(item.ipc) if item.ipc else 100
-                        peso_total += float(item.quantidade_utilizada) * (ipc / 100) * (ic / 100)
-            elif item.receita:
-                if item.quantidade_utilizada:
-                    sub_serializer = ReceitaSerializer(item.receita, context=self.context)
-                    peso_sub = sub_serializer.get_peso_final(item.receita)
-                    peso_total += peso_sub * float(item.quantidade_utilizada)
-        return round(peso_total, 2)
+        if valores_gravados_validos(self.context, obj):
+            return float(obj.peso_final)
+        return obter_motor(self.context, obj.restaurante_id).peso_ficha(obj.id)
 
     def get_imagem(self, obj):
         if obj.imagem:
@@ -180,7 +187,7 @@ class UsuarioRestaurantePerfilSerializer(serializers.ModelSerializer):
         model = UsuarioRestaurantePerfil
         fields = ['id', 'usuario', 'restaurante', 'restaurante_nome', 'perfil'] 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     perfis = serializers.SerializerMethodField()
     last_login = serializers.DateTimeField(format="%Y-%m-%dT%H:%M:%S", required=False)
     class Meta:
@@ -245,13 +252,13 @@ class UserUpdateSerializer(serializers.ModelSerializer):
             vinculo.save()
         return instance 
 
-class RegistroAtividadeSerializer(serializers.ModelSerializer):
+class RegistroAtividadeSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     usuario_nome = serializers.CharField(source='usuario.username', read_only=True)
     class Meta:
         model = RegistroAtividade
-        fields = ['id', 'usuario', 'usuario_nome', 'perfil', 'tipo', 'acao', 'nome', 'descricao', 'data_hora'] 
+        fields = ['id', 'usuario', 'usuario_nome', 'restaurante', 'perfil', 'tipo', 'acao', 'nome', 'descricao', 'data_hora']
 
 class HistoricoPrecoInsumoSerializer(serializers.ModelSerializer):
     class Meta:
         model = HistoricoPrecoInsumo
-        fields = ['id', 'preco', 'data'] 
\ No newline at end of file
+        fields = ['id', 'preco', 'data', 'preco_minimo', 'preco_maximo', 'preco_medio', 'pontos'] 
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""Simulação de preços de insumos sem gravar nada no banco.
+
+O custo de uma ficha é linear nos custos unitários (preço / peso) dos insumos:
+soma de custo_unitario x quantidade bruta sobre as linhas de ComposicaoInsumo
+da ficha. A simulação carrega essas linhas do restaurante em arrays compactos
+(um índice de ficha, um de insumo e a quantidade por linha) e avalia o catálogo
+inteiro duas vezes, com os custos atuais e com os simulados, em uma única
+passagem, sem objetos do ORM.
+"""
+
+from array import array
+
+from .custos import valores_sugeridos
+from .models import ComposicaoInsumo, FichaTecnica, Insumo
+
+
+def _custo_unitario(preco, peso):
+    return float(preco) / float(peso) if preco and peso else 0.0
+
+
+def _margem(valor, custo):
+    return round((valor - custo) / valor * 100, 2) if valor else None
+
+
+def simular(restaurante, precos=None, variacoes=None, fator_correcao=None, taxa_ifood=None):
+    """Avalia o impacto de novos preços (e, opcionalmente, de um novo fator) em todas as fichas.
+
+    precos é {insumo_id: novo preço} e variacoes é {insumo_id: variação em %
+    sobre o preço atual}. Retorna as fichas ordenadas pelo impacto
+    no custo (e, em empate, no valor sugerido), com custo, valores sugeridos e
+    margem antes e depois. A margem simulada mantém o valor de venda atual.
+    """
+    precos = precos or {}
+    variacoes = variacoes or {}
+    fator_atual, taxa_atual = restaurante.fator_correcao, restaurante.taxa_ifood
+    fator_novo = fator_atual if fator_correcao is None else fator_correcao
+    taxa_nova = taxa_atual if taxa_ifood is None else taxa_ifood
+
+    posicao_insumo = {}
+    unitario_atual = array('d')
+    unitario_novo = array('d')
+
+    def carregar_insumos(linhas):
+        for insumo_id, preco, peso in linhas:
+            novo_preco = precos.get(insumo_id, preco)
+            if insumo_id in variacoes and preco:
+                novo_preco = float(preco) * (1 + float(variacoes[insumo_id]) / 100)
+            posicao_insumo[insumo_id] = len(unitario_atual)
+            unitario_atual.append(_custo_unitario(preco, peso))
+            unitario_novo.append(_custo_unitario(novo_preco, peso))
+
+    carregar_insumos(Insumo.objects.filter(restaurante_id=restaurante.pk).values_list('id', 'preco', 'peso'))
+
+    fichas = list(FichaTecnica.objects.filter(restaurante_id=restaurante.pk).values_list('id', 'nome', 'valor_restaurante'))
+    posicao_ficha = {ficha_id: posicao for posicao, (ficha_id, _, _) in enumerate(fichas)}
+
+    linhas = list(
+        ComposicaoInsumo.objects.filter(restaurante_id=restaurante.pk, ficha__isnull=False)
+        .values_list('ficha_id', 'insumo_id', 'quantidade')
+    )
+    # Insumos de outro restaurante usados nas fichas (raro)
+    externos = {insumo_id for _, insumo_id, _ in linhas} - set(posicao_insumo)
+    if externos:
+        carregar_insumos(Insumo.objects.filter(id__in=externos).values_list('id', 'preco', 'peso'))
+
+    fichas_linha = array('l', (posicao_ficha[ficha_id] for ficha_id, _, _ in linhas))
+    insumos_linha = array('l', (posicao_insumo[insumo_id] for _, insumo_id, _ in linhas))
+    quantidades = array('d', (quantidade for _, _, quantidade in linhas))
+
+    custo_atual = array('d', bytes(8 * len(fichas)))
+    custo_novo = array('d', bytes(8 * len(fichas)))
+    for ficha, insumo, quantidade in zip(fichas_linha, insumos_linha, quantidades):
+        custo_atual[ficha] += unitario_atual[insumo] * quantidade
+        custo_novo[ficha] += unitario_novo[insumo] * quantidade
+
+    resultado = []
+    for posicao, (ficha_id, nome, valor_gravado) in enumerate(fichas):
+        antes = round(custo_atual[posicao], 2)
+        depois = round(custo_novo[posicao], 2)
+        valor_antes, ifood_antes = valores_sugeridos(antes, fator_atual, taxa_atual)
+        valor_depois, ifood_depois = valores_sugeridos(depois, fator_novo, taxa_nova)
+        valor_venda = float(valor_gravado) if valor_gravado is not None else valor_antes
+        resultado.append({
+            'ficha': ficha_id,
+            'nome': nome,
+            'custo_atual': antes,
+            'custo_simulado': depois,
+            'variacao_custo': round(depois - antes, 2),
+            'variacao_custo_percentual': round((depois - antes) / antes * 100, 2) if antes else None,
+            'valor_restaurante_atual': valor_antes,
+            'valor_restaurante_simulado': valor_depois,
+            'valor_ifood_atual': ifood_antes,
+            'valor_ifood_simulado': ifood_depois,
+            'margem_atual': _margem(valor_venda, antes),
+            'margem_simulada': _margem(valor_venda, depois),
+        })
+    resultado.sort(key=lambda ficha: (
+        -abs(ficha['variacao_custo']),
+        -abs(ficha['valor_restaurante_simulado'] - ficha['valor_restaurante_atual']),
+    ))
+    return resultado
@@ -1,3 +1,1188 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Avg, Count, Max, Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import atividades, custos, middleware, planilhas, recalculo, renderizadores
+from .atividades import RequisicaoAtual
+from .custos import MotorCustos
+from .historico import compactar_historico, serie_precos
+from .importacao import importar_receitas, ler_decimal
+from .middleware import CompressaoMiddleware
+from .models import (
+    ComposicaoInsumo, FichaTecnica, FichaTecnicaItem, HistoricoPrecoInsumo, Insumo, Receita, ReceitaInsumo,
+    RegistroAtividade, Restaurante, ResumoRestaurante, ResumoUsuario, UsuarioRestaurantePerfil,
+)
+from .permissoes import perfis_do_usuario
+from .planilhas import TIPO_XLSX, linhas_xlsx, valores_xlsx
+from .renderizadores import JSONRapidoRenderer
+from .resumos import ranking_autores, reconstruir_resumos_usuarios, resumos_restaurantes
+from .views import ReceitaViewSet
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None  # só para conferir as planilhas exportadas
+
+
+def criar_restaurante(nome='Restaurante', cnpj='00.000.000/0001-00'):
+    return Restaurante.objects.create(
+        nome=nome, cnpj=cnpj, email='contato@exemplo.com', telefone='11999999999', cep='01000-000',
+        rua='Rua A', numero='1', bairro='Centro', cidade='São Paulo', estado='SP', fator_correcao=Decimal('2.50'),
+    )
+
+
+class BaseApiTestCase(TestCase):
+    def setUp(self):
+        # As versões do catálogo voltam a 0 a cada teste; respostas de testes anteriores não podem valer
+        cache.clear()
+        self.restaurante = criar_restaurante()
+        self.admin = User.objects.create_superuser('admin', 'admin@exemplo.com', 'senha')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def criar_insumo(self, nome, preco, peso='1000'):
+        return Insumo.objects.create(
+            restaurante=self.restaurante, nome=nome, preco=Decimal(preco), peso=Decimal(peso), unidade_medida='g',
+        )
+
+    def criar_receita(self, nome):
+        return Receita.objects.create(
+            restaurante=self.restaurante, nome=nome, tempo_preparo=10, porcao_sugerida='1 porção', modo_preparo='-',
+        )
+
+    def criar_catalogo(self):
+        """Ficha que usa uma receita com sub-receita, com IC/IPC variados (inclusive IC 0, tratado como 100)"""
+        self.farinha = self.criar_insumo('Farinha', '5.00')
+        self.ovo = self.criar_insumo('Ovo', '12.00', peso='600')
+        self.massa = self.criar_receita('Massa')
+        ReceitaInsumo.objects.create(receita=self.massa, insumo=self.farinha, quantidade_utilizada=500, ic=80, ipc=90)
+        ReceitaInsumo.objects.create(receita=self.massa, insumo=self.ovo, quantidade_utilizada=120)
+        self.torta = self.criar_receita('Torta')
+        ReceitaInsumo.objects.create(receita=self.torta, receita_sub=self.massa, quantidade_utilizada=2)
+        ReceitaInsumo.objects.create(receita=self.torta, insumo=self.ovo, quantidade_utilizada=100, ic=0)
+        self.ficha = FichaTecnica.objects.create(restaurante=self.restaurante, nome='Fatia de torta', modo_preparo='-')
+        FichaTecnicaItem.objects.create(ficha=self.ficha, receita=self.torta, quantidade_utilizada=300, unidade_medida='g')
+        FichaTecnicaItem.objects.create(
+            ficha=self.ficha, insumo=self.farinha, quantidade_utilizada=50, unidade_medida='g', aplicar_ic_ipc=False,
+        )
+        FichaTecnicaItem.objects.create(
+            ficha=self.ficha, insumo=self.ovo, quantidade_utilizada=40, unidade_medida='g', ic=80, ipc=90,
+        )
+        recalculo.recalcular(receita_ids=[self.massa.id, self.torta.id], ficha_ids=[self.ficha.id])
+
+
+class PerfisTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user('master', 'master@exemplo.com', 'senha')
+        UsuarioRestaurantePerfil.objects.create(usuario=self.usuario, restaurante=self.restaurante, perfil='master')
+
+    def consultas_de_perfis(self, consultas):
+        tabela = UsuarioRestaurantePerfil._meta.db_table
+        return [consulta for consulta in consultas if f'FROM "{tabela}"' in consulta['sql']]
+
+    def test_perfis_consultados_uma_vez_por_requisicao(self):
+        for numero in range(5):
+            self.criar_receita(f'Receita {numero}')
+        cliente = APIClient()
+        for _ in range(2):
+            # Como na autenticação real, cada requisição recebe um novo objeto de usuário
+            cliente.force_authenticate(User.objects.get(pk=self.usuario.pk))
+            with CaptureQueriesContext(connection) as consultas:
+                resposta = cliente.get(f'/api/receitas/?restaurante={self.restaurante.id}')
+            self.assertEqual(resposta.status_code, 200)
+            self.assertEqual(len(resposta.json()), 5)
+            self.assertEqual(len(self.consultas_de_perfis(consultas)), 1)
+
+    def test_alteracao_de_vinculo_na_requisicao_descarta_o_cache(self):
+        outro = criar_restaurante('Outro', '11.111.111/0001-11')
+        requisicao = mock.Mock(user=self.usuario)
+        with RequisicaoAtual(requisicao):
+            self.assertEqual(perfis_do_usuario(self.usuario), {self.restaurante.id: 'master'})
+            UsuarioRestaurantePerfil.objects.create(usuario_id=self.usuario.id, restaurante=outro, perfil='redator')
+            self.assertEqual(perfis_do_usuario(self.usuario), {self.restaurante.id: 'master', outro.id: 'redator'})
+
+
+class RegistroAtividadeTests(BaseApiTestCase):
+    dados_receita = {'nome': 'Massa', 'tempo_preparo': 10, 'porcao_sugerida': '1', 'modo_preparo': '-'}
+
+    def criar_pela_api(self):
+        return self.client.post('/api/receitas/', {**self.dados_receita, 'restaurante': self.restaurante.id}, format='json')
+
+    def test_requisicao_confirmada_grava_a_atividade(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.criar_pela_api().status_code, 201)
+        registro = RegistroAtividade.objects.get(tipo='receita')
+        self.assertEqual((registro.acao, registro.nome, registro.usuario), ('criado', 'Massa', self.admin))
+
+    def test_requisicao_desfeita_nao_grava_atividade(self):
+        def criar_e_falhar(viewset, serializer):
+            serializer.save()
+            raise RuntimeError('falha depois de gravar')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with mock.patch.object(ReceitaViewSet, 'perform_create', criar_e_falhar):
+                with self.assertRaises(RuntimeError):
+                    self.criar_pela_api()
+        self.assertFalse(Receita.objects.exists())
+        self.assertFalse(RegistroAtividade.objects.exists())
+
+    def test_erro_de_banco_ao_gravar_e_registrado_no_log(self):
+        evento = RegistroAtividade(usuario=self.admin, perfil='administrador', tipo='receita', acao='criado', nome='x')
+        with mock.patch.object(RegistroAtividade.objects, 'bulk_create', side_effect=DatabaseError('indisponível')):
+            with self.assertLogs('restaurantes.atividades', 'ERROR') as logs:
+                atividades._gravar([evento])
+        self.assertIn('1 registros de atividade', logs.output[0])
+
+
+class PaginacaoTests(BaseApiTestCase):
+    def paginas(self, url):
+        ids = []
+        while url:
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            ids.extend(linha['id'] for linha in resposta.json()['results'])
+            url = resposta.json()['next']
+        return ids
+
+    def test_registro_de_atividades_paginado_por_padrao(self):
+        RegistroAtividade.objects.bulk_create([
+            RegistroAtividade(usuario=self.admin, perfil='administrador', tipo='insumo', acao='criado', nome=f'insumo {n}')
+            for n in range(120)
+        ])
+        primeira = self.client.get('/api/registros-atividade/').json()
+        self.assertEqual(len(primeira['results']), 50)
+        self.assertIsNotNone(primeira['next'])
+        ids = self.paginas('/api/registros-atividade/')
+        self.assertEqual(ids, sorted(RegistroAtividade.objects.values_list('id', flat=True), reverse=True))
+
+    def test_cursor_percorre_o_catalogo_sem_repetir(self):
+        for numero in range(7):
+            self.criar_receita(f'Receita {numero}')
+        self.assertIsInstance(self.client.get('/api/receitas/').json(), list)
+        ids = self.paginas('/api/receitas/?page_size=3&fields=id')
+        self.assertEqual(ids, sorted(Receita.objects.values_list('id', flat=True), reverse=True))
+
+    def test_fields_e_expand_recortam_a_resposta(self):
+        receita = self.criar_receita('Massa')
+        farinha = self.criar_insumo('Farinha', '5.00')
+        ReceitaInsumo.objects.create(receita=receita, insumo=farinha, quantidade_utilizada=100)
+        linha, = self.client.get('/api/receitas/?fields=id,nome').json()
+        self.assertEqual(set(linha), {'id', 'nome'})
+        linha, = self.client.get('/api/receitas/?expand=itens').json()
+        self.assertIn('itens', linha)
+        self.assertIn('tempo_preparo', linha)
+        self.assertNotIn('modo_preparo', linha)
+        self.assertNotIn('custo_total', linha)
+        linha, = self.client.get('/api/receitas/?fields=id&expand=custo_total').json()
+        self.assertEqual(set(linha), {'id', 'custo_total'})
+        self.assertEqual(len(self.client.get('/api/receitas/').json()[0]['itens']), 1)
+
+
+class LerDecimalTests(TestCase):
+    def test_formatos_aceitos(self):
+        self.assertEqual(ler_decimal('1.234,5', 2), Decimal('1234.50'))
+        self.assertEqual(ler_decimal('R$ 12,5', 2), Decimal('12.50'))
+        self.assertIsNone(ler_decimal('  ', 2))
+
+    def test_numero_grande_demais_vira_value_error(self):
+        for texto in ('1e30', '9' * 40):
+            with self.assertRaises(ValueError):
+                ler_decimal(texto, 2)
+
+
+class NumerosGrandesDemaisTests(BaseApiTestCase):
+    def test_preco_grande_demais_e_erro_da_linha(self):
+        insumo = self.criar_insumo('Farinha', '5.00')
+        resposta = self.client.post('/api/insumos/importar-precos/', {
+            'restaurante': self.restaurante.id,
+            'itens': [{'id': insumo.id, 'preco': '1e30'}, {'id': insumo.id, 'preco': '6,00', 'peso': '1e30'}],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['erros'], 2)
+        self.assertEqual(resposta.json()['atualizados'], 0)
+        insumo.refresh_from_db()
+        self.assertEqual(insumo.preco, Decimal('5.00'))
+
+    def test_simulacao_com_numero_grande_demais_retorna_400(self):
+        insumo = self.criar_insumo('Farinha', '5.00')
+        resposta = self.client.post(f'/api/restaurantes/{self.restaurante.id}/simular/', {
+            'insumos': [{'insumo': insumo.id, 'preco': '1e30'}],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_importacao_de_receita_com_quantidade_grande_demais_e_erro_da_linha(self):
+        self.criar_insumo('Farinha', '5.00')
+        resposta = self.client.post('/api/receitas/importar/', {
+            'restaurante': self.restaurante.id,
+            'itens': [{'receita': 'Massa', 'tempo_preparo': '1e30', 'insumo': 'Farinha', 'quantidade_utilizada': '1e30'}],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(len(resposta.json()['erros'][0]['erros']), 2)
+
+
+# Fórmulas recursivas dos serializers antes do MotorCustos, usadas como referência
+
+def custo_receita_recursivo(receita):
+    total = 0
+    for item in receita.itens.all():
+        if item.insumo:
+            if not item.insumo.preco or not item.insumo.peso:
+                continue
+            divisor = (float(item.ipc) / 100) * (float(item.ic) / 100) or 1
+            total += float(item.insumo.preco) / float(item.insumo.peso) * float(item.quantidade_utilizada) / divisor
+        elif item.receita_sub:
+            total += custo_receita_recursivo(item.receita_sub) * float(item.quantidade_utilizada)
+    return total
+
+
+def peso_receita_recursivo(receita):
+    peso = 0
+    for item in receita.itens.all():
+        if item.insumo:
+            ic = float(item.ic) if item.ic else 100
+            ipc = float(item.ipc) if item.ipc else 100
+            peso += float(item.quantidade_utilizada) * (ipc / 100) * (ic / 100)
+        elif item.receita_sub:
+            peso += peso_receita_recursivo(item.receita_sub) * float(item.quantidade_utilizada)
+    return round(peso, 2)
+
+
+def custo_ficha_recursivo(ficha):
+    total = 0
+    for item in ficha.itens.all():
+        quantidade = float(item.quantidade_utilizada)
+        if item.insumo:
+            custo_unit = float(item.insumo.preco) / float(item.insumo.peso)
+            ic = float(item.ic) if item.ic else 100
+            ipc = float(item.ipc) if item.ipc else 100
+            if item.aplicar_ic_ipc and (ic != 100 or ipc != 100):
+                quantidade = quantidade / ((ic / 100) * (ipc / 100) or 1)
+            total += custo_unit * quantidade
+        elif item.receita:
+            custo = custo_receita_recursivo(item.receita)
+            peso = peso_receita_recursivo(item.receita)
+            total += custo * quantidade / peso if peso > 0 else custo
+    return round(total, 2)
+
+
+class MotorCustosTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_catalogo()
+
+    def test_custos_iguais_as_formulas_recursivas(self):
+        motor = MotorCustos(self.restaurante.id)
+        for receita in (self.massa, self.torta):
+            self.assertAlmostEqual(motor.custo_receita(receita.id), custo_receita_recursivo(receita), places=6)
+            self.assertEqual(motor.peso_receita(receita.id), peso_receita_recursivo(receita))
+        self.assertEqual(motor.custo_ficha(self.ficha.id), custo_ficha_recursivo(self.ficha))
+        # Torta: 2 x Massa (500 x 0,9 x 0,8 + 120) + 100; como antes, o peso da receita é multiplicado pela quantidade
+        self.assertEqual(motor.peso_ficha(self.ficha.id), 1060 * 300 + 50 + 40 * 0.72)
+
+    def test_motor_compartilhado_calcula_cada_receita_uma_vez(self):
+        motor = MotorCustos(self.restaurante.id)
+        motor.custo_ficha(self.ficha.id)
+        with self.assertNumQueries(0):
+            motor.custo_receita(self.massa.id)
+            motor.peso_receita(self.torta.id)
+
+
+class CustosGravadosTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_catalogo()
+
+    def test_custos_gravados_e_servidos_pela_api(self):
+        self.ficha.refresh_from_db()
+        esperado = Decimal(str(custo_ficha_recursivo(self.ficha)))
+        self.assertEqual(self.ficha.custo_total, esperado)
+        self.assertEqual(
+            self.ficha.valor_restaurante, (esperado * Decimal('2.50')).quantize(Decimal('0.01'), ROUND_HALF_UP),
+        )
+        self.assertIsNotNone(self.ficha.custo_calculado_em)
+        resposta = self.client.get(f'/api/fichas-tecnicas/{self.ficha.id}/')
+        self.assertEqual(Decimal(str(resposta.json()['custo_total'])), esperado)
+        self.assertIsNotNone(resposta.json()['custo_calculado_em'])
+
+    def test_valor_gravado_e_servido_sem_recalcular_salvo_com_recalcular(self):
+        Receita.objects.filter(pk=self.massa.pk).update(custo_total=Decimal('1.23'))
+        url = f'/api/receitas/{self.massa.id}/'
+        self.assertEqual(self.client.get(url).json()['custo_total'], 1.23)
+        recalculado = self.client.get(url + '?recalcular=1').json()['custo_total']
+        self.assertAlmostEqual(recalculado, custo_receita_recursivo(self.massa), places=6)
+
+    def test_sem_calculo_gravado_usa_o_motor(self):
+        Receita.objects.filter(pk=self.massa.pk).update(custo_total=None, custo_calculado_em=None)
+        resposta = self.client.get(f'/api/receitas/{self.massa.id}/').json()
+        self.assertIsNone(resposta['custo_calculado_em'])
+        self.assertAlmostEqual(resposta['custo_total'], custo_receita_recursivo(self.massa), places=6)
+
+
+class PropagacaoPrecoTests(BaseApiTestCase):
+    def test_novo_preco_chega_as_receitas_sub_receitas_e_fichas(self):
+        sal = self.criar_insumo('Sal', '3.47')
+        base = self.criar_receita('Base')
+        ReceitaInsumo.objects.create(receita=base, insumo=sal, quantidade_utilizada=1000)
+        molho = self.criar_receita('Molho')
+        ReceitaInsumo.objects.create(receita=molho, receita_sub=base, quantidade_utilizada=1)
+        ficha = FichaTecnica.objects.create(restaurante=self.restaurante, nome='Porção', modo_preparo='-')
+        FichaTecnicaItem.objects.create(ficha=ficha, receita=base, quantidade_utilizada=556, unidade_medida='g')
+        recalculo.recalcular(receita_ids=[base.id, molho.id], ficha_ids=[ficha.id])
+        ficha.refresh_from_db()
+        self.assertEqual(ficha.custo_total, Decimal('1.93'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.patch(f'/api/insumos/{sal.id}/', {'preco': '6.94'}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        for obj, custo in ((base, '6.94'), (molho, '6.94'), (ficha, '3.86')):
+            obj.refresh_from_db()
+            self.assertEqual(obj.custo_total, Decimal(custo))
+            self.assertEqual(obj.valor_restaurante, (Decimal(custo) * Decimal('2.50')).quantize(Decimal('0.01')))
+
+
+class ValoresSugeridosTests(BaseApiTestCase):
+    def test_update_em_lote_igual_ao_calculo_em_python(self):
+        sorteio = random.Random(10)
+        valores = [Decimal(sorteio.randint(1, 500000)) / 100 for _ in range(300)]
+        # Empates de arredondamento com fator 2,50 (x,xx5) e custos pequenos
+        valores += [Decimal('0.05'), Decimal('0.01'), Decimal('1.23'), Decimal('330.87'), Decimal('64.50')]
+        Receita.objects.bulk_create([
+            Receita(restaurante=self.restaurante, nome=f'Receita {numero}', tempo_preparo=1, porcao_sugerida='1',
+                    modo_preparo='-', custo_total=valor)
+            for numero, valor in enumerate(valores)
+        ])
+        for fator, taxa in (('2.50', '0.2300'), ('1.35', '0.1234'), ('3.33', '0.0999')):
+            self.restaurante.fator_correcao = Decimal(fator)
+            self.restaurante.taxa_ifood = Decimal(taxa)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.restaurante.save()
+            for receita in Receita.objects.all():
+                esperado = custos.valores_sugeridos(receita.custo_total, self.restaurante.fator_correcao, taxa)
+                self.assertEqual(
+                    (receita.valor_restaurante, receita.valor_ifood), tuple(Decimal(str(valor)) for valor in esperado),
+                    f'custo {receita.custo_total}, fator {fator}, taxa {taxa}',
+                )
+
+    def test_so_atualiza_quando_a_precificacao_muda(self):
+        with mock.patch.object(custos, 'atualizar_valores_sugeridos') as atualizar:
+            self.restaurante.nome = 'Outro nome'
+            self.restaurante.save()
+            atualizar.assert_not_called()
+            self.restaurante.fator_correcao = Decimal('3.00')
+            self.restaurante.save()
+            atualizar.assert_called_once()
+
+    def test_recalculo_por_linha_parte_do_custo_arredondado(self):
+        self.assertEqual(custos.valores_sugeridos(Decimal('5.25'), Decimal('2.50'), Decimal('0.2300')), (13.13, 16.14))
+        receita = self.criar_receita('Massa')
+        self.restaurante.taxa_ifood = Decimal('0.2300')
+        custos.aplicar_calculo(receita, 1.23456, 100, self.restaurante, None)
+        self.assertEqual(receita.custo_total, Decimal('1.23'))
+        # 1,23 x 2,50 = 3,075 -> 3,08 (e não 1,23456 x 2,50 = 3,0864 -> 3,09)
+        self.assertEqual((receita.valor_restaurante, receita.valor_ifood), (Decimal('3.08'), Decimal('3.78')))
+
+
+class ComandoRecalcularCustosTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_catalogo()
+        self.ficha.refresh_from_db()
+        self.correto = self.ficha.custo_total
+        FichaTecnica.objects.filter(pk=self.ficha.pk).update(custo_total=Decimal('999.99'))
+
+    def executar(self, *args):
+        saida = io.StringIO()
+        call_command('recalcular_custos', '--verify', *args, stdout=saida)
+        return saida.getvalue()
+
+    def test_dry_run_relata_a_divergencia_sem_gravar(self):
+        saida = self.executar('--dry-run')
+        self.assertIn(f"ficha {self.ficha.id} 'Fatia de torta': custo_total gravado=999.99 calculado={self.correto}", saida)
+        self.assertIn('1 valores divergentes', saida)
+        self.ficha.refresh_from_db()
+        self.assertEqual(self.ficha.custo_total, Decimal('999.99'))
+
+    def test_corrige_e_depois_nao_ha_divergencias(self):
+        self.assertIn('1 valores divergentes', self.executar())
+        self.ficha.refresh_from_db()
+        self.assertEqual(self.ficha.custo_total, self.correto)
+        self.assertIn('0 valores divergentes', self.executar('--dry-run'))
+
+
+class SubreceitasTests(BaseApiTestCase):
+    def ligar(self, receita, sub):
+        return self.client.post('/api/receita-insumos/', {
+            'receita': receita.id, 'receita_sub': sub.id, 'quantidade_utilizada': 1,
+        }, format='json')
+
+    def test_ciclos_sao_rejeitados(self):
+        a, b, c = self.criar_receita('A'), self.criar_receita('B'), self.criar_receita('C')
+        self.assertEqual(self.ligar(a, b).status_code, 201)
+        self.assertEqual(self.ligar(b, c).status_code, 201)
+        for receita, sub in ((c, a), (b, a), (a, a)):
+            resposta = self.ligar(receita, sub)
+            self.assertEqual(resposta.status_code, 400)
+            self.assertIn('receita_sub', resposta.json())
+        self.assertEqual(ReceitaInsumo.objects.filter(receita_sub__isnull=False).count(), 2)
+
+    @override_settings(PROFUNDIDADE_MAXIMA_SUBRECEITAS=2)
+    def test_profundidade_maxima(self):
+        a, b, c, d = (self.criar_receita(nome) for nome in 'ABCD')
+        self.assertEqual(self.ligar(a, b).status_code, 201)
+        self.assertEqual(self.ligar(b, c).status_code, 201)
+        self.assertEqual(self.ligar(c, d).status_code, 400)
+        self.assertEqual(self.ligar(d, a).status_code, 400)
+
+    def test_ciclo_antigo_no_banco_nao_trava_o_calculo(self):
+        farinha = self.criar_insumo('Farinha', '5.00')
+        a, b = self.criar_receita('A'), self.criar_receita('B')
+        ReceitaInsumo.objects.create(receita=a, insumo=farinha, quantidade_utilizada=100)
+        # Ligações gravadas antes da validação, direto no banco
+        ReceitaInsumo.objects.bulk_create([
+            ReceitaInsumo(receita=a, receita_sub=b, quantidade_utilizada=1),
+            ReceitaInsumo(receita=b, receita_sub=a, quantidade_utilizada=1),
+        ])
+        motor = MotorCustos(self.restaurante.id)
+        self.assertAlmostEqual(motor.custo_receita(a.id), 0.5)
+
+    def test_cadeia_longa_sem_recursao(self):
+        farinha = self.criar_insumo('Farinha', '5.00')
+        cadeia = Receita.objects.bulk_create([
+            Receita(restaurante=self.restaurante, nome=f'R{n}', tempo_preparo=1, porcao_sugerida='1', modo_preparo='-')
+            for n in range(3000)
+        ])
+        ReceitaInsumo.objects.create(receita=cadeia[0], insumo=farinha, quantidade_utilizada=100)
+        ReceitaInsumo.objects.bulk_create([
+            ReceitaInsumo(receita=cadeia[n + 1], receita_sub=cadeia[n], quantidade_utilizada=1) for n in range(2999)
+        ])
+        self.assertAlmostEqual(MotorCustos(self.restaurante.id).custo_receita(cadeia[-1].id), 0.5)
+
+
+class ComposicaoTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_catalogo()
+
+    def composicao_gravada(self, **dono):
+        return {
+            insumo_id: (quantidade, profundidade)
+            for insumo_id, quantidade, profundidade in ComposicaoInsumo.objects.filter(**dono).values_list(
+                'insumo_id', 'quantidade', 'profundidade'
+            )
+        }
+
+    def test_composicao_gravada_igual_a_do_motor(self):
+        motor = MotorCustos(self.restaurante.id)
+        for receita in (self.massa, self.torta):
+            self.assertEqual(self.composicao_gravada(receita=receita), motor.composicao_receita(receita.id))
+        self.assertEqual(self.composicao_gravada(ficha=self.ficha), motor.composicao_ficha(self.ficha.id))
+        # A farinha chega à torta só pela massa; o ovo é direto e também vem pela massa
+        self.assertEqual(self.composicao_gravada(receita=self.torta)[self.farinha.id][1], 1)
+        self.assertEqual(self.composicao_gravada(receita=self.torta)[self.ovo.id], (240 + 100, 0))
+
+    def test_novo_item_em_sub_receita_reconstroi_a_composicao(self):
+        acucar = self.criar_insumo('Açúcar', '4.00')
+        with self.captureOnCommitCallbacks(execute=True), recalculo.coletar_recalculos():
+            ReceitaInsumo.objects.create(receita=self.massa, insumo=acucar, quantidade_utilizada=30)
+        self.assertEqual(self.composicao_gravada(receita=self.massa)[acucar.id], (30, 0))
+        self.assertEqual(self.composicao_gravada(receita=self.torta)[acucar.id], (60, 1))
+        self.assertEqual(self.composicao_gravada(ficha=self.ficha)[acucar.id][1], 2)
+        self.assertEqual(
+            self.composicao_gravada(ficha=self.ficha), MotorCustos(self.restaurante.id).composicao_ficha(self.ficha.id)
+        )
+
+    def test_onde_usado_inclui_usos_por_sub_receitas(self):
+        resposta = self.client.get(f'/api/insumos/{self.farinha.id}/onde-usado/')
+        self.assertEqual(resposta.status_code, 200)
+        receitas = [(uso['nome'], uso['quantidade'], uso['direto'], uso['profundidade']) for uso in resposta.data['receitas']]
+        self.assertEqual(receitas, [('Massa', 694.444, True, 0), ('Torta', 1388.889, False, 1)])
+        self.assertEqual([(uso['id'], uso['direto']) for uso in resposta.data['fichas']], [(self.ficha.id, True)])
+
+    def test_explosao_da_ficha(self):
+        resposta = self.client.get(f'/api/fichas-tecnicas/{self.ficha.id}/explosao/')
+        self.assertEqual(resposta.status_code, 200)
+        composicao = MotorCustos(self.restaurante.id).composicao_ficha(self.ficha.id)
+        self.assertEqual(
+            [(item['nome'], item['quantidade']) for item in resposta.data['insumos']],
+            [('Farinha', round(composicao[self.farinha.id][0], 3)), ('Ovo', round(composicao[self.ovo.id][0], 3))],
+        )
+        # 50 g de farinha direto mais a que vem da torta, proporcional aos 300 g usados
+        peso_torta = MotorCustos(self.restaurante.id).peso_receita(self.torta.id)
+        self.assertAlmostEqual(composicao[self.farinha.id][0], 50 + 500 / 0.72 * 2 * 300 / peso_torta)
+        self.assertEqual(resposta.data['insumos'][1]['custo'], round(12 / 600 * composicao[self.ovo.id][0], 2))
+
+
+class ExplosaoLoteTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_catalogo()
+        self.omelete = FichaTecnica.objects.create(restaurante=self.restaurante, nome='Omelete', modo_preparo='-')
+        FichaTecnicaItem.objects.create(ficha=self.omelete, insumo=self.ovo, quantidade_utilizada=150, unidade_medida='g')
+        recalculo.recalcular(ficha_ids=[self.omelete.id])
+
+    def test_soma_ponderada_das_fichas(self):
+        itens = [
+            {'ficha': self.ficha.id, 'quantidade': 3},
+            {'ficha': self.omelete.id, 'quantidade': '2'},
+            {'ficha': self.ficha.id},
+        ]
+        resposta = self.client.post('/api/fichas-tecnicas/explosao-lote/', itens, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(
+            [(item['ficha'], item['quantidade']) for item in resposta.data['fichas']],
+            [(self.ficha.id, 4), (self.omelete.id, 2)],
+        )
+        fatia = MotorCustos(self.restaurante.id).composicao_ficha(self.ficha.id)
+        esperado = [
+            ('Farinha', round(fatia[self.farinha.id][0] * 4, 3)),
+            ('Ovo', round(fatia[self.ovo.id][0] * 4 + 150 * 2, 3)),
+        ]
+        self.assertEqual([(item['nome'], item['quantidade']) for item in resposta.data['insumos']], esperado)
+        self.assertEqual(resposta.data['insumos'][1]['custo'], round(12 / 600 * (fatia[self.ovo.id][0] * 4 + 300), 2))
+
+    def test_ficha_inexistente_ou_quantidade_invalida(self):
+        resposta = self.client.post('/api/fichas-tecnicas/explosao-lote/', [{'ficha': 9999, 'quantidade': 1}], format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('9999', str(resposta.data['itens']))
+        resposta = self.client.post(
+            '/api/fichas-tecnicas/explosao-lote/', [{'ficha': self.ficha.id, 'quantidade': 0}], format='json'
+        )
+        self.assertEqual(resposta.status_code, 400)
+
+
+class SimulacaoTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_catalogo()
+        self.omelete = FichaTecnica.objects.create(restaurante=self.restaurante, nome='Omelete', modo_preparo='-')
+        FichaTecnicaItem.objects.create(ficha=self.omelete, insumo=self.ovo, quantidade_utilizada=150, unidade_medida='g')
+        self.pao = FichaTecnica.objects.create(restaurante=self.restaurante, nome='Pão', modo_preparo='-')
+        FichaTecnicaItem.objects.create(ficha=self.pao, insumo=self.farinha, quantidade_utilizada=200, unidade_medida='g')
+        recalculo.recalcular(ficha_ids=[self.omelete.id, self.pao.id])
+
+    def simular(self, dados):
+        resposta = self.client.post(f'/api/restaurantes/{self.restaurante.id}/simular/', dados, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        return {ficha['nome']: ficha for ficha in resposta.data['fichas']}, resposta.data
+
+    def test_ordenada_pelo_impacto_no_custo_com_margens(self):
+        fichas, dados = self.simular({'insumos': [{'insumo': self.ovo.id, 'variacao': 50}]})
+        self.assertEqual(list(fichas), ['Fatia de torta', 'Omelete', 'Pão'])
+        omelete = fichas['Omelete']
+        self.assertEqual((omelete['custo_atual'], omelete['custo_simulado'], omelete['variacao_custo']), (3.0, 4.5, 1.5))
+        self.assertEqual(omelete['variacao_custo_percentual'], 50.0)
+        # A margem simulada mantém o valor de venda gravado (3.00 x 2.50)
+        self.assertEqual((omelete['margem_atual'], omelete['margem_simulada']), (60.0, 40.0))
+        self.assertEqual(omelete['valor_restaurante_simulado'], 11.25)
+        self.assertEqual(fichas['Pão']['variacao_custo'], 0)
+        self.assertEqual(dados['variacao_custo_total'], round(sum(ficha['variacao_custo'] for ficha in fichas.values()), 2))
+
+        self.ovo.refresh_from_db()
+        self.omelete.refresh_from_db()
+        self.assertEqual((self.ovo.preco, self.omelete.custo_total), (Decimal('12.00'), Decimal('3.00')))
+
+    def test_preco_e_fator_informados(self):
+        fichas, _ = self.simular({'insumos': [{'insumo': self.farinha.id, 'preco': '10.00'}], 'fator_correcao': '3.00'})
+        self.assertEqual(list(fichas)[-1], 'Omelete')
+        pao = fichas['Pão']
+        self.assertEqual((pao['custo_atual'], pao['custo_simulado']), (1.0, 2.0))
+        self.assertEqual((pao['valor_restaurante_atual'], pao['valor_restaurante_simulado']), (2.5, 6.0))
+        self.assertEqual(fichas['Omelete']['valor_restaurante_simulado'], 9.0)
+
+    def test_insumo_de_outro_restaurante(self):
+        outro = criar_restaurante('Outro', '11.111.111/0001-11')
+        alheio = Insumo.objects.create(restaurante=outro, nome='Sal', unidade_medida='g', peso=1000, preco=1)
+        resposta = self.client.post(
+            f'/api/restaurantes/{self.restaurante.id}/simular/',
+            {'insumos': [{'insumo': alheio.id, 'preco': '2.00'}]}, format='json',
+        )
+        self.assertEqual(resposta.status_code, 400)
+
+
+class HistoricoPrecoTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.insumo = self.criar_insumo('Farinha', '14.00')
+        self.insumo.historico_precos.all().delete()
+        for dia, hora, preco in ((5, 10, '10.00'), (5, 15, '12.00'), (6, 9, '9.00'), (20, 8, '11.00'), (34, 8, '14.00')):
+            registro = HistoricoPrecoInsumo.objects.create(insumo=self.insumo, preco=Decimal(preco))
+            # data é auto_now_add; a data do ponto é ajustada depois de criado
+            data = timezone.make_aware(datetime(2026, 1, 1, hora)) + timedelta(days=dia - 1)
+            HistoricoPrecoInsumo.objects.filter(pk=registro.pk).update(data=data)
+
+    def pontos(self, agrupar):
+        resposta = self.client.get(f'/api/insumos/{self.insumo.id}/historico_preco/?agrupar={agrupar}')
+        self.assertEqual(resposta.status_code, 200)
+        return [(ponto['preco'], ponto['minimo'], ponto['maximo'], ponto['media'], ponto['pontos']) for ponto in resposta.data]
+
+    def test_agrupamento_por_dia_e_por_mes(self):
+        self.assertEqual(self.pontos('dia'), [
+            (12.0, 10.0, 12.0, 11.0, 2), (9.0, 9.0, 9.0, 9.0, 1), (11.0, 11.0, 11.0, 11.0, 1), (14.0, 14.0, 14.0, 14.0, 1),
+        ])
+        self.assertEqual(self.pontos('mes'), [(11.0, 9.0, 12.0, 10.5, 4), (14.0, 14.0, 14.0, 14.0, 1)])
+        resposta = self.client.get(f'/api/insumos/{self.insumo.id}/historico_preco/?inicio=2026-01-06&fim=2026-01-31')
+        self.assertEqual([ponto['preco'] for ponto in resposta.data], ['9.00', '11.00'])
+
+    def test_compactacao_mantem_as_series(self):
+        # Compactando por semana, as séries por semana e por mês ficam iguais; só o detalhe diário se perde
+        antes = {agrupar: serie_precos([self.insumo.id], agrupar=agrupar) for agrupar in ('semana', 'mes')}
+        antes_de = timezone.make_aware(datetime(2026, 2, 1))
+        self.assertEqual(compactar_historico(antes_de, agrupar='semana'), (1, 2))
+        self.assertEqual(self.insumo.historico_precos.count(), 3)
+        for agrupar, serie in antes.items():
+            self.assertEqual(serie_precos([self.insumo.id], agrupar=agrupar), serie, agrupar)
+        # Compactar de novo não muda nada
+        self.assertEqual(compactar_historico(antes_de, agrupar='semana'), (0, 0))
+
+
+class CustoEmTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        ovo = self.criar_insumo('Ovo', '12.00', peso='600')
+        sal = self.criar_insumo('Sal', '2.00')
+        HistoricoPrecoInsumo.objects.all().delete()
+        for dia, preco in ((date(2026, 3, 10), '6.00'), (date(2026, 4, 10), '12.00')):
+            registro = HistoricoPrecoInsumo.objects.create(insumo=ovo, preco=Decimal(preco))
+            HistoricoPrecoInsumo.objects.filter(pk=registro.pk).update(
+                data=timezone.make_aware(datetime.combine(dia, time(8)))
+            )
+        self.ficha = FichaTecnica.objects.create(restaurante=self.restaurante, nome='Omelete', modo_preparo='-')
+        FichaTecnicaItem.objects.create(ficha=self.ficha, insumo=ovo, quantidade_utilizada=150, unidade_medida='g')
+        FichaTecnicaItem.objects.create(ficha=self.ficha, insumo=sal, quantidade_utilizada=10, unidade_medida='g')
+        recalculo.recalcular(ficha_ids=[self.ficha.id])
+
+    def custo_em(self, consulta):
+        resposta = self.client.get(f'/api/fichas-tecnicas/{self.ficha.id}/custo-em/?{consulta}')
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.data
+
+    def test_data_antes_do_primeiro_registro_usa_o_primeiro_preco(self):
+        # O sal não tem histórico: vale o preço atual em qualquer data
+        self.assertEqual(self.custo_em('data=2025-12-01')['custo_total'], 1.52)
+        self.assertEqual(self.custo_em('data=2026-04-09')['custo_total'], 1.52)
+        dados = self.custo_em('data=2026-04-10')
+        self.assertEqual((dados['custo_total'], dados['custo_atual']), (3.02, Decimal('3.02')))
+
+    def test_serie_por_mes(self):
+        dados = self.custo_em('inicio=2026-02-01&fim=2026-04-15')
+        self.assertEqual(
+            [(str(ponto['data']), ponto['custo_total']) for ponto in dados['custos']],
+            [('2026-02-28', 1.52), ('2026-03-31', 1.52), ('2026-04-15', 3.02)],
+        )
+
+
+class RespostaCondicionalTests(BaseApiTestCase):
+    def revalidar(self, url, alterar):
+        """Primeira resposta, 304 com o ETag dela e, depois de alterar, 200 com um ETag novo"""
+        primeira = self.client.get(url)
+        self.assertEqual(primeira.status_code, 200)
+        etag = primeira['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            alterar()
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+        return resposta
+
+    def test_304_sem_alteracao_e_200_depois_de_editar(self):
+        receita = self.criar_receita('Massa')
+        resposta = self.revalidar(
+            f'/api/receitas/?restaurante={self.restaurante.id}',
+            lambda: self.client.patch(f'/api/receitas/{receita.id}/', {'nome': 'Massa fina'}, format='json'),
+        )
+        self.assertEqual(resposta.json()[0]['nome'], 'Massa fina')
+
+    def test_usuarios_usam_etag_do_conteudo(self):
+        resposta = self.revalidar('/api/usuarios/', lambda: User.objects.create_user('novo', 'novo@exemplo.com', 'senha'))
+        self.assertIn('novo', [usuario['username'] for usuario in resposta.json()])
+
+    def test_registros_de_atividade_usam_ultimo_id_e_total(self):
+        def criar():
+            RegistroAtividade.objects.create(
+                usuario=self.admin, perfil='administrador', tipo='insumo', acao='criado', nome='Farinha',
+            )
+
+        criar()
+        resposta = self.revalidar('/api/registros-atividade/', criar)
+        self.assertEqual(len(resposta.json()['results']), 2)
+
+
+@skipUnless(renderizadores.orjson is not None, 'orjson não instalado')
+class JSONRapidoRendererTests(TestCase):
+    def test_mesmos_bytes_que_o_renderizador_do_drf(self):
+        agora = timezone.make_aware(datetime(2026, 3, 10, 8, 30, 15, 123456))
+        dados = {
+            'preco': Decimal('12.50'),
+            'precos': [Decimal('0.10'), Decimal('1E+2'), Decimal('-3.333')],
+            'data_hora': agora,
+            'sem_fuso': datetime(2026, 3, 10, 8, 30),
+            'dia': date(2026, 3, 10),
+            'hora': time(8, 30, 15, 500),
+            1: 'chave numérica',
+            2.5: None,
+            'texto': 'linha\u2028separada\u2029aqui, com acentuação e "aspas"',
+            'aninhado': [{'ok': True, 'n': 3, 'x': 0.1}, [], {}],
+        }
+        self.assertEqual(JSONRapidoRenderer().render(dados), JSONRenderer().render(dados))
+        lista = [{'id': n, 'custo_total': Decimal(n) / 7} for n in range(50)]
+        self.assertEqual(JSONRapidoRenderer().render(lista), JSONRenderer().render(lista))
+
+    def test_indentacao_usa_o_renderizador_padrao(self):
+        dados = {'preco': Decimal('1.00')}
+        self.assertEqual(
+            JSONRapidoRenderer().render(dados, 'application/json; indent=2'),
+            JSONRenderer().render(dados, 'application/json; indent=2'),
+        )
+
+
+class CompressaoMiddlewareTests(TestCase):
+    def responder(self, conteudo, aceita='', streaming=False):
+        def get_response(request):
+            if streaming:
+                return StreamingHttpResponse(iter([conteudo[:10], conteudo[10:]]))
+            resposta = HttpResponse(conteudo)
+            resposta['ETag'] = '"abc"'
+            return resposta
+        request = RequestFactory().get('/api/insumos/', HTTP_ACCEPT_ENCODING=aceita)
+        return CompressaoMiddleware(get_response)(request)
+
+    @override_settings(COMPRESSAO_TAMANHO_MINIMO=100)
+    def test_corpo_pequeno_sai_sem_compressao(self):
+        resposta = self.responder(b'x' * 99, aceita='gzip, br')
+        self.assertFalse(resposta.has_header('Content-Encoding'))
+        self.assertFalse(resposta.has_header('Vary'))
+        self.assertEqual(resposta.content, b'x' * 99)
+
+    @override_settings(COMPRESSAO_TAMANHO_MINIMO=100)
+    def test_negociacao_pelo_accept_encoding(self):
+        conteudo = b'{"nome": "Farinha"}' * 20
+        resposta = self.responder(conteudo)
+        self.assertFalse(resposta.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', resposta['Vary'])
+        self.assertEqual(resposta['ETag'], '"abc"')
+
+        with mock.patch.object(middleware, 'brotli', None):
+            resposta = self.responder(conteudo, aceita='br, gzip;q=0.8')
+        self.assertEqual(resposta['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(resposta.content), conteudo)
+        self.assertEqual(resposta['Content-Length'], str(len(resposta.content)))
+        self.assertEqual(resposta['ETag'], 'W/"abc"')
+
+        self.assertFalse(self.responder(conteudo, aceita='deflate').has_header('Content-Encoding'))
+
+    @skipUnless(middleware.brotli is not None, 'Brotli não instalado')
+    def test_brotli_preferido_quando_aceito(self):
+        conteudo = b'{"nome": "Farinha"}' * 100
+        resposta = self.responder(conteudo, aceita='gzip, br')
+        self.assertEqual(resposta['Content-Encoding'], 'br')
+        self.assertEqual(middleware.brotli.decompress(resposta.content), conteudo)
+
+    def test_streaming_usa_gzip_qualquer_que_seja_o_tamanho(self):
+        conteudo = b'insumo;preco\nFarinha;5.00\n'
+        resposta = self.responder(conteudo, aceita='br, gzip', streaming=True)
+        self.assertEqual(resposta['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(resposta.streaming_content)), conteudo)
+
+
+class ResumosTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_catalogo()
+        self.outro = criar_restaurante('Outro', '11.111.111/0001-11')
+        sal = Insumo.objects.create(restaurante=self.outro, nome='Sal', unidade_medida='g', peso=1000, preco=2)
+        molho = Receita.objects.create(
+            restaurante=self.outro, nome='Molho', tempo_preparo=5, porcao_sugerida='1', modo_preparo='-',
+        )
+        ReceitaInsumo.objects.create(receita=molho, insumo=sal, quantidade_utilizada=250)
+        recalculo.recalcular(receita_ids=[molho.id])
+
+    def conferir_com_agregacao_ao_vivo(self):
+        resumos = {resumo.restaurante_id: resumo for resumo in resumos_restaurantes()}
+        self.assertEqual(set(resumos), {self.restaurante.id, self.outro.id})
+        for restaurante_id, resumo in resumos.items():
+            self.assertEqual(resumo.total_insumos, Insumo.objects.filter(restaurante_id=restaurante_id).count())
+            maiores = []
+            for model, sufixo in ((Receita, 'receitas'), (FichaTecnica, 'fichas')):
+                objetos = model.objects.filter(restaurante_id=restaurante_id)
+                agregado = objetos.aggregate(total=Count('id'), soma=Sum('custo_total'), media=Avg('custo_total'))
+                self.assertEqual(getattr(resumo, f'total_{sufixo}'), agregado['total'])
+                self.assertEqual(getattr(resumo, f'custo_total_{sufixo}'), agregado['soma'] or 0)
+                media = agregado['media'] and Decimal(agregado['media']).quantize(Decimal('0.01'))
+                self.assertEqual(getattr(resumo, f'custo_medio_{sufixo}'), media)
+                maiores += [(float(obj.custo_total), obj.nome) for obj in objetos]
+            self.assertEqual(
+                [(item['custo_total'], item['nome']) for item in resumo.maiores_custos],
+                sorted(maiores, reverse=True)[:5],
+            )
+
+    def test_resumos_iguais_a_agregacao_ao_vivo(self):
+        self.conferir_com_agregacao_ao_vivo()
+        antes = ResumoRestaurante.objects.get(restaurante=self.restaurante)
+        outro_antes = ResumoRestaurante.objects.get(restaurante=self.outro)
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.patch(f'/api/insumos/{self.ovo.id}/', {'preco': '30.00'}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.conferir_com_agregacao_ao_vivo()
+        depois = ResumoRestaurante.objects.get(restaurante=self.restaurante)
+        self.assertGreater(depois.versao_catalogo, antes.versao_catalogo)
+        self.assertGreater(depois.custo_total_receitas, antes.custo_total_receitas)
+        # O outro restaurante não mudou e não foi recalculado
+        self.assertEqual(ResumoRestaurante.objects.get(restaurante=self.outro).atualizado_em, outro_antes.atualizado_em)
+
+    def test_resumo_de_usuarios_igual_ao_registro_de_atividades(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/insumos/{self.ovo.id}/', {'preco': '13.00'}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/receitas/{self.massa.id}/', {'nome': 'Massa fina'}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/fichas-tecnicas/{self.ficha.id}/')
+        registros = RegistroAtividade.objects.filter(usuario=self.admin)
+        resumo = ResumoUsuario.objects.get(usuario=self.admin)
+        self.assertEqual(
+            (resumo.criados, resumo.editados, resumo.excluidos, resumo.ultima_atividade),
+            (
+                registros.filter(acao='criado').count(), registros.filter(acao='editado').count(),
+                registros.filter(acao='excluido').count(), registros.aggregate(ultima=Max('data_hora'))['ultima'],
+            ),
+        )
+        self.assertEqual((resumo.editados, resumo.excluidos), (2, 1))
+        reconstruir_resumos_usuarios()
+        reconstruido = ResumoUsuario.objects.get(usuario=self.admin)
+        self.assertEqual(
+            (reconstruido.criados, reconstruido.editados, reconstruido.excluidos),
+            (resumo.criados, resumo.editados, resumo.excluidos),
+        )
+
+
+class RankingAutoresTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.outro = criar_restaurante('Outro', '11.111.111/0001-11')
+        self.usuarios = {nome: User.objects.create_user(nome, f'{nome}@exemplo.com', 'senha') for nome in 'abcd'}
+        acoes = {
+            'a': ['criado'] * 3,
+            'b': ['criado', 'criado', 'editado', 'excluido'],
+            'c': ['editado'] + ['excluido'] * 5,
+            'd': ['criado', 'criado'],
+        }
+        registros = [
+            RegistroAtividade(
+                usuario=self.usuarios[nome], restaurante=self.restaurante, perfil='redator', tipo='receita',
+                acao=acao, nome='x',
+            )
+            for nome, lista in acoes.items() for acao in lista
+        ]
+        # No outro restaurante, d é o único autor
+        registros.append(RegistroAtividade(
+            usuario=self.usuarios['d'], restaurante=self.outro, perfil='redator', tipo='receita', acao='criado', nome='x',
+        ))
+        RegistroAtividade.objects.bulk_create(registros)
+
+    def ranking(self, limite):
+        resposta = self.client.get(f'/api/registros-atividade/ranking/?limite={limite}')
+        self.assertEqual(resposta.status_code, 200)
+        return {
+            restaurante['nome']: [(linha['username'], linha['posicao']) for linha in restaurante['ranking']]
+            for restaurante in resposta.data['restaurantes']
+        }
+
+    def test_empatados_na_ultima_posicao_entram_todos(self):
+        # a e b têm 3 criações + edições; b fica na frente por ter mais registros no total
+        self.assertEqual(self.ranking(1), {'Restaurante': [('b', 1), ('a', 1)], 'Outro': [('d', 1)]})
+        self.assertEqual(self.ranking(2), {'Restaurante': [('b', 1), ('a', 1)], 'Outro': [('d', 1)]})
+        self.assertEqual(self.ranking(3)['Restaurante'], [('b', 1), ('a', 1), ('d', 3)])
+        self.assertEqual(self.ranking(4)['Restaurante'], [('b', 1), ('a', 1), ('d', 3), ('c', 4)])
+
+    def test_contadores_por_acao(self):
+        linhas = ranking_autores(restaurante_ids=[self.restaurante.id], limite=5)[self.restaurante.id]
+        c = next(linha for linha in linhas if linha['usuario_id'] == self.usuarios['c'].id)
+        self.assertEqual(
+            (c['criados'], c['editados'], c['excluidos'], c['total'], c['pontuacao']), (0, 1, 5, 6, 1),
+        )
+
+
+class ArquivamentoRegistrosTests(BaseApiTestCase):
+    def registrar(self, nome, ano, mes, dia):
+        registro = RegistroAtividade.objects.create(
+            usuario=self.admin, restaurante=self.restaurante, perfil='administrador', tipo='insumo', acao='criado',
+            nome=nome,
+        )
+        # data_hora é auto_now_add; a data do registro é ajustada depois de criado
+        data_hora = timezone.make_aware(datetime(ano, mes, dia, 12))
+        RegistroAtividade.objects.filter(pk=registro.pk).update(data_hora=data_hora)
+        return registro
+
+    def arquivar(self, destino, *args):
+        saida = io.StringIO()
+        call_command('arquivar_registros_atividade', '--meses=12', f'--destino={destino}', *args, stdout=saida)
+        return saida.getvalue()
+
+    def ler(self, caminho):
+        with gzip.open(caminho, 'rt', encoding='utf-8') as arquivo:
+            return [json.loads(linha) for linha in arquivo]
+
+    def test_arquiva_exclui_e_acrescenta_ao_rodar_de_novo(self):
+        self.registrar('Farinha', 2020, 1, 15)
+        self.registrar('Ovo', 2020, 1, 31)
+        self.registrar('Sal', 2020, 2, 3)
+        recente = RegistroAtividade.objects.create(
+            usuario=self.admin, perfil='administrador', tipo='insumo', acao='criado', nome='Açúcar',
+        )
+        with tempfile.TemporaryDirectory() as destino:
+            self.assertIn('3 registros anteriores', self.arquivar(destino, '--dry-run'))
+            self.assertEqual(RegistroAtividade.objects.count(), 4)
+            self.assertEqual(os.listdir(destino), [])
+
+            self.arquivar(destino)
+            self.assertEqual(list(RegistroAtividade.objects.values_list('id', flat=True)), [recente.id])
+            janeiro = os.path.join(destino, 'registros_atividade_2020-01.jsonl.gz')
+            self.assertEqual([linha['nome'] for linha in self.ler(janeiro)], ['Farinha', 'Ovo'])
+            fevereiro = self.ler(os.path.join(destino, 'registros_atividade_2020-02.jsonl.gz'))
+            self.assertEqual((fevereiro[0]['nome'], fevereiro[0]['usuario']), ('Sal', 'admin'))
+
+            # Um registro do mesmo mês que aparece depois vai para o fim do arquivo existente
+            atrasado = self.registrar('Fermento', 2020, 1, 20)
+            self.arquivar(destino)
+            linhas = self.ler(janeiro)
+            self.assertEqual([linha['nome'] for linha in linhas], ['Farinha', 'Ovo', 'Fermento'])
+            self.assertEqual(linhas[-1]['id'], atrasado.id)
+            self.assertEqual(len({linha['id'] for linha in linhas}), 3)
+            self.assertEqual(RegistroAtividade.objects.count(), 1)
+            self.assertFalse(any(nome.endswith('.tmp') for nome in os.listdir(destino)))
+
+
+class ExportacaoTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_catalogo()
+        Insumo.objects.bulk_create([
+            Insumo(restaurante=self.restaurante, nome=f'Insumo {n:03d}; "especial"', unidade_medida='g', peso=1000,
+                   preco=Decimal('1.25'))
+            for n in range(300)
+        ])
+
+    def exportar(self, conteudo, formato):
+        # Blocos pequenos para a resposta sair em várias partes
+        with mock.patch.object(planilhas, 'TAMANHO_BLOCO', 1024):
+            resposta = self.client.get(
+                f'/api/restaurantes/{self.restaurante.id}/exportar/?conteudo={conteudo}&formato={formato}'
+            )
+            self.assertEqual(resposta.status_code, 200)
+            self.assertTrue(resposta.streaming)
+            blocos = list(resposta.streaming_content)
+        return resposta, blocos
+
+    def test_csv_lido_pelo_modulo_csv(self):
+        resposta, blocos = self.exportar('insumos', 'csv')
+        self.assertGreater(len(blocos), 2)
+        conteudo = b''.join(blocos)
+        self.assertEqual(resposta['Content-Disposition'], 'attachment; filename="restaurante-insumos.csv"')
+        linhas = list(csv.reader(io.StringIO(conteudo.decode('utf-8-sig')), delimiter=';'))
+        self.assertEqual(linhas[0], ['id', 'nome', 'categoria', 'unidade_medida', 'peso', 'preco'])
+        self.assertEqual(len(linhas), 1 + Insumo.objects.filter(restaurante=self.restaurante).count())
+        self.assertEqual(linhas[1][1:], ['Farinha', '', 'g', '1000,000', '5,00'])
+        self.assertEqual(linhas[2][1], 'Insumo 000; "especial"')
+
+    @skipUnless(openpyxl is not None, 'openpyxl não instalado')
+    def test_xlsx_lido_pelo_openpyxl(self):
+        resposta, blocos = self.exportar('receitas', 'xlsx')
+        self.assertEqual(resposta['Content-Type'], TIPO_XLSX)
+        aba = openpyxl.load_workbook(io.BytesIO(b''.join(blocos)), read_only=True).active
+        linhas = list(aba.iter_rows(values_only=True))
+        self.assertEqual(linhas[0][:2], ('id', 'nome'))
+        self.assertIn('custo_total', linhas[0])
+        custos = {linha[1]: linha[linhas[0].index('custo_total')] for linha in linhas[1:]}
+        self.massa.refresh_from_db()
+        self.assertEqual(custos['Massa'], float(self.massa.custo_total))
+        self.assertEqual(set(custos), {'Massa', 'Torta'})
+
+    def test_xlsx_grande_lido_pelo_importador(self):
+        _, blocos = self.exportar('insumos', 'xlsx')
+        linhas = list(valores_xlsx(io.BytesIO(b''.join(blocos))))
+        self.assertEqual(len(linhas), 1 + Insumo.objects.filter(restaurante=self.restaurante).count())
+        self.assertEqual(linhas[-1][1], 'Ovo')
+
+
+def reescrever_xlsx(conteudo, **partes):
+    """Cópia do pacote XLSX com as partes informadas ({'xl/...': texto}) trocadas ou acrescentadas"""
+    saida = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as origem, zipfile.ZipFile(saida, 'w') as destino:
+        for nome in origem.namelist():
+            destino.writestr(nome, partes.pop(nome, None) or origem.read(nome))
+        for nome, texto in partes.items():
+            destino.writestr(nome, texto)
+    return saida.getvalue()
+
+
+class ImportacaoCatalogoTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_insumo('Farinha', '5.00')
+
+    def importar(self, arquivo, url='/api/receitas/importar/'):
+        return self.client.post(url, {'restaurante': self.restaurante.id, 'arquivo': arquivo}, format='multipart')
+
+    def test_planilha_valida_cria_receitas_e_sub_receitas(self):
+        planilha = (
+            'receita;tempo_preparo;insumo;subreceita;quantidade_utilizada;ic;ipc\n'
+            'Torta;40;;Massa;2;;\n'
+            'Massa;15;Farinha;;500;80;90\n'
+        ).encode('utf-8-sig')
+        resposta = self.importar(SimpleUploadedFile('receitas.csv', planilha))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.json()['gravado'])
+        torta = Receita.objects.get(nome='Torta')
+        self.assertEqual(torta.itens.get().receita_sub.nome, 'Massa')
+        self.assertEqual(torta.custo_total, Decimal(str(round(custo_receita_recursivo(torta), 2))))
+
+    def test_linha_invalida_nao_grava_nada(self):
+        linhas = [
+            {'receita': 'Massa', 'insumo': 'Farinha', 'quantidade_utilizada': '500'},
+            {'receita': 'Pão', 'insumo': 'Fermento', 'quantidade_utilizada': '10'},
+        ]
+        resposta = self.client.post('/api/receitas/importar/', {
+            'restaurante': self.restaurante.id, 'itens': linhas,
+        }, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(resposta.json()['gravado'])
+        self.assertEqual(resposta.json()['erros'], [
+            {'linha': 2, 'erros': ["insumo 'Fermento' não encontrado neste restaurante"]},
+        ])
+        self.assertFalse(Receita.objects.exists())
+
+    def test_tempo_de_preparo_sem_numero_e_erro_da_linha(self):
+        resposta = self.client.post('/api/receitas/importar/', {
+            'restaurante': self.restaurante.id,
+            'itens': [{'receita': 'Massa', 'tempo_preparo': 'R$', 'insumo': 'Farinha', 'quantidade_utilizada': '500'}],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json()['erros'], [{'linha': 1, 'erros': ["tempo_preparo inválido: 'R$'"]}])
+
+    def test_ciclo_na_importacao_e_rejeitado(self):
+        resposta = self.client.post('/api/receitas/importar/', {
+            'restaurante': self.restaurante.id,
+            'itens': [
+                {'receita': 'A', 'subreceita': 'B', 'quantidade_utilizada': '1'},
+                {'receita': 'B', 'subreceita': 'A', 'quantidade_utilizada': '1'},
+            ],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual([erro['linha'] for erro in resposta.json()['erros']], [1, 2])
+        self.assertFalse(Receita.objects.exists())
+
+    def test_falha_ao_gravar_itens_desfaz_as_receitas(self):
+        linhas = [{'receita': 'Massa', 'insumo': 'Farinha', 'quantidade_utilizada': '500'}]
+        with mock.patch.object(ReceitaInsumo.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                importar_receitas(self.restaurante.id, linhas, usuario=self.admin)
+        self.assertFalse(Receita.objects.exists())
+
+    def test_dry_run_so_valida(self):
+        resposta = self.client.post('/api/receitas/importar/?dry_run=1', {
+            'restaurante': self.restaurante.id,
+            'itens': [{'receita': 'Massa', 'insumo': 'Farinha', 'quantidade_utilizada': '500'}],
+        }, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['erros'], [])
+        self.assertFalse(Receita.objects.exists())
+
+    def test_xlsx_exportado_e_importado(self):
+        planilha = b''.join(linhas_xlsx(
+            ['receita', 'tempo_preparo', 'insumo', 'quantidade_utilizada'], [['Massa', 15, 'Farinha', 500]],
+        ))
+        resposta = self.importar(SimpleUploadedFile('receitas.xlsx', planilha))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(Receita.objects.get().tempo_preparo, 15)
+
+    def test_aba_corrompida_retorna_400(self):
+        valida = b''.join(linhas_xlsx(['receita', 'insumo', 'quantidade_utilizada'], [['Massa', 'Farinha', 500]]))
+        # O cabeçalho é lido; o XML quebra na segunda linha
+        truncada = reescrever_xlsx(valida, **{'xl/worksheets/sheet1.xml': (
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            '<row><c t="inlineStr"><is><t>receita</t></is></c></row><row><c t="inlineStr"><is><t>Mas'
+        )})
+        resposta = self.importar(SimpleUploadedFile('receitas.xlsx', truncada))
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('planilha XLSX inválida', resposta.json()['arquivo'])
+        self.assertFalse(Receita.objects.exists())
+
+    def test_texto_compartilhado_inexistente_retorna_400(self):
+        valida = b''.join(linhas_xlsx(['nome', 'preco'], [['Farinha', 6]]))
+        planilha = reescrever_xlsx(valida, **{
+            'xl/worksheets/sheet1.xml': (
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                '<row><c t="s"><v>0</v></c><c t="s"><v>1</v></c></row>'
+                '<row><c t="s"><v>7</v></c><c><v>6</v></c></row>'
+                '</sheetData></worksheet>'
+            ),
+            'xl/sharedStrings.xml': (
+                '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<si><t>nome</t></si><si><t>preco</t></si></sst>'
+            ),
+        })
+        resposta = self.importar(SimpleUploadedFile('precos.xlsx', planilha), url='/api/insumos/importar-precos/')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('planilha XLSX inválida', resposta.json()['arquivo'])
+        self.assertEqual(Insumo.objects.get().preco, Decimal('5.00'))
+
+    def test_csv_fora_de_utf8_retorna_400(self):
+        planilha = 'receita;insumo;quantidade_utilizada\nPão;Farinha;500\n'.encode('latin-1')
+        resposta = self.importar(SimpleUploadedFile('receitas.csv', planilha))
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json()['arquivo'], 'o arquivo CSV deve estar em UTF-8')
+
+
+class RecalculoTests(BaseApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.criar_catalogo()
+
+    def test_alteracoes_de_preco_geram_um_unico_recalculo(self):
+        with mock.patch.object(recalculo, 'recalcular', wraps=recalculo.recalcular) as recalcular:
+            with self.captureOnCommitCallbacks(execute=True), recalculo.coletar_recalculos():
+                self.farinha.preco = Decimal('7.00')
+                self.farinha.save()
+                self.ovo.preco = Decimal('15.00')
+                self.ovo.save()
+                ReceitaInsumo.objects.create(receita=self.massa, insumo=self.farinha, quantidade_utilizada=10)
+        recalcular.assert_called_once()
+        insumos, receitas, _ = recalcular.call_args.args
+        self.assertEqual(insumos, {self.farinha.id, self.ovo.id})
+        self.assertEqual(receitas, {self.massa.id})
+        self.ficha.refresh_from_db()
+        self.assertEqual(self.ficha.custo_total, Decimal(str(custo_ficha_recursivo(self.ficha))))
+
+    def test_requisicao_que_altera_preco_recalcula_uma_vez(self):
+        with mock.patch.object(recalculo, 'recalcular', wraps=recalculo.recalcular) as recalcular:
+            with self.captureOnCommitCallbacks(execute=True):
+                resposta = self.client.patch(f'/api/insumos/{self.ovo.id}/', {'preco': '18.00'}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        recalcular.assert_called_once()
+        for receita in (self.massa, self.torta):
+            receita.refresh_from_db()
+            self.assertEqual(receita.custo_total, Decimal(str(round(custo_receita_recursivo(receita), 2))))
+        self.ficha.refresh_from_db()
+        self.assertEqual(self.ficha.custo_total, Decimal(str(custo_ficha_recursivo(self.ficha))))
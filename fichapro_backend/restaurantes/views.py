@@ -1,11 +1,13 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.text import slugify
 from rest_framework import viewsets
 from .models import Restaurante, Insumo, Receita, ReceitaInsumo, FichaTecnica, FichaTecnicaItem, UsuarioRestaurantePerfil, RegistroAtividade, CategoriaInsumo
-from .serializers import RestauranteSerializer, InsumoSerializer, ReceitaSerializer, ReceitaInsumoSerializer, FichaTecnicaSerializer, FichaTecnicaItemSerializer, UsuarioRestaurantePerfilSerializer, UserSerializer, UserCreateSerializer, UserUpdateSerializer, RegistroAtividadeSerializer, CategoriaInsumoSerializer, HistoricoPrecoInsumoSerializer
+from .serializers import campos_da_requisicao, RestauranteSerializer, InsumoSerializer, ReceitaSerializer, ReceitaInsumoSerializer, FichaTecnicaSerializer, FichaTecnicaItemSerializer, UsuarioRestaurantePerfilSerializer, UserSerializer, UserCreateSerializer, UserUpdateSerializer, RegistroAtividadeSerializer, CategoriaInsumoSerializer, HistoricoPrecoInsumoSerializer
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from django.contrib.auth.models import User
 from rest_framework.decorators import action, api_view, permission_classes
 from django.db import transaction
@@ -13,7 +15,27 @@ from rest_framework import permissions
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth.models import update_last_login
-from django.db.models import Count, Sum, F, Q
+from django.db.models import Count, Max, Sum, F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
+from .cache_catalogo import CacheCatalogoMixin, RespostaCondicionalMixin
+from .composicao import custos_em, explosao_ficha, explosao_lote, usos_do_insumo
+from .exportacao import CONTEUDOS_EXPORTACAO, calcular_pendentes, exportar_catalogo
+from .historico import AGRUPAMENTOS, fechamentos, fim_do_dia, serie_precos
+from .importacao import importar_fichas, importar_precos_insumos, importar_receitas, ler_decimal, ler_planilha
+from .paginacao import CursorPaginacaoObrigatoria
+from .planilhas import TIPO_CSV, TIPO_XLSX, linhas_csv, linhas_xlsx
+from .resumos import ranking_autores, resumos_restaurantes
+from .simulacao import simular
+from .permissoes import get_perfil_usuario_restaurante, is_admin, is_master, is_redator, is_usuario_comum, restaurantes_acessiveis
+
+# Máximo de datas em uma consulta de custo histórico (cinco anos dia a dia)
+LIMITE_DATAS_CUSTO = 1830
+
+# Posições por restaurante no ranking de atividades (?limite=)
+LIMITE_RANKING_PADRAO = 5
+LIMITE_RANKING = 50
 
 # Custom JWT login que atualiza o last_login
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -28,65 +50,112 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
 # Create your views here.
 
-class RestauranteViewSet(viewsets.ModelViewSet):
+class RestauranteViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     queryset = Restaurante.objects.all()
     serializer_class = RestauranteSerializer
     permission_classes = [IsAuthenticated]
+    campo_restaurante = 'id'
+    parametro_restaurante = None
+    escopo_por_acesso = False
 
-    def perform_create(self, serializer):
-        restaurante = serializer.save()
-        # Atualizar registro com usuário e perfil
-        usuario = self.request.user
-        perfil = self.get_user_perfil(usuario, restaurante)
-        atualizar_registro_atividade(
-            usuario=usuario,
-            perfil=perfil,
-            tipo="restaurante",
-            acao="criado",
-            nome=restaurante.nome,
-            descricao=f"Restaurante {restaurante.nome} criado"
-        )
-
-    def perform_update(self, serializer):
-        restaurante = serializer.save()
-        # Atualizar registro com usuário e perfil
-        usuario = self.request.user
-        perfil = self.get_user_perfil(usuario, restaurante)
-        atualizar_registro_atividade(
-            usuario=usuario,
-            perfil=perfil,
-            tipo="restaurante",
-            acao="editado",
-            nome=restaurante.nome,
-            descricao=f"Restaurante {restaurante.nome} editado"
-        )
-
-    def perform_destroy(self, instance):
-        nome = instance.nome
-        usuario = self.request.user
-        perfil = self.get_user_perfil(usuario, instance)
-        instance.delete()
-        # Atualizar registro com usuário e perfil
-        atualizar_registro_atividade(
-            usuario=usuario,
-            perfil=perfil,
-            tipo="restaurante",
-            acao="excluido",
-            nome=nome,
-            descricao=f"Restaurante {nome} excluído"
-        )
-
-    def get_user_perfil(self, usuario, restaurante):
-        """Obtém o perfil do usuário no restaurante"""
-        if is_admin(usuario):
-            return "administrador"
+    @action(detail=True, methods=['get'])
+    def exportar(self, request, pk=None):
+        """Catálogo em planilha, em streaming.
+
+        ?conteudo=insumos|receitas|receitas-itens|fichas|fichas-itens (padrão insumos)
+        e ?formato=csv|xlsx (padrão csv). Custos e valores sugeridos só para
+        administradores e masters.
+        """
+        restaurante = self.get_object()
+        user = request.user
+        if not (is_admin(user) or restaurante.id in restaurantes_acessiveis(user)):
+            raise PermissionDenied('Você não tem acesso a este restaurante.')
+        conteudo = request.query_params.get('conteudo') or 'insumos'
+        if conteudo not in CONTEUDOS_EXPORTACAO:
+            raise ValidationError({'conteudo': f"Use um destes valores: {', '.join(CONTEUDOS_EXPORTACAO)}."})
+        formato = request.query_params.get('formato') or 'csv'
+        if formato not in ('csv', 'xlsx'):
+            raise ValidationError({'formato': 'Use csv ou xlsx.'})
+        custos = is_admin(user) or is_master(user, restaurante.id)
+        if custos and conteudo in ('receitas', 'fichas'):
+            calcular_pendentes(restaurante.id)
+        cabecalho, linhas, titulo = exportar_catalogo(restaurante.id, conteudo, custos)
+        if formato == 'xlsx':
+            resposta = StreamingHttpResponse(linhas_xlsx(cabecalho, linhas, aba=titulo), content_type=TIPO_XLSX)
+        else:
+            resposta = StreamingHttpResponse(linhas_csv(cabecalho, linhas), content_type=TIPO_CSV)
+        nome = slugify(restaurante.nome) or f'restaurante-{restaurante.id}'
+        resposta['Content-Disposition'] = f'attachment; filename="{nome}-{conteudo}.{formato}"'
+        return resposta
+
+    @action(detail=True, methods=['post'])
+    def simular(self, request, pk=None):
+        """Simula novos preços de insumos e/ou fator de correção em todas as fichas, sem gravar nada.
+
+        Corpo: {'insumos': [{'insumo': id, 'preco': x} ou {'insumo': id, 'variacao': %}],
+        'fator_correcao': opcional, 'taxa_ifood': opcional}
+        """
+        restaurante = self.get_object()
+        user = request.user
+        if not (is_admin(user) or is_master(user, restaurante.id)):
+            raise PermissionDenied('Você não tem permissão para ver custos deste restaurante.')
+        dados = request.data if isinstance(request.data, dict) else {}
+        precos, variacoes = {}, {}
+        for numero, item in enumerate(dados.get('insumos') or [], start=1):
+            try:
+                insumo_id = int(item.get('insumo'))
+                if item.get('preco') not in (None, ''):
+                    precos[insumo_id] = ler_decimal(item['preco'], 2)
+                    if precos[insumo_id] < 0:
+                        raise ValueError
+                else:
+                    variacoes[insumo_id] = ler_decimal(item.get('variacao'), 4)
+                    if variacoes[insumo_id] is None or variacoes[insumo_id] <= -100:
+                        raise ValueError
+            except (AttributeError, TypeError, ValueError):
+                raise ValidationError({'insumos': f"Item {numero}: informe o insumo e um preço ou uma variação válida."})
         try:
-            vinculo = UsuarioRestaurantePerfil.objects.get(usuario=usuario, restaurante=restaurante)
-            return vinculo.perfil
-        except UsuarioRestaurantePerfil.DoesNotExist:
-            return None
+            fator_correcao = ler_decimal(dados.get('fator_correcao'), 2)
+            taxa_ifood = ler_decimal(dados.get('taxa_ifood'), 4)
+        except ValueError as e:
+            raise ValidationError({'erro': f"Fator de correção ou taxa do iFood {e}"})
+
+        informados = set(precos) | set(variacoes)
+        encontrados = set(Insumo.objects.filter(restaurante=restaurante, id__in=informados).values_list('id', flat=True))
+        if informados - encontrados:
+            faltando = ', '.join(map(str, sorted(informados - encontrados)))
+            raise ValidationError({'insumos': f"Insumos não encontrados neste restaurante: {faltando}."})
+
+        fichas = simular(restaurante, precos, variacoes, fator_correcao=fator_correcao, taxa_ifood=taxa_ifood)
+        return Response({
+            'restaurante': restaurante.id,
+            'fator_correcao': fator_correcao if fator_correcao is not None else restaurante.fator_correcao,
+            'taxa_ifood': taxa_ifood if taxa_ifood is not None else restaurante.taxa_ifood,
+            'variacao_custo_total': round(sum(ficha['variacao_custo'] for ficha in fichas), 2),
+            'fichas': fichas,
+        })
+
+    @action(detail=True, methods=['get'], url_path='evolucao-custos')
+    def evolucao_custos(self, request, pk=None):
+        """Custo de todas as fichas com os preços vigentes em cada período de ?inicio= a ?fim= (?agrupar=, padrão mes)"""
+        restaurante = self.get_object()
+        user = request.user
+        if not (is_admin(user) or is_master(user, restaurante.id)):
+            raise PermissionDenied('Você não tem permissão para ver custos deste restaurante.')
+        datas = datas_de_custo(request)
+        custos = custos_em([fim_do_dia(data) for data in datas], restaurante_id=restaurante.id)
+        fichas = FichaTecnica.objects.filter(restaurante=restaurante).order_by('nome').values_list('id', 'nome')
+        sem_insumos = [0.0] * len(datas)
+        return Response({
+            'restaurante': restaurante.id,
+            'datas': datas,
+            'fichas': [
+                {'ficha': ficha_id, 'nome': nome, 'custos': custos.get(ficha_id, sem_insumos)}
+                for ficha_id, nome in fichas
+            ],
+        })
 
-class InsumoViewSet(viewsets.ModelViewSet):
+class InsumoViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     queryset = Insumo.objects.all()
     serializer_class = InsumoSerializer
     permission_classes = [IsAuthenticated]
@@ -102,8 +171,7 @@ class InsumoViewSet(viewsets.ModelViewSet):
         if is_admin(user):
             return qs
         # Para usuários não-admin, buscar todos os restaurantes que eles têm acesso
-        vinculos = UsuarioRestaurantePerfil.objects.filter(usuario=user)
-        restaurante_ids = [v.restaurante_id for v in vinculos if v.perfil in ['master', 'redator', 'usuario_comum']]
+        restaurante_ids = restaurantes_acessiveis(user)
         if restaurante_ids:
             return qs.filter(restaurante_id__in=restaurante_ids)
         return qs.none()
@@ -130,15 +198,81 @@ class InsumoViewSet(viewsets.ModelViewSet):
             raise PermissionDenied('Você não tem permissão para excluir insumos.')
         return super().destroy(request, *args, **kwargs)
 
+    @action(detail=False, methods=['post'], url_path='importar-precos')
+    def importar_precos(self, request):
+        """Importa preços de insumos em lote a partir de um CSV/XLSX ('arquivo') ou de uma lista JSON ('itens')"""
+        user = request.user
+        dados = request.data if isinstance(request.data, dict) else {'itens': request.data}
+        restaurante_id = dados.get('restaurante') or request.query_params.get('restaurante')
+        if not restaurante_id:
+            return Response({'erro': 'Informe o restaurante.'}, status=400)
+        if not (is_admin(user) or is_master(user, restaurante_id) or is_redator(user, restaurante_id)):
+            raise PermissionDenied('Você não tem permissão para editar insumos.')
+        linhas = linhas_enviadas(request, dados)
+        if linhas is None:
+            return Response({'erro': 'Envie um arquivo CSV/XLSX ou uma lista de itens.'}, status=400)
+        perfil = 'administrador' if is_admin(user) else get_perfil_usuario_restaurante(user, restaurante_id)
+        try:
+            relatorio = importar_precos_insumos(restaurante_id, linhas, usuario=user, perfil=perfil)
+        except ValueError as e:
+            # Arquivo corrompido percebido só durante a leitura, antes de gravar qualquer coisa
+            raise ValidationError({'arquivo': str(e)})
+        return Response(relatorio)
+
+    def _parametros_serie(self, request):
+        """Lê ?inicio=, ?fim= (AAAA-MM-DD, fim inclusivo) e ?agrupar=dia|semana|mes"""
+        inicio = request.query_params.get('inicio')
+        fim = request.query_params.get('fim')
+        agrupar = request.query_params.get('agrupar') or None
+        if agrupar is not None and agrupar not in AGRUPAMENTOS:
+            raise ValidationError({'agrupar': f"Use um destes valores: {', '.join(sorted(AGRUPAMENTOS))}."})
+        return {
+            'inicio': inicio_do_dia(inicio, 'inicio') if inicio else None,
+            'fim': inicio_do_dia(fim, 'fim') + timedelta(days=1) if fim else None,
+            'agrupar': agrupar,
+        }
+
     @action(detail=True, methods=['get'])
     def historico_preco(self, request, pk=None):
+        """Histórico de preços do insumo; aceita ?inicio=, ?fim= e ?agrupar=dia|semana|mes"""
         insumo = self.get_object()
-        historico = insumo.historico_precos.order_by('data')
+        parametros = self._parametros_serie(request)
+        if parametros['agrupar']:
+            return Response(serie_precos([insumo.id], **parametros)[insumo.id])
+        historico = insumo.historico_precos.order_by('data', 'id')
+        if parametros['inicio']:
+            historico = historico.filter(data__gte=parametros['inicio'])
+        if parametros['fim']:
+            historico = historico.filter(data__lt=parametros['fim'])
         serializer = HistoricoPrecoInsumoSerializer(historico, many=True)
         return Response(serializer.data)
 
-class ReceitaViewSet(viewsets.ModelViewSet):
-    queryset = Receita.objects.all().prefetch_related('itens__insumo', 'itens__receita', 'itens')
+    @action(detail=False, methods=['get'], url_path='historico-precos')
+    def historico_precos(self, request):
+        """Séries de preço de vários insumos: ?insumos=1,2,3 com os mesmos filtros de historico_preco"""
+        try:
+            ids = {int(valor) for valor in request.query_params.get('insumos', '').split(',') if valor.strip()}
+        except ValueError:
+            raise ValidationError({'insumos': 'Informe os ids separados por vírgula.'})
+        if not ids:
+            raise ValidationError({'insumos': 'Informe ao menos um insumo.'})
+        nomes = dict(self.get_queryset().filter(id__in=ids).values_list('id', 'nome'))
+        series = serie_precos(list(nomes), **self._parametros_serie(request))
+        return Response({
+            'series': [
+                {'insumo': insumo_id, 'nome': nomes[insumo_id], 'pontos': pontos}
+                for insumo_id, pontos in series.items()
+            ]
+        })
+
+    @action(detail=True, methods=['get'], url_path='onde-usado')
+    def onde_usado(self, request, pk=None):
+        """Receitas e fichas que usam o insumo, diretamente ou por sub-receitas"""
+        insumo = self.get_object()
+        return Response({'insumo': insumo.id, 'nome': insumo.nome, **usos_do_insumo(insumo.id)})
+
+class ReceitaViewSet(CacheCatalogoMixin, viewsets.ModelViewSet):
+    queryset = Receita.objects.all().prefetch_related('itens__insumo', 'itens__receita_sub')
     serializer_class = ReceitaSerializer
     permission_classes = [IsAuthenticated]
 
@@ -152,14 +286,16 @@ class ReceitaViewSet(viewsets.ModelViewSet):
         restaurante_id = self.request.query_params.get('restaurante')
         if restaurante_id:
             qs = qs.filter(restaurante_id=restaurante_id)
+        campos = campos_da_requisicao(self.request)
+        if campos is not None and 'itens' not in campos:
+            qs = qs.prefetch_related(None)
         user = self.request.user
         if not user or not hasattr(user, 'is_authenticated') or not user.is_authenticated:
             return qs.none()
         if is_admin(user):
             return qs
         # Para usuários não-admin, buscar todos os restaurantes que eles têm acesso
-        vinculos = UsuarioRestaurantePerfil.objects.filter(usuario=user)
-        restaurante_ids = [v.restaurante_id for v in vinculos if v.perfil in ['master', 'redator', 'usuario_comum']]
+        restaurante_ids = restaurantes_acessiveis(user)
         if restaurante_ids:
             return qs.filter(restaurante_id__in=restaurante_ids)
         return qs.none()
@@ -201,13 +337,21 @@ class ReceitaViewSet(viewsets.ModelViewSet):
             raise PermissionDenied('Você não tem permissão para excluir receitas.')
         return super().destroy(request, *args, **kwargs)
 
-class ReceitaInsumoViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def importar(self, request):
+        """Cria receitas com seus itens a partir de uma planilha ('arquivo') ou lista JSON ('itens'); ?dry_run=1 só valida"""
+        return importar_catalogo(request, importar_receitas, 'Você não tem permissão para criar receitas.')
+
+class ReceitaInsumoViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     queryset = ReceitaInsumo.objects.all()
     serializer_class = ReceitaInsumoSerializer
     permission_classes = [IsAuthenticated]
+    campo_restaurante = 'receita__restaurante_id'
+    parametro_restaurante = None
+    escopo_por_acesso = False
 
-class FichaTecnicaViewSet(viewsets.ModelViewSet):
-    queryset = FichaTecnica.objects.all()
+class FichaTecnicaViewSet(CacheCatalogoMixin, viewsets.ModelViewSet):
+    queryset = FichaTecnica.objects.all().prefetch_related('itens__insumo', 'itens__receita')
     serializer_class = FichaTecnicaSerializer
     permission_classes = [IsAuthenticated]
 
@@ -221,14 +365,16 @@ class FichaTecnicaViewSet(viewsets.ModelViewSet):
         restaurante_id = self.request.query_params.get('restaurante')
         if restaurante_id:
             qs = qs.filter(restaurante_id=restaurante_id)
+        campos = campos_da_requisicao(self.request)
+        if (campos is not None and 'itens' not in campos) or self.action in ('explosao', 'custo_em'):
+            qs = qs.prefetch_related(None)
         user = self.request.user
         if not user or not hasattr(user, 'is_authenticated') or not user.is_authenticated:
             return qs.none()
         if is_admin(user):
             return qs
         # Para usuários não-admin, buscar todos os restaurantes que eles têm acesso
-        vinculos = UsuarioRestaurantePerfil.objects.filter(usuario=user)
-        restaurante_ids = [v.restaurante_id for v in vinculos if v.perfil in ['master', 'redator', 'usuario_comum']]
+        restaurante_ids = restaurantes_acessiveis(user)
         if restaurante_ids:
             return qs.filter(restaurante_id__in=restaurante_ids)
         return qs.none()
@@ -246,6 +392,78 @@ class FichaTecnicaViewSet(viewsets.ModelViewSet):
         from rest_framework import exceptions
         raise exceptions.PermissionDenied('Você não tem permissão para acessar esta ficha técnica.')
 
+    @action(detail=True, methods=['get'])
+    def explosao(self, request, pk=None):
+        """Insumos brutos da ficha inteira, com sub-receitas expandidas e IC/IPC aplicados"""
+        ficha = self.get_object()
+        user = request.user
+        mostrar_custo = is_admin(user) or is_master(user, ficha.restaurante_id)
+        return Response({
+            'ficha': ficha.id,
+            'nome': ficha.nome,
+            'rendimento': ficha.rendimento,
+            'insumos': explosao_ficha(ficha.id, mostrar_custo=mostrar_custo),
+        })
+
+    @action(detail=True, methods=['get'], url_path='custo-em')
+    def custo_em(self, request, pk=None):
+        """Custo da ficha com os preços de insumos vigentes em ?data= ou em cada período de ?inicio= a ?fim="""
+        ficha = self.get_object()
+        user = request.user
+        if not (is_admin(user) or is_master(user, ficha.restaurante_id)):
+            raise PermissionDenied('Você não tem permissão para ver custos desta ficha técnica.')
+        datas = datas_de_custo(request)
+        custos = custos_em([fim_do_dia(data) for data in datas], ficha_ids=[ficha.id])[ficha.id]
+        resposta = {'ficha': ficha.id, 'nome': ficha.nome, 'custo_atual': ficha.custo_total}
+        if 'data' in request.query_params:
+            resposta.update(data=datas[0], custo_total=custos[0])
+        else:
+            resposta['custos'] = [{'data': data, 'custo_total': custo} for data, custo in zip(datas, custos)]
+        return Response(resposta)
+
+    @action(detail=False, methods=['post'])
+    def importar(self, request):
+        """Cria fichas com seus itens a partir de uma planilha ('arquivo') ou lista JSON ('itens'); ?dry_run=1 só valida"""
+        return importar_catalogo(request, importar_fichas, 'Você não tem permissão para criar fichas técnicas.')
+
+    @action(detail=False, methods=['post'], url_path='explosao-lote')
+    def explosao_lote(self, request):
+        """Soma os insumos brutos para produzir várias fichas: [{'ficha': id, 'quantidade': n}, ...]"""
+        user = request.user
+        itens = request.data.get('itens') if isinstance(request.data, dict) else request.data
+        if not isinstance(itens, list) or not itens:
+            return Response({'erro': "Envie uma lista de itens com 'ficha' e 'quantidade'."}, status=400)
+        quantidades = {}
+        for numero, item in enumerate(itens, start=1):
+            try:
+                ficha_id = int(item.get('ficha'))
+                quantidade = ler_decimal(item.get('quantidade', 1), 3)
+            except (AttributeError, TypeError, ValueError):
+                raise ValidationError({'itens': f"Item {numero}: ficha ou quantidade inválida."})
+            if quantidade is None or quantidade <= 0:
+                raise ValidationError({'itens': f"Item {numero}: a quantidade deve ser maior que zero."})
+            quantidades[ficha_id] = quantidades.get(ficha_id, 0) + quantidade
+
+        fichas = {
+            ficha_id: (nome, restaurante_id)
+            for ficha_id, nome, restaurante_id in self.get_queryset().prefetch_related(None).filter(
+                id__in=list(quantidades)
+            ).values_list('id', 'nome', 'restaurante_id')
+        }
+        faltando = sorted(set(quantidades) - set(fichas))
+        if faltando:
+            raise ValidationError({'itens': f"Fichas não encontradas: {', '.join(map(str, faltando))}."})
+        mostrar_custo = is_admin(user) or all(
+            is_master(user, restaurante_id) for restaurante_id in {rid for _, rid in fichas.values()}
+        )
+        return Response({
+            'fichas': [
+                {'ficha': ficha_id, 'nome': fichas[ficha_id][0], 'quantidade': quantidade}
+                for ficha_id, quantidade in quantidades.items()
+            ],
+            'insumos': explosao_lote(quantidades, mostrar_custo=mostrar_custo),
+        })
+
     def create(self, request, *args, **kwargs):
         user = request.user
         restaurante_id = request.data.get('restaurante')
@@ -274,10 +492,12 @@ class FichaTecnicaViewSet(viewsets.ModelViewSet):
             raise PermissionDenied('Você não tem permissão para excluir fichas técnicas.')
         return super().destroy(request, *args, **kwargs)
 
-class FichaTecnicaItemViewSet(viewsets.ModelViewSet):
+class FichaTecnicaItemViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     queryset = FichaTecnicaItem.objects.all()
     serializer_class = FichaTecnicaItemSerializer
     permission_classes = [IsAuthenticated]
+    campo_restaurante = 'ficha__restaurante_id'
+    parametro_restaurante = None
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -294,8 +514,7 @@ class FichaTecnicaItemViewSet(viewsets.ModelViewSet):
             return qs
         
         # Para usuários não-admin, filtrar por restaurantes que eles têm acesso
-        vinculos = UsuarioRestaurantePerfil.objects.filter(usuario=user)
-        restaurante_ids = [v.restaurante_id for v in vinculos if v.perfil in ['master', 'redator', 'usuario_comum']]
+        restaurante_ids = restaurantes_acessiveis(user)
         if restaurante_ids:
             return qs.filter(ficha__restaurante_id__in=restaurante_ids)
         
@@ -375,28 +594,76 @@ class MeView(APIView):
             'date_joined': user.date_joined
         })
 
-def get_perfil_usuario_restaurante(user, restaurante_id):
-    if not user or not hasattr(user, 'is_authenticated') or not user.is_authenticated:
-        return None
+def ler_data(valor, parametro):
+    """Converte um parâmetro 'AAAA-MM-DD' em date"""
     try:
-        vinculo = UsuarioRestaurantePerfil.objects.get(usuario=user, restaurante_id=restaurante_id)
-        return vinculo.perfil
-    except UsuarioRestaurantePerfil.DoesNotExist:
-        return None
-
-def is_admin(user):
-    return user.is_superuser or user.is_staff
-
-def is_master(user, restaurante_id):
-    return get_perfil_usuario_restaurante(user, restaurante_id) == 'master'
-
-def is_redator(user, restaurante_id):
-    return get_perfil_usuario_restaurante(user, restaurante_id) == 'redator'
-
-def is_usuario_comum(user, restaurante_id):
-    return get_perfil_usuario_restaurante(user, restaurante_id) == 'usuario_comum'
+        data = parse_date(valor)
+    except ValueError:
+        data = None
+    if data is None:
+        raise ValidationError({parametro: 'Data inválida, use o formato AAAA-MM-DD.'})
+    return data
+
+def inicio_do_dia(valor, parametro):
+    """Converte um parâmetro 'AAAA-MM-DD' no início do dia, no fuso horário atual"""
+    return timezone.make_aware(datetime.combine(ler_data(valor, parametro), time.min))
+
+def datas_de_custo(request):
+    """Datas pedidas para custos históricos: ?data= ou ?inicio=&fim=&agrupar=dia|semana|mes (padrão mes)"""
+    params = request.query_params
+    if params.get('data'):
+        return [ler_data(params['data'], 'data')]
+    if not params.get('inicio') or not params.get('fim'):
+        raise ValidationError({'data': 'Informe ?data= ou o intervalo ?inicio= e ?fim=.'})
+    inicio, fim = ler_data(params['inicio'], 'inicio'), ler_data(params['fim'], 'fim')
+    agrupar = params.get('agrupar') or 'mes'
+    if agrupar not in AGRUPAMENTOS:
+        raise ValidationError({'agrupar': f"Use um destes valores: {', '.join(sorted(AGRUPAMENTOS))}."})
+    if fim < inicio:
+        raise ValidationError({'fim': 'O fim deve ser igual ou posterior ao início.'})
+    datas = fechamentos(inicio, fim, agrupar)
+    if len(datas) > LIMITE_DATAS_CUSTO:
+        raise ValidationError({'agrupar': f"Intervalo com mais de {LIMITE_DATAS_CUSTO} pontos; use um agrupamento maior."})
+    return datas
+
+def linhas_enviadas(request, dados):
+    """Linhas de uma planilha CSV/XLSX enviada em 'arquivo' ou de uma lista JSON em 'itens'; None se não houver"""
+    arquivo = request.FILES.get('arquivo')
+    if arquivo:
+        try:
+            return ler_planilha(arquivo)
+        except ValueError as e:
+            raise ValidationError({'arquivo': str(e)})
+    if isinstance(dados.get('itens'), list):
+        return [linha if isinstance(linha, dict) else {} for linha in dados['itens']]
+    return None
+
+def importar_catalogo(request, importar, permissao_negada):
+    """Importação de receitas ou fichas completas: valida e, sem ?dry_run=1 e sem erros, grava tudo de uma vez"""
+    user = request.user
+    dados = request.data if isinstance(request.data, dict) else {'itens': request.data}
+    restaurante_id = dados.get('restaurante') or request.query_params.get('restaurante')
+    try:
+        restaurante_id = int(restaurante_id)
+    except (TypeError, ValueError):
+        return Response({'erro': 'Informe o restaurante.'}, status=400)
+    if not (is_admin(user) or is_master(user, restaurante_id) or is_redator(user, restaurante_id)):
+        raise PermissionDenied(permissao_negada)
+    if not Restaurante.objects.filter(pk=restaurante_id).exists():
+        return Response({'erro': 'Restaurante não encontrado.'}, status=404)
+    linhas = linhas_enviadas(request, dados)
+    if linhas is None:
+        return Response({'erro': 'Envie um arquivo CSV/XLSX ou uma lista de itens.'}, status=400)
+    dry_run = str(dados.get('dry_run') or request.query_params.get('dry_run') or '').lower() in ('1', 'true')
+    perfil = 'administrador' if is_admin(user) else get_perfil_usuario_restaurante(user, restaurante_id)
+    try:
+        relatorio = importar(restaurante_id, linhas, usuario=user, perfil=perfil, gravar=not dry_run)
+    except ValueError as e:
+        # Arquivo corrompido percebido só durante a leitura, antes de gravar qualquer coisa
+        raise ValidationError({'arquivo': str(e)})
+    return Response(relatorio, status=400 if relatorio['erros'] and not dry_run else 200)
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
@@ -406,6 +673,10 @@ class UserViewSet(viewsets.ModelViewSet):
             return UserUpdateSerializer
         return UserSerializer
 
+    def estado_da_resposta(self, request, pk):
+        # Usuários não têm versão; o ETag é calculado sobre a resposta
+        return None
+
 class UserCreateView(APIView):
     permission_classes = [IsAdminUser]
     def post(self, request):
@@ -415,9 +686,19 @@ class UserCreateView(APIView):
             return Response(UserSerializer(user).data, status=201)
         return Response(serializer.errors, status=400)
 
-class RegistroAtividadeViewSet(viewsets.ReadOnlyModelViewSet):
+class RegistroAtividadeViewSet(RespostaCondicionalMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = RegistroAtividadeSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CursorPaginacaoObrigatoria
+
+    def estado_da_resposta(self, request, pk):
+        # Registros nunca são editados, só incluídos ou excluídos: maior id e total identificam o conteúdo
+        qs = self.get_queryset() if pk is None else RegistroAtividade.objects.filter(pk=pk)
+        try:
+            resumo = qs.order_by().aggregate(ultimo=Max('id'), total=Count('id'))
+        except (TypeError, ValueError):
+            return None
+        return (resumo['ultimo'], resumo['total']), None
 
     def get_queryset(self):
         queryset = RegistroAtividade.objects.all().order_by('-data_hora')
@@ -432,68 +713,103 @@ class RegistroAtividadeViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(tipo=tipo)
         if acao:
             queryset = queryset.filter(acao=acao)
+        # Intervalo sobre data_hora (e não data_hora__date) para usar os índices
         if data_inicio:
-            queryset = queryset.filter(data_hora__date__gte=data_inicio)
+            queryset = queryset.filter(data_hora__gte=inicio_do_dia(data_inicio, 'data_inicio'))
         if data_fim:
-            queryset = queryset.filter(data_hora__date__lte=data_fim)
+            queryset = queryset.filter(data_hora__lt=inicio_do_dia(data_fim, 'data_fim') + timedelta(days=1))
             
         return queryset
 
-# Função para atualizar registro de atividade com usuário e perfil
-def atualizar_registro_atividade(usuario, perfil, tipo, acao, nome, descricao=""):
-    """Atualiza o último registro de atividade com informações do usuário"""
-    try:
-        from .models import RegistroAtividade
-        ultimo_registro = RegistroAtividade.objects.filter(
-            tipo=tipo,
-            acao=acao,
-            nome=nome
-        ).order_by('-data_hora').first()
-        
-        if ultimo_registro:
-            ultimo_registro.usuario = usuario
-            ultimo_registro.perfil = perfil
-            ultimo_registro.save()
-    except Exception as e:
-        print(f"Erro ao atualizar registro de atividade: {e}")
+    @action(detail=False, methods=['get'])
+    def ranking(self, request):
+        """Usuários mais ativos de cada restaurante (?data_inicio=, ?data_fim=, ?restaurante=, ?usuario=, ?limite=)"""
+        params = request.query_params
+        try:
+            limite = int(params.get('limite') or LIMITE_RANKING_PADRAO)
+        except ValueError:
+            limite = 0
+        if not 1 <= limite <= LIMITE_RANKING:
+            raise ValidationError({'limite': f"Informe um número entre 1 e {LIMITE_RANKING}."})
+        inicio = inicio_do_dia(params['data_inicio'], 'data_inicio') if params.get('data_inicio') else None
+        fim = (
+            inicio_do_dia(params['data_fim'], 'data_fim') + timedelta(days=1) if params.get('data_fim') else None
+        )
+        user = request.user
+        restaurante_ids = None if is_admin(user) else restaurantes_acessiveis(user)
+        if params.get('restaurante'):
+            try:
+                restaurante = int(params['restaurante'])
+            except ValueError:
+                raise ValidationError({'restaurante': 'Informe o id do restaurante.'})
+            if restaurante_ids is not None and restaurante not in restaurante_ids:
+                raise PermissionDenied('Você não tem acesso a este restaurante.')
+            restaurante_ids = [restaurante]
+        usuario_id = params.get('usuario')
+        if usuario_id is not None and not usuario_id.isdigit():
+            raise ValidationError({'usuario': 'Informe o id do usuário.'})
+
+        ranking = ranking_autores(inicio, fim, restaurante_ids, int(usuario_id) if usuario_id else None, limite)
+        nomes = dict(Restaurante.objects.filter(id__in=ranking).values_list('id', 'nome'))
+        usuarios = {
+            usuario['id']: usuario
+            for usuario in User.objects.filter(
+                id__in={linha['usuario_id'] for linhas in ranking.values() for linha in linhas}
+            ).values('id', 'username', 'first_name', 'last_name')
+        }
+        restaurantes = []
+        for restaurante_id, linhas in sorted(ranking.items(), key=lambda item: nomes.get(item[0], '')):
+            for linha in linhas:
+                usuario = usuarios[linha['usuario_id']]
+                linha['username'] = usuario['username']
+                linha['nome'] = f"{usuario['first_name']} {usuario['last_name']}".strip() or usuario['username']
+            restaurantes.append({'id': restaurante_id, 'nome': nomes.get(restaurante_id), 'ranking': linhas})
+        return Response({'data_inicio': params.get('data_inicio'), 'data_fim': params.get('data_fim'),
+                         'limite': limite, 'restaurantes': restaurantes})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_admin(request):
-    # Total de restaurantes
-    total_restaurantes = Restaurante.objects.count()
+    # Lê os resumos materializados (recalculados antes, se o catálogo mudou)
+    resumos = list(resumos_restaurantes())
+    total_restaurantes = len(resumos)
 
     # Ranking de restaurantes (por número de receitas + fichas técnicas)
-    restaurantes = Restaurante.objects.annotate(
-        total_registros=Count('receitas', distinct=True) + Count('fichas_tecnicas', distinct=True)
-    ).order_by('-total_registros')[:10]
     ranking_restaurantes = [
         {
-            'nome': r.nome,
-            'registros': r.total_registros
-        } for r in restaurantes
+            'id': resumo.restaurante_id,
+            'nome': resumo.restaurante.nome,
+            'registros': resumo.total_receitas + resumo.total_fichas,
+            'receitas': resumo.total_receitas,
+            'fichas': resumo.total_fichas,
+        }
+        for resumo in sorted(resumos, key=lambda r: (-(r.total_receitas + r.total_fichas), r.restaurante_id))[:10]
     ]
 
-    # Ranking de redatores (por criações/edições)
-    redatores = User.objects.filter(
-        vinculos__perfil='redator'
-    ).distinct()
+    # Ranking de redatores (por criações/edições no registro de atividades)
+    redatores = User.objects.filter(vinculos__perfil='redator').distinct().values(
+        'id', 'username', 'first_name', 'last_name', 'resumo_atividades__criados', 'resumo_atividades__editados',
+        'resumo_atividades__excluidos',
+    )
     ranking_redatores = []
-    for user in redatores:
-        # Não é possível contar por 'criado_por', então apenas adicionar o usuário ao ranking com 0
+    for redator in redatores:
+        criados = redator['resumo_atividades__criados'] or 0
+        editados = redator['resumo_atividades__editados'] or 0
         ranking_redatores.append({
-            'id': user.id,
-            'username': user.username,
-            'total_criados': 0
+            'id': redator['id'],
+            'username': redator['username'],
+            'nome': f"{redator['first_name']} {redator['last_name']}".strip() or redator['username'],
+            'criados': criados,
+            'editados': editados,
+            'excluidos': redator['resumo_atividades__excluidos'] or 0,
+            'pontuacao': criados + editados,
+            'total_criados': criados,
         })
+    ranking_redatores.sort(key=lambda r: (-r['pontuacao'], r['username']))
 
-    # Maiores custos (top 5 receitas/fichas técnicas)
-    maiores_custos_receitas = Receita.objects.order_by('-custo_total')[:5]
-    maiores_custos_fichas = FichaTecnica.objects.order_by('-custo_total')[:5]
+    # Maiores custos (top 5 receitas/fichas técnicas entre os mais caros de cada restaurante)
     maiores_custos = [
-        {'nome': r.nome, 'custo_total': r.custo_total} for r in maiores_custos_receitas
-    ] + [
-        {'nome': f.nome, 'custo_total': f.custo_total} for f in maiores_custos_fichas
+        dict(item, restaurante=resumo.restaurante.nome) for resumo in resumos for item in resumo.maiores_custos
     ]
     maiores_custos = sorted(maiores_custos, key=lambda x: x['custo_total'], reverse=True)[:5]
 
@@ -504,7 +820,7 @@ def dashboard_admin(request):
         'maiores_custos': maiores_custos
     })
 
-class CategoriaInsumoViewSet(viewsets.ModelViewSet):
+class CategoriaInsumoViewSet(RespostaCondicionalMixin, viewsets.ModelViewSet):
     queryset = CategoriaInsumo.objects.all()
     serializer_class = CategoriaInsumoSerializer
     permission_classes = [IsAuthenticated]
@@ -520,8 +836,7 @@ class CategoriaInsumoViewSet(viewsets.ModelViewSet):
         if is_admin(user):
             return qs
         # Para usuários não-admin, buscar todos os restaurantes que eles têm acesso
-        vinculos = UsuarioRestaurantePerfil.objects.filter(usuario=user)
-        restaurante_ids = [v.restaurante_id for v in vinculos if v.perfil in ['master', 'redator', 'usuario_comum']]
+        restaurante_ids = restaurantes_acessiveis(user)
         if restaurante_ids:
             return qs.filter(restaurante_id__in=restaurante_ids)
         return qs.none()